@@ -4,6 +4,7 @@ from jose import JWTError, jwt
 import os
 
 from core.config import get_settings
+from utils.rate_limiter import set_current_user
 
 # Configuration
 SECRET_KEY = get_settings().secret_key
@@ -44,6 +45,8 @@ async def authenticate_jwt(
     
     try:
         decoded = verify_token(token)
+        # fair-share key for the upstream model API governor
+        set_current_user(decoded.get("id"))
         return decoded  
     except Exception:
         raise HTTPException(
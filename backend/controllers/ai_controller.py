@@ -1,12 +1,26 @@
+from typing import Optional
+from pydantic import BaseModel
+from core.config import get_settings
 from services.ai_service import AIService
-from schemas.ai_schema import AnalyzeBody, DragPlaceBody, EditLassoReq, GenerateAllSmartBody, MaskFromGreenBody, PreviewMaskBody, Stage1Body, Stage2Body, Stage3Body
-from fastapi import HTTPException, status
+from services.ai_job_service import AIJobService, JobQueueFullError
+from utils.cpu_executor import ExecutorSaturatedError
+from utils.image_store import ImageNotFoundError, ImageTooLargeError
+from utils.rate_limiter import UpstreamBusyError
+from schemas.ai_schema import AnalyzeBody, DragPlaceBody, EditLassoReq, GenerateAllSmartBody, ImageHandleResponse, ImageUploadB64Body, MaskFromGreenBody, PreviewMaskBody, Stage1Body, Stage2Body, Stage3Body
+from schemas.ai_job_schema import JobResponse, JobSubmitResponse
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
 
 class AIController:
     @staticmethod
     async def analyze_inputs(body: AnalyzeBody):
         try:
             return await AIService.analyze_inputs(body)
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -17,6 +31,16 @@ class AIController:
     async def stage1(body: Stage1Body):
         try:
             return await AIService.stage1(body)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -27,6 +51,16 @@ class AIController:
     async def stage2(body: Stage2Body):
         try:
             return await AIService.stage2(body)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -37,6 +71,16 @@ class AIController:
     async def stage3(body: Stage3Body):
         try:
             return await AIService.stage3(body)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -47,6 +91,21 @@ class AIController:
     async def generate_all_smart(body: GenerateAllSmartBody):
         try:
             return await AIService.generate_all_smart(body)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -57,6 +116,21 @@ class AIController:
     async def drag_place_plant(body: DragPlaceBody):
         try:
             return await AIService.drag_place_plant(body)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -82,6 +156,11 @@ class AIController:
     async def preview_mask(body: PreviewMaskBody):
         try:
             return await AIService.preview_mask(body)
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -92,19 +171,240 @@ class AIController:
     async def mask_from_green(body: MaskFromGreenBody):
         try:
             return await AIService.mask_from_green(body)
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error generating masks from green overlay: {str(e)}"
             )
             
+    @staticmethod
+    async def _read_upload(file: UploadFile, max_bytes: int) -> bytes:
+        """Read in chunks and stop as soon as the limit is passed, instead of buffering it all first."""
+        if file.size is not None and file.size > max_bytes:
+            raise ImageTooLargeError("Image too large")
+        chunks, total = [], 0
+        while chunk := await file.read(1024 * 1024):
+            total += len(chunk)
+            if total > max_bytes:
+                raise ImageTooLargeError("Image too large")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    @staticmethod
+    async def upload_image(file: UploadFile) -> ImageHandleResponse:
+        try:
+            raw = await AIController._read_upload(file, get_settings().image_upload_max_bytes)
+            return await AIService.upload_image(raw)
+        except ImageTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error uploading image: {str(e)}"
+            )
+
+    @staticmethod
+    async def upload_image_b64(body: ImageUploadB64Body) -> ImageHandleResponse:
+        try:
+            return await AIService.upload_image_b64(body)
+        except ImageTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error uploading image: {str(e)}"
+            )
+
+    @staticmethod
+    async def image_exists(sha256: str):
+        try:
+            exists = await AIService.image_exists(sha256)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error checking image: {str(e)}"
+            )
+        if not exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Image not found"
+            )
+        return {"ok": True, "handle": f"img:{sha256}"}
+
+    @staticmethod
+    async def get_image_file(sha256: str):
+        try:
+            return await AIService.get_image_file(sha256)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error retrieving image: {str(e)}"
+            )
+
+    @staticmethod
+    async def upstream_stats():
+        try:
+            return await AIService.upstream_stats()
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error reading upstream stats: {str(e)}"
+            )
+
+    @staticmethod
+    async def prompt_stats():
+        try:
+            return await AIService.prompt_stats()
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error reading prompt stats: {str(e)}"
+            )
+
+    @staticmethod
+    async def cache_stats():
+        try:
+            return await AIService.cache_stats()
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error reading cache stats: {str(e)}"
+            )
+
     @staticmethod
     async def edit_lasso(body:EditLassoReq):
         try:
             return await AIService.edit_lasso(body)
+        except ImageNotFoundError as e:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        except ExecutorSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error in lasso edit: {str(e)}"
             )
-            
+
+    @staticmethod
+    async def submit_job(kind: str, body: BaseModel, current_user: dict, webhook_url: Optional[str] = None) -> JobSubmitResponse:
+        try:
+            job = await AIJobService.submit(kind, body, current_user["id"], webhook_url)
+            return JobSubmitResponse(
+                job_id=str(job.id),
+                status=job.status,
+                status_url=f"/ai/jobs/{job.id}",
+                events_url=f"/ai/jobs/{job.id}/events",
+            )
+        except JobQueueFullError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error submitting job: {str(e)}"
+            )
+
+    @staticmethod
+    async def get_job(job_id: str, current_user: dict) -> JobResponse:
+        try:
+            job = await AIJobService.get_job(job_id, current_user["id"])
+            if not job:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Job not found"
+                )
+            return JobResponse(
+                id=str(job.id),
+                kind=job.kind,
+                status=job.status,
+                events=job.events,
+                result=job.result,
+                error=job.error,
+                created_at=job.created_at,
+                updated_at=job.updated_at,
+                started_at=job.started_at,
+                finished_at=job.finished_at,
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error fetching job: {str(e)}"
+            )
+
+    @staticmethod
+    async def job_events(job_id: str, current_user: dict) -> StreamingResponse:
+        try:
+            job = await AIJobService.get_job(job_id, current_user["id"])
+            if not job:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Job not found"
+                )
+            return StreamingResponse(
+                AIJobService.stream_events(job_id),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error streaming job events: {str(e)}"
+            )
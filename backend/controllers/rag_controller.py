@@ -1,6 +1,7 @@
 from typing import Optional, Dict, Any
 import logging
 from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
 
 from services.RAG_service import (
     search_plants as service_search_plants,
@@ -12,6 +13,7 @@ from services.RAG_service import (
     DATA_PATH,
 )
 from core.config import get_settings
+from utils.rate_limiter import UpstreamBusyError
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -51,7 +53,9 @@ class RAGController:
                 )
             
             # Use service to search
-            plants = service_search_plants(
+            # Blocking LLM call (and governor wait) runs off the event loop
+            plants = await run_in_threadpool(
+                service_search_plants,
                 query=query.strip(),
                 max_results=max_results
             )
@@ -66,6 +70,11 @@ class RAGController:
             
         except HTTPException:
             raise
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e)
+            )
         except Exception as e:
             logger.error(f"Plant search failed: {e}", exc_info=True)
             raise HTTPException(
@@ -99,7 +108,8 @@ class RAGController:
                 )
             
             # Use service to search with images
-            plants = service_search_plants_with_images(
+            plants = await run_in_threadpool(
+                service_search_plants_with_images,
                 query=query.strip(),
                 max_results=max_results
             )
@@ -114,6 +124,11 @@ class RAGController:
             
         except HTTPException:
             raise
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e)
+            )
         except Exception as e:
             logger.error(f"Plant search with images failed: {e}", exc_info=True)
             raise HTTPException(
@@ -341,7 +356,7 @@ class RAGController:
         for query in test_queries:
             try:
                 logger.info(f"Running test query: '{query}'")
-                plants = service_search_plants(query, max_results=5)
+                plants = await run_in_threadpool(service_search_plants, query, max_results=5)
                 results[query] = {
                     "success": True,
                     "count": len(plants),
@@ -1,15 +1,164 @@
+import asyncio
 from services.video_generation_service import VideoGenerationService
-from schemas.video_generation_schema import GenerateVideoBody
-from fastapi import HTTPException, status
+from services.video_job_service import InvalidDesignError, VideoJobService
+from schemas.video_generation_schema import (
+    GenerateVideoBatchBody,
+    GenerateVideoBody,
+    VideoBatchResponse,
+    VideoBatchSubmitResponse,
+    VideoJobResponse,
+    VideoJobSubmitResponse,
+)
+from fastapi import HTTPException, Request, status
+from utils.rate_limiter import UpstreamBusyError
+from core.config import get_settings
+from models.video_job_model import VideoJob
+from utils.video_store import video_url
+
+DISCONNECT_POLL_SEC = 1.0
 
 
 class VideoGenerationController:
     @staticmethod
-    async def generate_video(body: GenerateVideoBody):
+    async def _cancel_on_disconnect(request: Request, coro):
+        """
+        Run coro, cancelling it if the client goes away. Video generation holds
+        a Veo slot for minutes, so an abandoned request stops polling and frees
+        the slot. The Veo operation itself cannot be cancelled and still runs
+        upstream.
+        """
+        task = asyncio.create_task(coro)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SEC)
+                if done:
+                    return task.result()
+                if await request.is_disconnected():
+                    print("⚠️ Client disconnected — cancelling video generation.")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise HTTPException(status_code=499, detail="Client closed request")
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+    @staticmethod
+    async def generate_video(body: GenerateVideoBody, request: Request):
         try:
-            return await VideoGenerationService.generate_video_from_image(body)
+            return await VideoGenerationController._cancel_on_disconnect(
+                request, VideoGenerationService.generate_video_from_image(body)
+            )
+        except HTTPException:
+            raise
+        except UpstreamBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error generating video: {str(e)}"
             )
+
+    @staticmethod
+    async def submit_job(body: GenerateVideoBody, current_user: dict) -> VideoJobSubmitResponse:
+        try:
+            job = await VideoJobService.submit(body, current_user["id"])
+            return VideoJobSubmitResponse(
+                job_id=str(job.id),
+                status=job.status,
+                status_url=f"/video/jobs/{job.id}",
+            )
+        except InvalidDesignError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error submitting video job: {str(e)}"
+            )
+
+    @staticmethod
+    def _job_response(job: VideoJob) -> VideoJobResponse:
+        return VideoJobResponse(
+            id=str(job.id),
+            status=job.status,
+            inputs_hash=job.inputs_hash,
+            operation_name=job.operation_name,
+            video_url=video_url(job.video_file) if job.status == "succeeded" else None,
+            error=job.error,
+            attempts=job.attempts,
+            created_at=job.created_at,
+            updated_at=job.updated_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+        )
+
+    @staticmethod
+    async def get_job(job_id: str, current_user: dict) -> VideoJobResponse:
+        try:
+            job = await VideoJobService.get_job(job_id, current_user["id"])
+            if not job:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Video job not found"
+                )
+            return VideoGenerationController._job_response(job)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error fetching video job: {str(e)}"
+            )
+
+    @staticmethod
+    async def submit_batch(body: GenerateVideoBatchBody, current_user: dict) -> VideoBatchSubmitResponse:
+        max_designs = get_settings().video_batch_max_designs
+        if len(body.designs) > max_designs:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"A batch can hold at most {max_designs} designs"
+            )
+        try:
+            batch_id, jobs = await VideoJobService.submit_batch(body.designs, current_user["id"])
+            return VideoBatchSubmitResponse(
+                batch_id=batch_id,
+                job_ids=[str(job.id) for job in jobs],
+                status_url=f"/video/batches/{batch_id}",
+            )
+        except InvalidDesignError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error submitting video batch: {str(e)}"
+            )
+
+    @staticmethod
+    async def get_batch(batch_id: str, current_user: dict) -> VideoBatchResponse:
+        try:
+            jobs = await VideoJobService.get_batch(batch_id, current_user["id"])
+            if not jobs:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Video batch not found"
+                )
+            return VideoBatchResponse(
+                batch_id=batch_id,
+                status=VideoJobService.batch_status(jobs),
+                jobs=[VideoGenerationController._job_response(job) for job in jobs],
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error fetching video batch: {str(e)}"
+            )
@@ -2,16 +2,24 @@
 import base64
 import uuid
 import errno
+import asyncio
 from PIL import Image
 import cv2
 from pathlib import Path
 import numpy as np
 from PIL import ImageFilter
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Union
 
 from core.prompts import compose_stage1_prompt,compose_stage2_prompt,compose_stage3_prompt, render_user_prompts, build_style_and_species_blocks
+from core.config import get_settings
+from core.progress import progress_enabled, report_progress
 from schemas.ai_schema import PromptItem
-from utils.ai_helper import _open_as_base64, _b64_to_pil, gpt_image_edit, _rgba_to_rgb, _pil_to_b64
+from utils.ai_helper import _open_as_base64, gpt_image_edit_async, _rgba_to_rgb, postprocess_edit_b64
+from utils.image_context import ImageContext
+from utils.cache_helper import LRUCache, make_cache_key
+from utils import mask_ops
+from utils.cpu_executor import run_cpu
+from utils.image_encoding import encode_mask_png
 
 OUT_DIR = Path("./storage/generated_images")
 
@@ -65,12 +73,44 @@ def _force_size_l(mask_img: Image.Image, target_w: int, target_h: int) -> Image.
     Ensure mask is single-channel L and EXACTLY target size.
     Use NEAREST so edges stay crisp. Then re-binarize to {0,255}.
     """
-    m = mask_img.convert("L")
-    if m.size != (target_w, target_h):
-        m = m.resize((target_w, target_h), Image.Resampling.NEAREST)
-    # re-binarize
-    m = m.point(lambda v: 255 if v >= 128 else 0).convert("L") # type: ignore
-    return m
+    # resize (NEAREST) + re-binarize in one vectorized pass
+    return Image.fromarray(mask_ops.to_binary_L(mask_img, target_w, target_h), "L")
+
+# HSV ranges per overlay colour (OpenCV 8-bit hue is 0–179), in detection priority order
+COLOR_RANGES = {
+    # GREEN range (35–85)
+    "green": [((35, 40, 40), (85, 255, 255))],
+    # RED ranges wrap around hue: [0–10] U [170–180]
+    "red": [((0, 60, 40), (10, 255, 255)), ((170, 60, 40), (180, 255, 255))],
+    # ANY strong color fallback: high saturation (S > 80) & not near gray
+    "any": [((0, 81, 0), (180, 255, 255))],
+}
+
+COLOR_PRIORITY = {
+    "auto": ["green", "red", "any"],
+    "green": ["green", "any"],
+    "red": ["red", "any"],
+    "any": ["any"],
+}
+
+
+def _hsv_color_mask(hsv: np.ndarray, name: str) -> np.ndarray:
+    ranges = COLOR_RANGES[name]
+    mask = cv2.inRange(hsv, np.array(ranges[0][0], np.uint8), np.array(ranges[0][1], np.uint8))
+    for low, high in ranges[1:]:
+        mask = cv2.bitwise_or(mask, cv2.inRange(hsv, np.array(low, np.uint8), np.array(high, np.uint8)))
+    return mask
+
+
+def _cleanup_color_mask(mask: np.ndarray, close_iters: int, open_iters: int, feather_radius: float) -> Image.Image:
+    kernel = np.ones((5, 5), np.uint8)
+    if close_iters > 0:
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=close_iters)
+    if open_iters > 0:
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=open_iters)
+    m = mask_ops.threshold(mask_ops.feather(mask, feather_radius), 17)  # v > 16
+    return Image.fromarray(m, "L")
+
 
 def _auto_color_to_binary_mask(
     overlay_rgb: Image.Image,
@@ -82,57 +122,73 @@ def _auto_color_to_binary_mask(
     """
     Build a white-on-black binary mask from a COLORED overlay.
     Supports green or red paint; falls back to 'any strong color' via saturation.
-    """
 
-    rgb = np.array(overlay_rgb)       # HxWx3, RGB
-    bgr = rgb[:, :, ::-1]             # OpenCV wants BGR
-    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    Colours are tested lazily in priority order on one HSV conversion and only
+    the winner is cleaned up (morphology + feather).
+    """
+    rgb = np.asarray(overlay_rgb)     # HxWx3, RGB
+    order = COLOR_PRIORITY.get(prefer or "auto", COLOR_PRIORITY["auto"])
 
-    def _mk(mask):
-        kernel = np.ones((5, 5), np.uint8)
-        if close_iters > 0:
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=close_iters)
-        if open_iters > 0:
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=open_iters)
-        m = Image.fromarray(mask).filter(ImageFilter.GaussianBlur(radius=feather_radius))
-        m = m.point(lambda v: 255 if v > 16 else 0).convert("L") # type: ignore
-        return m
+    # RGB2HSV == BGR2HSV on the channel-swapped array, without the extra copy
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    for name in order:
+        raw = _hsv_color_mask(hsv, name)
+        if int(cv2.countNonZero(raw)) > 0:
+            return _cleanup_color_mask(raw, close_iters, open_iters, feather_radius)
 
-    H, S, V = cv2.split(hsv)
+    # nothing detected -> return empty L
+    return Image.new("L", overlay_rgb.size, 0)
 
-    masks = []
 
-    # GREEN range (35–85)
-    green_low  = np.array([35, 40, 40], dtype=np.uint8)
-    green_high = np.array([85, 255, 255], dtype=np.uint8)
-    green_mask = cv2.inRange(hsv, green_low, green_high)
-    masks.append(("green", green_mask))
+def _parse_hex_color(color: str) -> Tuple[int, int, int]:
+    c = color.strip().lstrip("#")
+    if len(c) == 3:
+        c = "".join(ch * 2 for ch in c)
+    if len(c) != 6:
+        raise ValueError(f"Invalid colour: {color!r} (expected #RRGGBB)")
+    return int(c[0:2], 16), int(c[2:4], 16), int(c[4:6], 16)
 
-    # RED ranges wrap around hue: [0–10] U [170–180]
-    red1 = cv2.inRange(hsv, np.array([0, 60, 40], dtype=np.uint8),   np.array([10, 255, 255], dtype=np.uint8))
-    red2 = cv2.inRange(hsv, np.array([170, 60, 40], dtype=np.uint8), np.array([180, 255, 255], dtype=np.uint8))
-    red_mask = cv2.bitwise_or(red1, red2)
-    masks.append(("red", red_mask))
-
-    # ANY strong color fallback: high saturation & not near gray
-    sat_thresh = cv2.threshold(S, 80, 255, cv2.THRESH_BINARY)[1]
-    any_mask = sat_thresh
-    masks.append(("any", any_mask))
-
-    order = {
-        "auto": ["green", "red", "any"],
-        "green": ["green", "any"],
-        "red": ["red", "any"],
-        "any": ["any"],
-    }.get(prefer or "auto", ["green", "red", "any"])
 
-    for name in order:
-        raw = dict(masks)[name]
-        if int(cv2.countNonZero(raw)) > 0:
-            return _mk(raw)
+def detect_color_zones(
+    overlay_rgb: Image.Image,
+    palette: List[dict],
+    close_iters: int = 2,
+    open_iters: int = 1,
+    feather_radius: float = 1.5,
+) -> dict:
+    """
+    Multi-zone overlays: one labelled binary mask per palette entry.
+    palette = [{"name": "bed_a", "color": "#00ff00", "tolerance": 60}, ...]
 
-    # nothing detected -> return empty L
-    return Image.new("L", overlay_rgb.size, 0)
+    Every pixel gets a single label: the nearest palette colour (RGB distance)
+    whose tolerance it falls within, so overlapping tolerances never put a
+    pixel in two zones.
+    Returns {name: L mask (WHITE=zone)}; zones that were not painted are empty.
+    """
+    if not palette:
+        return {}
+    rgb = np.asarray(overlay_rgb).astype(np.int32)
+    H, W = rgb.shape[:2]
+
+    # running nearest-colour label per pixel (keeps memory at H x W, not H x W x K)
+    best = np.full((H, W), np.iinfo(np.int32).max, np.int32)
+    labels = np.full((H, W), -1, np.int32)
+    for idx, zone in enumerate(palette):
+        diff = rgb - np.array(_parse_hex_color(zone["color"]), np.int32)
+        dist_sq = np.einsum("hwc,hwc->hw", diff, diff)
+        tol = int(zone.get("tolerance", 60))
+        closer = (dist_sq < best) & (dist_sq <= tol * tol)
+        best[closer] = dist_sq[closer]
+        labels[closer] = idx
+
+    zones = {}
+    for idx, zone in enumerate(palette):
+        raw = np.where(labels == idx, 255, 0).astype(np.uint8)
+        if int(cv2.countNonZero(raw)) == 0:
+            zones[zone["name"]] = Image.new("L", overlay_rgb.size, 0)
+        else:
+            zones[zone["name"]] = _cleanup_color_mask(raw, close_iters, open_iters, feather_radius)
+    return zones
 
 def _make_hard_mask(base_green_mask: Image.Image, trunk_feather_px: int = 2) -> Image.Image:
     """
@@ -140,9 +196,9 @@ def _make_hard_mask(base_green_mask: Image.Image, trunk_feather_px: int = 2) ->
     Small feather to avoid razor edges around the trunk base.
     """
     if trunk_feather_px > 0:
-        hard = base_green_mask.filter(ImageFilter.GaussianBlur(radius=trunk_feather_px))
-        hard = hard.point(lambda v: 255 if v >= 64 else 0).convert("L") # type: ignore
-        return hard
+        arr = np.asarray(base_green_mask.convert("L"))
+        hard = mask_ops.threshold(mask_ops.feather(arr, trunk_feather_px), 64)
+        return Image.fromarray(hard, "L")
     return base_green_mask.copy()
 
 
@@ -163,8 +219,19 @@ def _make_soft_canopy_mask(
     arr = np.array(hard_mask)  # uint8 0/255
     base = (arr > 0).astype(np.uint8) * 255
 
-    # Vertical upward freedom (large kernel height)
     vert_h = max(3, canopy_grow_px_up * 2 + 1)
+    down_h = down_grow_px_limit * 2 + 1
+    down_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, down_h))
+
+    # Limit downward growth a bit: the result is clipped to (base | mild_vert).
+    # The 3 x down_h kernel is nested in the 3 x vert_h one, so base ⊆ mild_vert ⊆
+    # vert ⊆ expanded and the clip reduces to mild_vert itself – the large
+    # dilations can be skipped entirely (identical output).
+    if down_grow_px_limit > 0 and down_h <= vert_h:
+        expanded = cv2.dilate(base, down_kernel, iterations=1)
+        return Image.fromarray(expanded).convert("L")
+
+    # Vertical upward freedom (large kernel height)
     vert_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, vert_h))
     vert = cv2.dilate(base, vert_kernel, iterations=1)
 
@@ -175,11 +242,8 @@ def _make_soft_canopy_mask(
 
     expanded = cv2.bitwise_or(vert, radial)
 
-    # Limit downward growth a bit:
     if down_grow_px_limit > 0:
         # Erode from below: build a kernel mostly vertical but short
-        down_h = down_grow_px_limit * 2 + 1
-        down_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, down_h))
         # Compute a milder vertical expansion and subtract extras below
         mild_vert = cv2.dilate(base, down_kernel, iterations=1)
         # Keep original + above; then combine with main expanded
@@ -189,136 +253,454 @@ def _make_soft_canopy_mask(
     soft = Image.fromarray(expanded).convert("L")
     return soft
 
-def make_hard_and_soft_masks_from_green(
-    green_overlay_b64: str,
-    base_image_b64: Optional[str] = None,
-    hsv_low=(35, 40, 40),
-    hsv_high=(85, 255, 255),
+def make_hard_and_soft_masks(
+    green_overlay: ImageContext,
+    base_image: Optional[ImageContext] = None,
     trunk_feather_px: int = 2,
     canopy_grow_px_up: int = 80,
     canopy_grow_px_radial: int = 12,
     down_grow_px_limit: int = 8,
-) -> Tuple[str, str]:
+    work_max_side: Optional[int] = None,
+) -> Tuple[ImageContext, ImageContext]:
     """
     Convert green overlay to:
       - HARD mask (roots/trunk must be inside)
       - SOFT mask (allows canopy/fronds above the bed)
 
-    Returns (hard_mask_b64, soft_mask_b64) as base64 PNGs.
+    Returns (hard_mask, soft_mask) as ImageContexts (L mode, WHITE=editable);
+    PNG/base64 encodings are produced lazily, only if a caller needs them.
+    The mask bitmaps are cached in-process and shared between callers (treat
+    them as read-only); every call gets its own contexts, so encodings derived
+    on them are never held by the cache.
 
     Parameters let you tune behaviour:
-      hsv_low/high         : green detector range in HSV
       trunk_feather_px     : small blur for trunk base
       canopy_grow_px_up    : how far canopy may grow vertically (in pixels)
       canopy_grow_px_radial: sideways leeway for fronds
       down_grow_px_limit   : limit downward expansion near ground
+      work_max_side        : colour detection runs at native size, then the hard/soft
+                             masks are built on a proxy whose long side is at most this
+                             (None = settings.mask_work_max_side, 0 = native); pixel
+                             parameters are scaled to match and only the final masks
+                             are upsampled to native size
 
     NOTE:
-    - We do not require base_image_b64 here yet, but we keep it in the signature
+    - base_image is only used for its size today, but we keep it in the signature
       for future hardscape-aware blocking (e.g., avoid crossing railings).
     """
-    # 1) Load overlay and find green
-    overlay_rgba = _b64_to_pil(green_overlay_b64)
-    overlay_rgb = _rgba_to_rgb(overlay_rgba)
-
-    # base_green_mask = _green_to_binary_mask(
-    #     overlay_rgb,
-    #     hsv_low=hsv_low,
-    #     hsv_high=hsv_high,
-    #     feather_radius=1.5,
-    # )
-
-    base_green_mask = _auto_color_to_binary_mask(
-        overlay_rgb,
-        prefer="auto",   # will try green -> red -> any
-        feather_radius=1.5,
+    settings = get_settings()
+    if work_max_side is None:
+        work_max_side = settings.mask_work_max_side
+
+    scale = working_scale(*green_overlay.size, work_max_side)
+
+    # The same overlay is re-derived by preview_mask, mask_from_green and every
+    # stage of a run, so results are memoised by overlay content + parameters.
+    cache = _mask_cache()
+    key = make_cache_key(
+        overlay=green_overlay.sha256,
+        base_size=list(base_image.size) if base_image is not None else None,
+        trunk_feather_px=trunk_feather_px,
+        canopy_grow_px_up=canopy_grow_px_up,
+        canopy_grow_px_radial=canopy_grow_px_radial,
+        down_grow_px_limit=down_grow_px_limit,
+        # effective scale, not work_max_side: limits above the image size give identical masks
+        work_scale=scale,
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return _mask_contexts(cached)
+
+    # 1) Load overlay and find green (native resolution, then down to the working size)
+    base_green_mask = _working_mask(
+        _auto_color_to_binary_mask(
+            _overlay_rgb(green_overlay),
+            prefer="auto",   # will try green -> red -> any
+        ),
+        scale,
     )
 
-    # 2) Build HARD and SOFT masks
-    hard_mask = _make_hard_mask(base_green_mask, trunk_feather_px=trunk_feather_px)
-    soft_mask = _make_soft_canopy_mask(
-        hard_mask,
+    # 2) Build HARD and SOFT masks (+ force to base size)
+    masks = _hard_and_soft_from_binary(
+        base_green_mask,
+        _native_size(green_overlay, base_image),
+        scale,
+        trunk_feather_px=trunk_feather_px,
         canopy_grow_px_up=canopy_grow_px_up,
         canopy_grow_px_radial=canopy_grow_px_radial,
         down_grow_px_limit=down_grow_px_limit,
     )
+    # only the bitmaps are cached; encodings derived later stay on the caller's contexts
+    cache.put(key, tuple(m.pil for m in masks))
+    return masks
+
+
+def _mask_contexts(masks: Tuple[Image.Image, Image.Image]) -> Tuple[ImageContext, ImageContext]:
+    # binary masks: 1-bit PNG when (and only if) an encoding is requested
+    hard, soft = masks
+    return (
+        ImageContext.from_pil(hard, encoder=encode_mask_png),
+        ImageContext.from_pil(soft, encoder=encode_mask_png),
+    )
+
+
+_MASK_CACHE: Optional[LRUCache] = None
+
+
+def _mask_cache() -> LRUCache:
+    global _MASK_CACHE
+    if _MASK_CACHE is None:
+        # (hard, soft) L bitmaps: one byte per pixel each, the whole entry
+        _MASK_CACHE = LRUCache(
+            "hard_soft_masks",
+            get_settings().mask_cache_max_bytes,
+            size_of=lambda masks: sum(m.size[0] * m.size[1] for m in masks),
+        )
+    return _MASK_CACHE
+
+
+def make_zone_masks(
+    overlay: ImageContext,
+    zones: List[dict],
+    base_image: Optional[ImageContext] = None,
+    trunk_feather_px: int = 2,
+    canopy_grow_px_up: int = 80,
+    canopy_grow_px_radial: int = 12,
+    down_grow_px_limit: int = 8,
+    work_max_side: Optional[int] = None,
+) -> dict:
+    """
+    Like make_hard_and_soft_masks, but for an overlay painted with several
+    user-defined colours. Returns {zone_name: (hard_mask, soft_mask)}.
+    """
+    if work_max_side is None:
+        work_max_side = get_settings().mask_work_max_side
+    scale = working_scale(*overlay.size, work_max_side)
+    native = _native_size(overlay, base_image)
+
+    binaries = detect_color_zones(_overlay_rgb(overlay), zones)
+    return {
+        name: _hard_and_soft_from_binary(
+            _working_mask(binary, scale),
+            native,
+            scale,
+            trunk_feather_px=trunk_feather_px,
+            canopy_grow_px_up=canopy_grow_px_up,
+            canopy_grow_px_radial=canopy_grow_px_radial,
+            down_grow_px_limit=down_grow_px_limit,
+        )
+        for name, binary in binaries.items()
+    }
+
+
+def size_max_side(size: Optional[str]) -> Optional[int]:
+    """'1536x1024' -> 1536; None for 'auto'/unparseable sizes."""
+    try:
+        w, h = (int(v) for v in (size or "").lower().split("x"))
+        return max(w, h)
+    except ValueError:
+        return None
+
+
+def working_scale(width: int, height: int, max_side: Optional[int]) -> float:
+    """Downscale factor (<= 1) that brings the long side to max_side (0/None = native)."""
+    if not max_side or max(width, height) <= max_side:
+        return 1.0
+    return max_side / max(width, height)
+
+
+def _scale_px(px: int, scale: float) -> int:
+    """Scale a pixel parameter to the working resolution, never dropping a non-zero one to 0."""
+    if px <= 0 or scale >= 1.0:
+        return px
+    return max(1, round(px * scale))
+
+
+def _working_mask(binary: Image.Image, scale: float) -> Image.Image:
+    """
+    Colour detection runs on the native overlay, where a thin stroke is either
+    painted or not; only the resulting binary mask is reduced to the working
+    size. (Downsampling the overlay itself made thin strokes come and go with
+    the sampling grid.)
+    """
+    if scale >= 1.0:
+        return binary
+    w, h = max(1, round(binary.width * scale)), max(1, round(binary.height * scale))
+    return Image.fromarray(mask_ops.downscale_binary(np.asarray(binary), w, h), "L")
 
-        # 3) If we have the base image, FORCE both masks to its exact size
-    target_w = target_h = None
-    if base_image_b64:
-        base_img = _b64_to_pil(base_image_b64).convert("RGB")
-        target_w, target_h = base_img.size
 
-    if target_w and target_h:
+def _native_size(overlay: ImageContext, base_image: Optional[ImageContext]) -> Tuple[int, int]:
+    # header only, no full decode
+    return base_image.size if base_image is not None else overlay.size
+
+
+def _overlay_rgb(overlay: ImageContext) -> Image.Image:
+    overlay_pil = overlay.pil
+    return _rgba_to_rgb(overlay_pil if overlay_pil.mode == "RGB" else overlay.convert("RGBA"))
+
+
+def _hard_and_soft_from_binary(
+    base_green_mask: Image.Image,
+    native_size: Tuple[int, int],
+    scale: float,
+    trunk_feather_px: int,
+    canopy_grow_px_up: int,
+    canopy_grow_px_radial: int,
+    down_grow_px_limit: int,
+) -> Tuple[ImageContext, ImageContext]:
+    hard_mask = _make_hard_mask(base_green_mask, trunk_feather_px=_scale_px(trunk_feather_px, scale))
+    soft_mask = _make_soft_canopy_mask(
+        hard_mask,
+        canopy_grow_px_up=_scale_px(canopy_grow_px_up, scale),
+        canopy_grow_px_radial=_scale_px(canopy_grow_px_radial, scale),
+        down_grow_px_limit=_scale_px(down_grow_px_limit, scale),
+    )
+
+    # FORCE both masks to the native (base) size
+    target_w, target_h = native_size
+    if scale < 1.0:
+        # smooth upsample of the proxy masks (bilinear + re-threshold, no blocky steps)
+        hard_mask = Image.fromarray(mask_ops.upscale_binary(np.asarray(hard_mask), target_w, target_h), "L")
+        soft_mask = Image.fromarray(mask_ops.upscale_binary(np.asarray(soft_mask), target_w, target_h), "L")
+    elif hard_mask.size != native_size:
         hard_mask = _force_size_l(hard_mask, target_w, target_h)
         soft_mask = _force_size_l(soft_mask, target_w, target_h)
 
-    # 3) Return as base64 PNGs
-    return _pil_to_b64(hard_mask, "PNG"), _pil_to_b64(soft_mask, "PNG")
+    return _mask_contexts((hard_mask, soft_mask))
 
-def run_stage1_layout(
-    base_image_b64: str,
-    style_block: str,
-    species_block: str,
-    user_prompts: Optional[List[dict]] = None,
-    green_overlay_b64: Optional[str] = None,
-    size: str = "1024x1024",
-) -> Tuple[str, str, str]:
+def make_hard_and_soft_masks_from_green(
+    green_overlay_b64: Union[str, ImageContext],
+    base_image_b64: Union[str, ImageContext, None] = None,
+    hsv_low=(35, 40, 40),
+    hsv_high=(85, 255, 255),
+    trunk_feather_px: int = 2,
+    canopy_grow_px_up: int = 80,
+    canopy_grow_px_radial: int = 12,
+    down_grow_px_limit: int = 8,
+) -> Tuple[str, str]:
     """
-    Stage 1: layout + style + canopy freedom.
-    - Builds prompt (Option B) for Stage 1.
-    - If green overlay is provided, derive SOFT mask (for canopy freedom).
-    - Returns (out_b64, final_prompt, mask_used_b64).
+    base64-in / base64-out wrapper around make_hard_and_soft_masks.
+    Returns (hard_mask_b64, soft_mask_b64) as base64 PNGs.
+    hsv_low/high are kept for API compatibility (colour detection is automatic).
     """
+    overlay = ImageContext.ensure(green_overlay_b64)
+    assert overlay is not None
+    hard, soft = make_hard_and_soft_masks(
+        overlay,
+        ImageContext.ensure(base_image_b64),
+        trunk_feather_px=trunk_feather_px,
+        canopy_grow_px_up=canopy_grow_px_up,
+        canopy_grow_px_radial=canopy_grow_px_radial,
+        down_grow_px_limit=down_grow_px_limit,
+    )
+    return hard.b64, soft.b64
+
+def _prepare_stage1(
+    base_image_b64: Union[str, ImageContext],
+    style_block: str,
+    species_block: str,
+    user_prompts: Optional[List[dict]],
+    green_overlay_b64: Union[str, ImageContext, None],
+    size: Optional[str] = None,
+) -> Tuple[ImageContext, str, Optional[ImageContext]]:
+    """Stage 1 prompt + SOFT mask, shared by the single and multi-variant runners."""
     # Build user block
     user_block = render_user_prompts(user_prompts or [])
 
     # Build prompt
     prompt = compose_stage1_prompt(style_block, species_block, user_block)
+
+    base = ImageContext.ensure(base_image_b64)
+    overlay = ImageContext.ensure(green_overlay_b64)
+    assert base is not None
+
     # Mask logic
-    mask_b64 = None
-    if green_overlay_b64:
-        _, soft_b64 = make_hard_and_soft_masks_from_green(
-            green_overlay_b64=green_overlay_b64,
-            base_image_b64=base_image_b64,
+    mask = None
+    if overlay is not None:
+        _, mask = make_hard_and_soft_masks(
+            overlay,
+            base,
             canopy_grow_px_up=20,        # tighter vertical allowance
             canopy_grow_px_radial=4,     # tighter sideways allowance
             down_grow_px_limit=6,
+            work_max_side=size_max_side(size),  # no finer than what the model receives
         )
-        mask_b64 = soft_b64
+    return base, prompt, mask
+
+
+def mask_adherence_score(
+    base: ImageContext,
+    out: ImageContext,
+    mask: Optional[ImageContext],
+    proxy_side: int = 256,
+) -> Optional[float]:
+    """
+    Cheap local quality signal for ranking variants: 1.0 means nothing changed
+    outside the editable (WHITE) mask, lower means the edit spilled.
+    Computed on a small proxy; None when there is no mask to judge against.
+    """
+    if mask is None:
+        return None
+    W, H = base.size
+    scale = min(1.0, proxy_side / max(W, H))
+    w, h = max(1, round(W * scale)), max(1, round(H * scale))
+
+    b = cv2.resize(np.asarray(base.convert("RGB")), (w, h), interpolation=cv2.INTER_AREA).astype(np.int16)
+    o = cv2.resize(np.asarray(out.convert("RGB")), (w, h), interpolation=cv2.INTER_AREA).astype(np.int16)
+    outside = mask_ops.resize_nearest(np.asarray(mask.convert("L")), w, h) < 128
+    if not outside.any():
+        return 1.0
+    diff = np.abs(b - o).mean(axis=2)[outside].mean()
+    return round(1.0 - float(diff) / 255.0, 4)
+
+
+async def _postprocess(
+    base: ImageContext,
+    out_b64: str,
+    mask: Optional[ImageContext],
+    options: Optional[dict],
+) -> str:
+    """Opt-in clamp/colour-match/feather stage (see postprocess_edit); no-op when options is None."""
+    if not options:
+        return out_b64
+    return await run_cpu(postprocess_edit_b64, base, out_b64, mask, options)
+
+
+async def _mask_b64(mask: Optional[ImageContext]) -> str:
+    """PNG/base64 of the mask used, encoded off the event loop ("" when no mask)."""
+    if mask is None:
+        return ""
+    return await run_cpu(lambda: mask.b64)
+
+
+async def run_stage1_variants(
+    base_image_b64: Union[str, ImageContext],
+    style_block: str,
+    species_block: str,
+    variants: int,
+    user_prompts: Optional[List[dict]] = None,
+    green_overlay_b64: Union[str, ImageContext, None] = None,
+    size: str = "1024x1024",
+    rank: bool = False,
+    postprocess: Optional[dict] = None,
+) -> Tuple[List[dict], str, str]:
+    """
+    Stage 1, N times in parallel from one prompt/mask (the analysis is shared).
+    Edits go through the global image-edit limiter; each finished variant is
+    reported as a "variant" progress event as soon as it lands.
+    Returns (variants, final_prompt, mask_used_b64). Variants are ordered best
+    first when rank=True (by mask_adherence_score), otherwise by completion.
+    Failed variants are kept with an "error"; raises only if all of them fail.
+    """
+    base, prompt, mask = await run_cpu(_prepare_stage1, base_image_b64, style_block, species_block, user_prompts, green_overlay_b64, size)
+
+    async def one(index: int) -> dict:
+        try:
+            out_b64 = await gpt_image_edit_async(image_b64=base, prompt=prompt, mask_b64=mask, size=size, cache_salt=f"variant-{index}")
+            out_b64 = await _postprocess(base, out_b64, mask, postprocess)
+        except Exception as e:
+            return {"index": index, "error": str(e)}
+        score = await run_cpu(mask_adherence_score, base, ImageContext.from_b64(out_b64), mask) if rank else None
+        return {"index": index, "result_b64": out_b64, "file": _progress_file(out_b64, f"stage1_v{index}"), "score": score}
+
+    results = []
+    for fut in asyncio.as_completed([one(i) for i in range(variants)]):
+        item = await fut
+        results.append(item)
+        await report_progress(
+            "variant",
+            index=item["index"],
+            file=item.get("file"),
+            score=item.get("score"),
+            error=item.get("error"),
+        )
+
+    ok = [r for r in results if "result_b64" in r]
+    if not ok:
+        raise RuntimeError(f"All {variants} variants failed: {results[0]['error']}")
+    if rank:
+        ok.sort(key=lambda r: -1.0 if r["score"] is None else r["score"], reverse=True)
+    failed = [r for r in results if "result_b64" not in r]
+    return ok + failed, prompt, await _mask_b64(mask)
 
-    out_b64 = gpt_image_edit(
-        image_b64=base_image_b64,
+
+async def run_stage1_layout(
+    base_image_b64: Union[str, ImageContext],
+    style_block: str,
+    species_block: str,
+    user_prompts: Optional[List[dict]] = None,
+    green_overlay_b64: Union[str, ImageContext, None] = None,
+    size: str = "1024x1024",
+    postprocess: Optional[dict] = None,
+) -> Tuple[str, str, str]:
+    """
+    Stage 1: layout + style + canopy freedom.
+    - Builds prompt (Option B) for Stage 1.
+    - If green overlay is provided, derive SOFT mask (for canopy freedom).
+    - Returns (out_b64, final_prompt, mask_used_b64).
+    """
+    base, prompt, mask = await run_cpu(_prepare_stage1, base_image_b64, style_block, species_block, user_prompts, green_overlay_b64, size)
+
+    out_b64 = await gpt_image_edit_async(
+        image_b64=base,
         prompt=prompt,
-        mask_b64=mask_b64,
+        mask_b64=mask,
         size=size,
     )
 
-    # if mask_b64:
-    #     out_b64 = _clamp_to_mask_keep_outside(base_image_b64, out_b64, mask_b64)
-
-    # # Photographic tone match back to base
-    # try:
-    #     out_b64 = _lab_color_transfer(out_b64, base_image_b64)
-    # except Exception:
-    #     pass
+    # Optional hard clamp + photographic tone match back to base
+    out_b64 = await _postprocess(base, out_b64, mask, postprocess)
 
     # Return base64 directly instead of saving to disk
-    return out_b64, prompt, (mask_b64 or "")
+    return out_b64, prompt, await _mask_b64(mask)
 
 
 # -----------------------
 # Stage 2
 # -----------------------
 
-def run_stage2_refine(
-    stage1_result_b64: str,
+async def _stage2_edit(
+    stage1_result_b64: Union[str, ImageContext],
+    style_block: str,
+    species_block: str,
+    user_prompts: Optional[List[dict]],
+    green_overlay_b64: Union[str, ImageContext, None],
+    refine_mask_b64: Union[str, ImageContext, None],
+    size: str,
+    postprocess: Optional[dict] = None,
+) -> Tuple[str, str, str]:
+    """Stage 2 edit kept in memory: returns (out_b64, final_prompt, mask_used_b64)."""
+    user_block = render_user_prompts(user_prompts or [])
+    prompt = compose_stage2_prompt(style_block, species_block, user_block)
+
+    base = ImageContext.ensure(stage1_result_b64)
+    overlay = ImageContext.ensure(green_overlay_b64)
+    assert base is not None
+
+    mask = ImageContext.ensure(refine_mask_b64)
+    if mask is None and overlay is not None:
+        mask, _ = await run_cpu(make_hard_and_soft_masks, overlay, base, work_max_side=size_max_side(size))  # same size
+
+    out_b64 = await gpt_image_edit_async(
+        image_b64=base,
+        prompt=prompt,
+        mask_b64=mask,
+        size=size,
+    )
+    out_b64 = await _postprocess(base, out_b64, mask, postprocess)
+
+    return out_b64, prompt, await _mask_b64(mask)
+
+
+async def run_stage2_refine(
+    stage1_result_b64: Union[str, ImageContext],
     style_block: str,
     species_block: str,
     user_prompts: Optional[List[dict]] = None,
-    green_overlay_b64: Optional[str] = None,
-    refine_mask_b64: Optional[str] = None,
+    green_overlay_b64: Union[str, ImageContext, None] = None,
+    refine_mask_b64: Union[str, ImageContext, None] = None,
     size: str = "1024x1024",
+    postprocess: Optional[dict] = None,
 ) -> Tuple[str, str, str]:
     """
     Stage 2: strict species accuracy refinement near bases/crowns.
@@ -326,77 +708,98 @@ def run_stage2_refine(
     - If refine_mask_b64 is provided (e.g., brush/box around new plants), that overrides default.
     - Returns (out_path, final_prompt, mask_used_b64).
     """
-    user_block = render_user_prompts(user_prompts or [])
-    prompt = compose_stage2_prompt(style_block, species_block, user_block)
-
-    mask_b64 = refine_mask_b64
-    if not mask_b64 and green_overlay_b64:
-        hard_b64, _ = make_hard_and_soft_masks_from_green(
-            green_overlay_b64=green_overlay_b64,
-            base_image_b64=stage1_result_b64,  # same size
-        )
-        mask_b64 = hard_b64
-
-    out_b64 = gpt_image_edit(
-        image_b64=stage1_result_b64,
-        prompt=prompt,
-        mask_b64=mask_b64,
-        size=size,
+    out_b64, prompt, mask = await _stage2_edit(
+        stage1_result_b64, style_block, species_block, user_prompts, green_overlay_b64, refine_mask_b64, size, postprocess
     )
     out_path = _save_b64_png(out_b64, "stage2")
 
-    return out_path, prompt, (mask_b64 or "")
+    return out_path, prompt, mask
 
 
 # -----------------------
 # Stage 3
 # -----------------------
 
-def run_stage3_blend(
-    stage2_result_b64: str,
+async def _stage3_edit(
+    stage2_result_b64: Union[str, ImageContext],
     style_block: str,
     species_block: str,
-    user_prompts: Optional[List[dict]] = None,
-    size: str = "1024x1024",
-    use_soft_mask: bool = False,
-    green_overlay_b64: Optional[str] = None,
+    user_prompts: Optional[List[dict]],
+    size: str,
+    use_soft_mask: bool,
+    green_overlay_b64: Union[str, ImageContext, None],
+    postprocess: Optional[dict] = None,
 ) -> Tuple[str, str, str]:
-    """
-    Stage 3: global harmonization (light).
-    - Usually no mask; optionally allow a very soft mask (rare).
-    - Returns (out_path, final_prompt, mask_used_b64_or_empty).
-    """
+    """Stage 3 edit kept in memory: returns (out_b64, final_prompt, mask_used_b64)."""
     user_block = render_user_prompts(user_prompts or [])
     prompt = compose_stage3_prompt(style_block, species_block, user_block)
 
-    mask_b64 = None
-    if use_soft_mask and green_overlay_b64:
+    base = ImageContext.ensure(stage2_result_b64)
+    overlay = ImageContext.ensure(green_overlay_b64)
+    assert base is not None
+
+    mask = None
+    if use_soft_mask and overlay is not None:
         # Very wide soft mask if you want to limit minor tweaks mostly to planted areas.
-        _, soft_b64 = make_hard_and_soft_masks_from_green(
-            green_overlay_b64=green_overlay_b64,
-            base_image_b64=stage2_result_b64,
+        _, mask = await run_cpu(
+            make_hard_and_soft_masks,
+            overlay,
+            base,
             canopy_grow_px_up=120,         # wider for gentle global touch
             canopy_grow_px_radial=24,
             down_grow_px_limit=12,
+            work_max_side=size_max_side(size),
         )
-        mask_b64 = soft_b64
 
-    out_b64 = gpt_image_edit(
-        image_b64=stage2_result_b64,
+    out_b64 = await gpt_image_edit_async(
+        image_b64=base,
         prompt=prompt,
-        mask_b64=mask_b64,
+        mask_b64=mask,
         size=size,
     )
+    out_b64 = await _postprocess(base, out_b64, mask, postprocess)
+
+    return out_b64, prompt, await _mask_b64(mask)
+
+
+async def run_stage3_blend(
+    stage2_result_b64: Union[str, ImageContext],
+    style_block: str,
+    species_block: str,
+    user_prompts: Optional[List[dict]] = None,
+    size: str = "1024x1024",
+    use_soft_mask: bool = False,
+    green_overlay_b64: Union[str, ImageContext, None] = None,
+    postprocess: Optional[dict] = None,
+) -> Tuple[str, str, str]:
+    """
+    Stage 3: global harmonization (light).
+    - Usually no mask; optionally allow a very soft mask (rare).
+    - Returns (out_path, final_prompt, mask_used_b64_or_empty).
+    """
+    out_b64, prompt, mask = await _stage3_edit(
+        stage2_result_b64, style_block, species_block, user_prompts, size, use_soft_mask, green_overlay_b64, postprocess
+    )
     out_path = _save_b64_png(out_b64, "stage3")
 
-    return out_path, prompt, (mask_b64 or "")
+    return out_path, prompt, mask
+
+
+def _progress_file(b64: str, prefix: str) -> Optional[str]:
+    """
+    Save an intermediate result so progress events can point at /ai/file/{name}
+    instead of carrying MBs of base64. Skipped when nobody is listening.
+    """
+    if not progress_enabled():
+        return None
+    return Path(_save_b64_png(b64, prefix)).name
 
 
 # -----------------------
 # One-click pipeline
 # -----------------------
 
-def generate_all_smart(
+async def generate_all_smart(
     base_image_b64: str,
     style_refs_b64: List[str],
     plant_refs_b64: List[str],
@@ -404,6 +807,10 @@ def generate_all_smart(
     green_overlay_b64: Optional[str] = None,
     size: str = "1024x1024",
     stage3_use_soft_mask: bool = False,
+    variants: int = 1,
+    rank_variants: bool = False,
+    run_stages: int = 1,
+    postprocess: Optional[dict] = None,
 ) -> dict:
     """
     One-click pipeline runner:
@@ -412,6 +819,11 @@ def generate_all_smart(
       3) Stage 2 (hard mask)
       4) Stage 3 (optional soft global harmonization)
     Returns JSON with paths, prompts, and masks used.
+    variants > 1 runs stage 1 N times concurrently on the same analysis;
+    final_b64 is then the best (rank_variants) or first finished variant.
+    run_stages (1–3) chains stage 2 / stage 3 server-side on the in-memory
+    result of the previous stage; each finished stage is saved to OUT_DIR and
+    reported as a "stage" progress event carrying its file name.
     """
 
     # 0) Normalize inputs (support passing file paths too)
@@ -423,24 +835,47 @@ def generate_all_smart(
     global plant_refs_b64_global
     plant_refs_b64_global = plant_refs_b64[:]
 
+    # Decode-once contexts shared by analysis, masks and the edit call
+    base = ImageContext.from_b64(base_image_b64)
+    overlay = ImageContext.from_b64(green_overlay_b64) if green_overlay_b64 else None
+
     # 1) Analyze inputs
-    style_block, species_block = build_style_and_species_blocks(
-        base_image_b64=base_image_b64,
-        style_refs_b64=style_refs_b64,
-        plant_refs_b64=plant_refs_b64,
+    style_block, species_block = await build_style_and_species_blocks(
+        base_image_b64=base,
+        style_refs_b64=[ImageContext.from_b64(b) for b in style_refs_b64],
+        plant_refs_b64=[ImageContext.from_b64(b) for b in plant_refs_b64],
     )
+    await report_progress("analysis", style_block=style_block, species_block=species_block)
 
     # 2) Stage 1
-    s1_b64, s1_prompt, s1_mask = run_stage1_layout(
-        base_image_b64=base_image_b64,
-        style_block=style_block,
-        species_block=species_block,
-        user_prompts=user_prompts,
-        green_overlay_b64=green_overlay_b64,
-        size=size,
-    )
+    variants = max(1, min(variants, get_settings().max_generation_variants))
+    variant_results = None
+    if variants > 1:
+        variant_results, s1_prompt, s1_mask = await run_stage1_variants(
+            base_image_b64=base,
+            style_block=style_block,
+            species_block=species_block,
+            variants=variants,
+            user_prompts=user_prompts,
+            green_overlay_b64=overlay,
+            size=size,
+            rank=rank_variants,
+            postprocess=postprocess,
+        )
+        s1_b64 = variant_results[0]["result_b64"]
+    else:
+        s1_b64, s1_prompt, s1_mask = await run_stage1_layout(
+            base_image_b64=base,
+            style_block=style_block,
+            species_block=species_block,
+            user_prompts=user_prompts,
+            green_overlay_b64=overlay,
+            size=size,
+            postprocess=postprocess,
+        )
+    await report_progress("stage", stage="stage1", file=_progress_file(s1_b64, "stage1"))
 
-    return {
+    result = {
         "ok": True,
         "style_block": style_block,
         "species_block": species_block,
@@ -451,4 +886,25 @@ def generate_all_smart(
             "maskUsedB64": s1_mask,
         },
         "final_b64": s1_b64,  # Return base64 instead of file path
-    }
\ No newline at end of file
+    }
+    if variant_results is not None:
+        result["variants"] = variant_results
+
+    # 3) Stage 2 (hard mask) on the stage-1 image, no client round-trip
+    if run_stages >= 2:
+        s2_b64, s2_prompt, s2_mask = await _stage2_edit(
+            s1_b64, style_block, species_block, user_prompts, overlay, None, size, postprocess
+        )
+        await report_progress("stage", stage="stage2", file=_progress_file(s2_b64, "stage2"))
+        result["stage2"] = {"result_b64": s2_b64, "prompt": s2_prompt, "maskUsedB64": s2_mask}
+        result["final_b64"] = s2_b64
+
+        # 4) Stage 3 (optional soft global harmonization)
+        if run_stages >= 3:
+            s3_b64, s3_prompt, s3_mask = await _stage3_edit(
+                s2_b64, style_block, species_block, user_prompts, size, stage3_use_soft_mask, overlay, postprocess
+            )
+            await report_progress("stage", stage="stage3", file=_progress_file(s3_b64, "stage3"))
+            result["stage3"] = {"result_b64": s3_b64, "prompt": s3_prompt, "maskUsedB64": s3_mask}
+            result["final_b64"] = s3_b64
+    return result
\ No newline at end of file
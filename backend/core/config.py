@@ -7,6 +7,12 @@ class Settings(BaseSettings):
     # Video Generation
     video_storage_dir: str = "./storage/generated_videos"
     video_generation_model: str = "models/veo-3.1-generate-preview"
+    video_job_workers: int = 4  # concurrent durable video jobs per process (above the Veo cap, so juvenile frames overlap generations)
+    video_batch_max_designs: int = 8  # designs per /video/batches submission
+    video_job_poll_interval: float = 5.0  # seconds between scans for runnable jobs
+    video_job_lease_seconds: float = 60.0  # a job whose worker stops renewing is resumed elsewhere
+    video_job_max_attempts: int = 3  # claims before a repeatedly crashing job is failed
+    video_cache_enabled: bool = True  # reuse juvenile frames and finished videos for the same mature image
     # RAG Configuration
     google_api_key: str = ""  # For Gemini LLM
     rag_embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
@@ -18,16 +24,74 @@ class Settings(BaseSettings):
     rag_fetch_k: int = 10  # MMR fetch_k parameter
     rag_lambda_mult: float = 0.5  # MMR diversity parameter
     
+    # Background AI jobs
+    ai_job_workers: int = 4  # concurrent jobs per process
+    ai_job_queue_size: int = 200  # submissions beyond this get 503
+    ai_job_event_poll_interval: float = 2.0  # seconds, SSE fallback poll
+    ai_job_lease_seconds: float = 60.0  # unfinished jobs whose owner stops renewing are failed
+    webhook_allowed_hosts: list[str] = []  # job webhook hosts (and subdomains); empty = any public https host
+    webhook_timeout: float = 5.0  # seconds per webhook attempt
+    webhook_max_attempts: int = 3
+
+    # CPU-bound image work (masks, composites, PNG encode) runs off the event loop
+    cpu_executor_workers: int = 0  # threads (0 = CPU count)
+    cpu_executor_queue_size: int = 32  # waiting tasks beyond the workers before 503
+
+    # Image encoding (see utils/image_encoding.py)
+    png_compress_level: int = 1  # zlib level for transient intermediates / responses
+    png_upload_compress_level: int = 6  # uploads to OpenAI and on-disk caches
+    preview_format: str = "png"  # "png" | "webp" | "jpeg" for preview_mask
+    preview_quality: int = 85  # webp/jpeg
+
+    # Image generation (generate_all_smart)
+    max_generation_variants: int = 6  # cap on best-of-N stage 1 variants per request
+
     # Storage Configuration
     canvas_asset_dir: str = "storage/canvas_assets"
+    cache_dir: str = "storage/cache"  # content-addressed caches (analysis, cutouts, ...)
+    image_upload_max_bytes: int = 25 * 1024 * 1024  # /ai/images uploads
+    vision_cache_enabled: bool = True  # reuse [STYLE]/[PLANT_SPECIES] for identical inputs
+    mask_cache_max_bytes: int = 256 * 1024 * 1024  # in-memory hard/soft mask LRU
+    mask_work_max_side: int = 2048  # masks computed at most this long side, then upsampled (0 = native)
+    rembg_model: str = "u2net"  # background removal model for plant cutouts
+    rembg_pool_size: int = 0  # max sessions per model (0 = CPU count)
+    cutout_cache_enabled: bool = True  # reuse RGBA cutouts of identical plant references
+    edit_result_cache_enabled: bool = False  # reuse identical image edits (an Idempotency-Key header opts in per request)
+    edit_result_cache_ttl: float = 24 * 3600  # seconds
+    edit_result_cache_max_bytes: int = 2 * 1024 * 1024 * 1024  # on-disk LRU bound
+    edit_result_cache_prune_interval: float = 300.0  # seconds between eviction sweeps
     # Server Configuration
     app_port: int = 8000
-    app_base_path: str = ""
+    app_base_path: str = ""  # prefix for the API routes and /videos
+    public_base_url: str = ""  # API base URL as clients reach it (same as VITE_API_BASE_URL); makes video URLs absolute
     environment: str = "development"  # "development" or "production"
     
     #API KEYS
     OPENAI_API_KEY: str = ""
 
+    # OpenAI HTTP client (shared keep-alive pool)
+    openai_base_url: str = "https://api.openai.com/v1"
+    openai_http2: bool = True
+    openai_max_connections: int = 50
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 30.0  # seconds
+    openai_connect_timeout: float = 10.0  # seconds
+    openai_vision_timeout: float = 120.0  # seconds, chat/completions read timeout
+    openai_image_edit_timeout: float = 300.0  # seconds, images/edits read timeout
+    openai_max_retries: int = 3  # retries on 429 / 5xx / transport errors
+    openai_retry_backoff_base: float = 1.0  # seconds, doubled per attempt
+    openai_retry_backoff_max: float = 20.0  # seconds
+
+    # Upstream model API governor (utils/rate_limiter.py), keyed "provider:model"
+    # with "provider:*" as fallback; rpm 0 = concurrency cap only. Match your account tier.
+    upstream_limits: dict[str, dict] = {
+        "openai:gpt-image-1": {"concurrency": 8, "rpm": 50},
+        "openai:*": {"concurrency": 16, "rpm": 500},
+        "google:models/veo-3.1-generate-preview": {"concurrency": 2, "rpm": 10},
+        "google:*": {"concurrency": 8, "rpm": 300},
+    }
+    upstream_queue_timeout: float = 120.0  # seconds a call may wait for a slot before 503
+
     # MongoDB Configuration
     mongodb_url: str = "mongodb://localhost:27017"
     database_name: str = "SDS_HDB"
@@ -47,7 +111,7 @@ class Settings(BaseSettings):
     allow_origins: list[str] = ["http://localhost:5173", "http://localhost:5174"]
     allow_credentials: bool = True
     allow_methods: list[str] = ["GET", "POST", "PUT", "DELETE", "PATCH"]
-    allow_headers: list[str] = ["Content-Type", "Authorization"]
+    allow_headers: list[str] = ["Content-Type", "Authorization", "Idempotency-Key"]
 
     # API Configuration
     api_title: str = "Backend API"
@@ -0,0 +1,39 @@
+"""
+Progress reporting for long-running pipeline calls.
+
+Core pipeline code calls `await report_progress(...)`; when the call runs inside
+a background job the job service installs a callback and the event is stored
+and streamed to the client. Outside a job it is a no-op.
+"""
+
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+ProgressCallback = Callable[[str, dict], Awaitable[None]]
+
+_progress_callback: ContextVar[Optional[ProgressCallback]] = ContextVar("progress_callback", default=None)
+
+
+def set_progress_callback(cb: Optional[ProgressCallback]):
+    """Install a callback for the current context; returns a token for reset."""
+    return _progress_callback.set(cb)
+
+
+def reset_progress_callback(token) -> None:
+    _progress_callback.reset(token)
+
+
+def progress_enabled() -> bool:
+    """True when someone is listening (lets callers skip work only needed for events)."""
+    return _progress_callback.get() is not None
+
+
+async def report_progress(event: str, **data) -> None:
+    cb = _progress_callback.get()
+    if cb is None:
+        return
+    try:
+        await cb(event, data)
+    except Exception as e:
+        # progress is best-effort; never fail the pipeline because of it
+        print(f"[progress] failed to report '{event}': {e}")
@@ -10,8 +10,14 @@ This module:
   Stage 3: Global blend / color harmony (very light touch)
 """
 
-from typing import List, Tuple, Dict, Optional
-from utils.ai_helper import gpt_vision_summarize, b64_to_data_url
+import threading
+import importlib.util
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple, Dict, Optional, Union
+from core.config import get_settings
+from utils.ai_helper import gpt_vision_summarize_async, b64_to_data_url
+from utils.cache_helper import DiskCache, make_cache_key, sha256_hex
+from utils.image_context import ImageContext
 
 
 # =========================
@@ -70,25 +76,69 @@ def _inject_species_hint(species_block: str, hint: Optional[str]) -> str:
     lines[insert_idx:insert_idx] = hint_block
     return "\n".join(lines)
 
-def build_style_and_species_blocks(
-    base_image_b64: str,
-    style_refs_b64: List[str],
-    plant_refs_b64: List[str],
+_ANALYSIS_CACHE: Optional[DiskCache] = None
+
+def _analysis_cache() -> DiskCache:
+    global _ANALYSIS_CACHE
+    if _ANALYSIS_CACHE is None:
+        _ANALYSIS_CACHE = DiskCache("vision_analysis")
+    return _ANALYSIS_CACHE
+
+def _analysis_cache_key(
+    base_image: ImageContext,
+    style_refs: List[ImageContext],
+    plant_refs: List[ImageContext],
+    species_hint: Optional[str],
+    vision_model: str,
+    max_tokens: int,
+) -> str:
+    """Key on decoded-image hashes (order matters) + everything else that shapes the answer."""
+    return make_cache_key(
+        base=base_image.sha256,
+        style=[c.sha256 for c in style_refs],
+        plants=[c.sha256 for c in plant_refs],
+        species_hint=(species_hint or "").strip(),
+        model=vision_model,
+        max_tokens=max_tokens,
+        system=sha256_hex(_STYLE_SYS_MSG),  # prompt edits invalidate old entries
+    )
+
+async def build_style_and_species_blocks(
+    base_image_b64: Union[str, ImageContext],
+    style_refs_b64: List[Union[str, ImageContext]],
+    plant_refs_b64: List[Union[str, ImageContext]],
     species_hint: Optional[str] = None,
     vision_model: str = "gpt-5.1",
-    max_tokens: int = 650
+    max_tokens: int = 650,
+    use_cache: bool = True,
 ) -> Tuple[str, str]:
     """
     Calls GPT-4o-mini (vision) to read the provided images and return two labeled blocks:
     [STYLE] and [PLANT_SPECIES].
+    Results are cached on disk by content hash of every input image plus the
+    hint/model/max_tokens, so re-rolls on identical inputs skip the vision call.
     """
+    base_image = ImageContext.ensure(base_image_b64)
+    assert base_image is not None
+    style_refs = [c for c in (ImageContext.ensure(b) for b in (style_refs_b64 or [])) if c is not None]
+    plant_refs = [c for c in (ImageContext.ensure(b) for b in (plant_refs_b64 or [])) if c is not None]
+
+    cache_key = None
+    if use_cache and get_settings().vision_cache_enabled:
+        cache_key = _analysis_cache_key(
+            base_image, style_refs, plant_refs, species_hint, vision_model, max_tokens
+        )
+        cached = _analysis_cache().get_json(cache_key)
+        if cached:
+            print(f"[vision] analysis cache hit {cache_key[:12]}")
+            return cached["style_block"], cached["species_block"]
 
     content: List[Dict] = []
 
     # Perspective (PRIMARY - sets hardscape layout)
     content += [
         {"type": "text", "text": "PERSPECTIVE IMAGE (PRIMARY - defines FIXED hardscape: buildings, planters, tiles, railings, paths):"},
-        {"type": "image_url", "image_url": {"url": b64_to_data_url(base_image_b64)}},
+        {"type": "image_url", "image_url": {"url": b64_to_data_url(base_image.b64)}},
         {"type": "text", "text": "This layout is LOCKED. All hardscape elements must be preserved exactly."},
     ]
 
@@ -98,22 +148,22 @@ def build_style_and_species_blocks(
             "text": f"TARGET SPECIES (strong hint, mandatory if plausible): {species_hint}"
         })
 
-    if style_refs_b64:
+    if style_refs:
         content.append({"type": "text", "text": "STYLE REFERENCES (SECONDARY - for mood/palette/texture ONLY, ignore their layouts/paths/structures):"})
-        for b in style_refs_b64:
-            content.append({"type": "image_url", "image_url": {"url": b64_to_data_url(b)}})
+        for c in style_refs:
+            content.append({"type": "image_url", "image_url": {"url": b64_to_data_url(c.b64)}})
 
-    if plant_refs_b64:
+    if plant_refs:
         content.append({"type": "text", "text": "PLANT REFERENCES (species morphology - same species, multiple angles):"})
-        for b in plant_refs_b64:
-            content.append({"type": "image_url", "image_url": {"url": b64_to_data_url(b)}})
+        for c in plant_refs:
+            content.append({"type": "image_url", "image_url": {"url": b64_to_data_url(c.b64)}})
 
     messages = [
         {"role": "system", "content": _STYLE_SYS_MSG},
         {"role": "user", "content": content},
     ]
 
-    raw = gpt_vision_summarize(messages, model=vision_model, max_tokens=max_tokens)
+    raw = await gpt_vision_summarize_async(messages, model=vision_model, max_tokens=max_tokens)
     # Expect raw to contain [STYLE] ... [PLANT_SPECIES] ...
     low = raw.lower()
     i_style = low.find("[style]")
@@ -136,6 +186,12 @@ def build_style_and_species_blocks(
 
     species_block = _inject_species_hint(species_block, species_hint)
 
+    if cache_key:
+        try:
+            _analysis_cache().put_json(cache_key, {"style_block": style_block, "species_block": species_block})
+        except OSError as e:
+            print(f"[vision] could not write analysis cache: {e}")
+
     return style_block, species_block
 
 
@@ -143,27 +199,26 @@ def build_style_and_species_blocks(
 # User prompts stitching
 # =========================
 
+# Global mandatory rules (ALWAYS ADDED), joined once
+_GLOBAL_RULES_BLOCK = "\n".join([
+    "CRITICAL GLOBAL RULES:",
+    "- Only add plants inside the provided mask.",
+    "- Do NOT modify sky, buildings, tiles, benches, railings, or walls.",
+    "- Preserve original lighting, shadows, perspective, and color temperature.",
+    "- Photorealistic, natural textures.",
+    "",
+])
+
 def render_user_prompts(items: List[dict]) -> str:
     if not items:
-        items = []
-
-    lines = []
-
-    # Global mandatory rules (ALWAYS ADDED)
-    lines.append("CRITICAL GLOBAL RULES:")
-    lines.append("- Only add plants inside the provided mask.")
-    lines.append("- Do NOT modify sky, buildings, tiles, benches, railings, or walls.")
-    lines.append("- Preserve original lighting, shadows, perspective, and color temperature.")
-    lines.append("- Photorealistic, natural textures.")
-    lines.append("")
+        return _GLOBAL_RULES_BLOCK
 
     # User instructions
-    if items:
-        lines.append("User additional instructions:")
-        for it in items:
-            txt = (it.get("text") or "").strip()
-            if txt:
-                lines.append(f"- {txt}")
+    lines = [_GLOBAL_RULES_BLOCK, "User additional instructions:"]
+    for it in items:
+        txt = (it.get("text") or "").strip()
+        if txt:
+            lines.append(f"- {txt}")
 
     return "\n".join(lines)
 
@@ -274,6 +329,314 @@ def _style_heading() -> str:
 def _species_heading() -> str:
     return "SPECIES (must be clearly recognizable from plant references):"
 
+def species_lock_block(species_block: str) -> str:
+    return (
+        "CLIMATE & SPECIES LOCK (Singapore tropical conditions):\n"
+        "- Use ONLY the species/morphology in [PLANT_SPECIES].\n"
+    )
+
+
+# =========================
+# Template registry
+# =========================
+
+_TOKENIZER = None  # tiktoken encoding, False when unavailable
+_TOKENIZER_LOCK = threading.Lock()
+
+def load_tokenizer():
+    """
+    Load the tiktoken encoding (o200k_base, the GPT-4o/5/image family) once.
+    The first load may fetch encoding files, so server startup calls this
+    off the event loop rather than leaving it to the first render.
+    """
+    global _TOKENIZER
+    if _TOKENIZER is not None:
+        return _TOKENIZER
+    with _TOKENIZER_LOCK:
+        if _TOKENIZER is None:
+            encoding = False
+            if importlib.util.find_spec("tiktoken") is not None:
+                try:
+                    import tiktoken
+                    encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:  # encoding files are fetched on first use
+                    print(f"[prompts] tiktoken unavailable, estimating tokens: {e}")
+            _TOKENIZER = encoding
+    return _TOKENIZER
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with tiktoken when installed; otherwise the usual ~4
+    characters per token estimate.
+    """
+    tokenizer = load_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text))
+    return (len(text) + 3) // 4
+
+@lru_cache(maxsize=256)
+def _slot_tokens(text: str) -> int:
+    # the same style/species blocks fill every stage and variant of a request
+    return count_tokens(text)
+
+
+class Slot:
+    """Per-call value inside a PromptTemplate; a None value drops the part."""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class RenderedPrompt(NamedTuple):
+    template: str
+    revision: str
+    text: str
+    tokens: int  # static_tokens + slot tokens; BPE merges across joins are ignored
+
+    @property
+    def sha256(self) -> str:
+        """Cache / dedupe key for the final prompt (hashed on demand)."""
+        return sha256_hex(self.text)
+
+
+class PromptTemplate:
+    """
+    Parts joined with newlines, exactly like the hand-written "\n".join(parts)
+    composers. Runs of static parts are joined once here, so a render only
+    joins the per-call slots around a few precompiled sections.
+    `revision` changes whenever any static text or slot layout changes.
+    """
+
+    def __init__(self, name: str, parts: List[Union[str, Slot]]):
+        self.name = name
+        self.parts = list(parts)
+        self._compiled: List[Union[str, Slot]] = []
+        static: List[str] = []
+        for part in self.parts:
+            if isinstance(part, Slot):
+                if static:
+                    self._compiled.append("\n".join(static))
+                    static = []
+                self._compiled.append(part)
+            else:
+                static.append(part)
+        if static:
+            self._compiled.append("\n".join(static))
+
+        layout = [p if isinstance(p, str) else {"slot": p.name} for p in self.parts]
+        self.revision = make_cache_key(template=name, parts=layout)[:12]
+        self.slots = [p.name for p in self.parts if isinstance(p, Slot)]
+        self._static_tokens: Optional[int] = None
+
+        self._lock = threading.Lock()
+        self._renders = 0
+        self._tokens_total = 0
+        self._tokens_max = 0
+
+    def text(self, **values: Optional[str]) -> str:
+        pieces = [p if isinstance(p, str) else values[p.name] for p in self._compiled]
+        return "\n".join(p for p in pieces if p is not None)
+
+    @property
+    def static_tokens(self) -> int:
+        """Tokens in the static text, counted once (lazily, so import stays cheap)."""
+        if self._static_tokens is None:
+            self._static_tokens = count_tokens("\n".join(p for p in self.parts if isinstance(p, str)))
+        return self._static_tokens
+
+    def render(self, **values: Optional[str]) -> RenderedPrompt:
+        """
+        Only the per-call slot values are tokenised; the static text is
+        counted once per template.
+        """
+        text = self.text(**values)
+        tokens = self.static_tokens + sum(_slot_tokens(values[name]) for name in self.slots if values[name])
+        with self._lock:
+            self._renders += 1
+            self._tokens_total += tokens
+            self._tokens_max = max(self._tokens_max, tokens)
+        return RenderedPrompt(self.name, self.revision, text, tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "revision": self.revision,
+                "slots": self.slots,
+                "static_chars": sum(len(p) for p in self.parts if isinstance(p, str)),
+                "static_tokens": self.static_tokens,
+                "renders": self._renders,
+                "avg_tokens": round(self._tokens_total / self._renders, 1) if self._renders else 0.0,
+                "max_tokens": self._tokens_max,
+            }
+
+
+PROMPT_TEMPLATES: Dict[str, PromptTemplate] = {}
+
+def register_template(name: str, parts: List[Union[str, Slot]]) -> PromptTemplate:
+    template = PromptTemplate(name, parts)
+    PROMPT_TEMPLATES[name] = template
+    return template
+
+def render_prompt(name: str, **values: Optional[str]) -> RenderedPrompt:
+    return PROMPT_TEMPLATES[name].render(**values)
+
+def prompt_template_stats() -> Dict[str, dict]:
+    return {name: t.stats() for name, t in PROMPT_TEMPLATES.items()}
+
+
+def _or_placeholder(block: str, placeholder: str) -> str:
+    return block or placeholder
+
+def _user_tail(user_block: str) -> Optional[str]:
+    """Optional trailing user block, separated by a blank line."""
+    return "\n" + user_block if user_block.strip() else None
+
+
+register_template("stage1", [
+    "STAGE 1 — LAYOUT & CONTEXTUAL INSERTION (PLANT-ONLY)",
+
+    # NEW: Perspective understanding FIRST
+    "PERSPECTIVE UNDERSTANDING:",
+    _SHARED_PERSPECTIVE_ANALYSIS,
+    "",
+
+    _SHARED_COMMON_KNOWN,
+    "",
+
+    # HARD GEOMETRY LOCK (keep your existing block)
+    _SHARED_HARDSCAPE_RULES,
+    "",
+
+    # FORM & SHAPE CONTROL
+    "PLANT FORM RULES:",
+    _SHARED_FORM_RULES,
+    "",
+
+    # CLIMATE RULES
+    "CLIMATE RULES:",
+    _SHARED_CLIMATE_RULES,
+    "",
+
+    # PROHIBITIONS (negative behaviours to avoid)
+    "PROHIBITIONS:",
+    _SHARED_PROHIBITIONS,
+    "",
+
+    # YOUR EXISTING ZONE RULES (still okay)
+    _SHARED_PLANTING_ZONE_RULES,
+    "",
+
+    _MASK_RULES_BLOCK,
+    "",
+
+    # STYLE BLOCK (but demoted to vibe-only)
+    _style_heading(),
+    "STYLE INSTRUCTION — USE FOR MOOD/PALETTE ONLY (NOT LAYOUT):",
+    Slot("style"),
+    "",
+
+    # SPECIES BLOCK
+    _species_heading(),
+    Slot("species"),
+    species_lock_block(""),
+    "",
+
+    # VISUAL QUALITY (optional to keep)
+    _SHARED_INTEGRATION_RULES,
+    Slot("user_tail"),
+])
+
+register_template("stage2", [
+    "STAGE 2 — SPECIES ACCURACY REFINEMENT (masked near bases/crowns)",
+    _SHARED_HARDSCAPE_RULES,
+    "- Maintain strict separation between newly inserted plants and existing clipped hedges/topiary; no silhouette merging.\n",
+    "",
+    _species_heading(),
+    Slot("species"),
+    "- Enforce correct anatomy (crownshaft/trunk/fronds/leaf texture/colour) to match references precisely.\n"
+    "- Correct any distortions in shape, color, or scale from Stage 1.",
+    species_lock_block(""),
+    "",
+    _style_heading(),
+    Slot("style"),
+    "- Keep the clean visualization style: readable structure, realistic but slightly idealized.",
+    "",
+    _SHARED_INTEGRATION_RULES,
+    "- Do NOT change overall layout; only refine the selected plant regions.",
+    Slot("user_tail"),
+])
+
+register_template("stage3", [
+    "SINGLE PASS — CONTEXTUAL PLANT INSERTION (PLANT-ONLY EDIT)",
+
+    # 1) Hardscape lock
+    _SHARED_HARDSCAPE_RULES,
+    "",
+
+    # 2) Shape/placement discipline
+    "PLANT FORM RULES:",
+    _SHARED_FORM_RULES,
+    "",
+
+    # 3) Singapore climate suitability
+    "CLIMATE RULES:",
+    _SHARED_CLIMATE_RULES,
+    "",
+
+    # 4) Prohibitions (acts like a negative prompt)
+    _SHARED_PROHIBITIONS,
+    "",
+
+    # 5) Species notes from vision (dynamic, not hardcoded)
+    "SPECIES NOTES (from plant references):",
+    Slot("species"),
+    "",
+
+    # 6) Style limited to 'vibe only'
+    "STYLE RULES:",
+    _SHARED_STYLE_CONTEXT_RULES,
+    Slot("style"),
+    "",
+
+    # 7) User extras
+    "USER REQUESTS:",
+    Slot("user"),
+])
+
+register_template("single_pass", [
+    "SINGLE PASS — CONTEXTUAL PLANT INSERTION (PLANT-ONLY EDIT)",
+
+    # 1) Hardscape lock
+    _SHARED_HARDSCAPE_RULES,
+    "",
+
+    # 2) Shape/placement discipline
+    "PLANT FORM RULES:",
+    _SHARED_FORM_RULES,
+    "",
+
+    # 3) Singapore climate suitability
+    "CLIMATE RULES:",
+    _SHARED_CLIMATE_RULES,
+    "",
+
+    # 4) Species block extracted from vision (still dynamic)
+    "SPECIES NOTES (from plant references):",
+    Slot("species"),
+    "",
+
+    # 5) Style limited to 'vibe only'
+    "STYLE RULES:",
+    _SHARED_STYLE_CONTEXT_RULES,
+    Slot("style"),
+    "",
+
+    # 6) User extras
+    "USER REQUESTS:",
+    Slot("user"),
+])
+
 
 # =========================
 # Stage-specific prompt composers
@@ -288,63 +651,12 @@ def compose_stage1_prompt(
     Stage 1: Layout + placement + canopy freedom.
     (Upgraded with deeper perspective analysis + Singapore climate + shape constraints)
     """
-    parts = [
-        "STAGE 1 — LAYOUT & CONTEXTUAL INSERTION (PLANT-ONLY)",
-
-        # NEW: Perspective understanding FIRST
-        "PERSPECTIVE UNDERSTANDING:",
-        _SHARED_PERSPECTIVE_ANALYSIS,
-        "",
-
-        _SHARED_COMMON_KNOWN,
-        "",
-
-        # HARD GEOMETRY LOCK (keep your existing block)
-        _SHARED_HARDSCAPE_RULES,
-        "",
-
-        # FORM & SHAPE CONTROL
-        "PLANT FORM RULES:",
-        _SHARED_FORM_RULES,
-        "",
-
-        # CLIMATE RULES
-        "CLIMATE RULES:",
-        _SHARED_CLIMATE_RULES,
-        "",
-
-        # PROHIBITIONS (negative behaviours to avoid)
-        "PROHIBITIONS:",
-        _SHARED_PROHIBITIONS,
-        "",
-
-        # YOUR EXISTING ZONE RULES (still okay)
-        _SHARED_PLANTING_ZONE_RULES,
-        "",
-
-        _MASK_RULES_BLOCK,
-        "",
-
-        # STYLE BLOCK (but demoted to vibe-only)
-        _style_heading(),
-        "STYLE INSTRUCTION — USE FOR MOOD/PALETTE ONLY (NOT LAYOUT):",
-        (style_block or "(no style extracted)"),
-        "",
-
-        # SPECIES BLOCK
-        _species_heading(),
-        (species_block or "(no species extracted)"),
-        species_lock_block(species_block),
-        "",
-
-        # VISUAL QUALITY (optional to keep)
-        _SHARED_INTEGRATION_RULES,
-    ]
-
-    if user_block.strip():
-        parts += ["", user_block]
-
-    return "\n".join(parts)
+    return render_prompt(
+        "stage1",
+        style=_or_placeholder(style_block, "(no style extracted)"),
+        species=_or_placeholder(species_block, "(no species extracted)"),
+        user_tail=_user_tail(user_block),
+    ).text
 
 
 def compose_stage2_prompt(
@@ -356,27 +668,12 @@ def compose_stage2_prompt(
     Stage 2: Species-accurate refinement (masked around trunks/new plants).
     Use HARD mask (or a local brush mask) for strict refinement.
     """
-    parts = [
-        "STAGE 2 — SPECIES ACCURACY REFINEMENT (masked near bases/crowns)",
-        _SHARED_HARDSCAPE_RULES,
-        "- Maintain strict separation between newly inserted plants and existing clipped hedges/topiary; no silhouette merging.\n",
-        "",
-        _species_heading(),
-        (species_block or "(no species extracted)") + "\n"
-        "- Enforce correct anatomy (crownshaft/trunk/fronds/leaf texture/colour) to match references precisely.\n"
-        "- Correct any distortions in shape, color, or scale from Stage 1.",
-        species_lock_block(species_block),
-        "",
-        _style_heading(),
-        (style_block or "(no style extracted)") + "\n"
-        "- Keep the clean visualization style: readable structure, realistic but slightly idealized.",
-        "",
-        _SHARED_INTEGRATION_RULES,
-        "- Do NOT change overall layout; only refine the selected plant regions.",
-    ]
-    if user_block.strip():
-        parts += ["", user_block]
-    return "\n".join(parts)
+    return render_prompt(
+        "stage2",
+        style=_or_placeholder(style_block, "(no style extracted)"),
+        species=_or_placeholder(species_block, "(no species extracted)"),
+        user_tail=_user_tail(user_block),
+    ).text
 
 
 def compose_stage3_prompt(
@@ -388,43 +685,12 @@ def compose_stage3_prompt(
     Single-pass generation — geometry → form → climate → prohibitions → species → style.
     Plant-only edit; no new hardscape.
     """
-    parts = [
-        "SINGLE PASS — CONTEXTUAL PLANT INSERTION (PLANT-ONLY EDIT)",
-
-        # 1) Hardscape lock
-        _SHARED_HARDSCAPE_RULES,
-        "",
-
-        # 2) Shape/placement discipline
-        "PLANT FORM RULES:",
-        _SHARED_FORM_RULES,
-        "",
-
-        # 3) Singapore climate suitability
-        "CLIMATE RULES:",
-        _SHARED_CLIMATE_RULES,
-        "",
-
-        # 4) Prohibitions (acts like a negative prompt)
-        _SHARED_PROHIBITIONS,
-        "",
-
-        # 5) Species notes from vision (dynamic, not hardcoded)
-        "SPECIES NOTES (from plant references):",
-        (species_block or "(no species extracted)"),
-        "",
-
-        # 6) Style limited to 'vibe only'
-        "STYLE RULES:",
-        _SHARED_STYLE_CONTEXT_RULES,
-        (style_block or "(no style extracted)"),
-        "",
-
-        # 7) User extras
-        "USER REQUESTS:",
-        (user_block or "(none)"),
-    ]
-    return "\n".join(parts)
+    return render_prompt(
+        "stage3",
+        style=_or_placeholder(style_block, "(no style extracted)"),
+        species=_or_placeholder(species_block, "(no species extracted)"),
+        user=_or_placeholder(user_block, "(none)"),
+    ).text
 
 
 # =========================
@@ -440,43 +706,9 @@ def compose_single_pass_prompt(
     Single-pass generation — geometry → form → climate → species → style.
     Plant-only edit; no new hardscape.
     """
-    parts = [
-        "SINGLE PASS — CONTEXTUAL PLANT INSERTION (PLANT-ONLY EDIT)",
-
-        # 1) Hardscape lock
-        _SHARED_HARDSCAPE_RULES,
-        "",
-
-        # 2) Shape/placement discipline
-        "PLANT FORM RULES:",
-        _SHARED_FORM_RULES,
-        "",
-
-        # 3) Singapore climate suitability
-        "CLIMATE RULES:",
-        _SHARED_CLIMATE_RULES,
-        "",
-
-        # 4) Species block extracted from vision (still dynamic)
-        "SPECIES NOTES (from plant references):",
-        (species_block or "(no species extracted)"),
-        "",
-
-        # 5) Style limited to 'vibe only'
-        "STYLE RULES:",
-        _SHARED_STYLE_CONTEXT_RULES,
-        (style_block or "(no style extracted)"),
-        "",
-
-        # 6) User extras
-        "USER REQUESTS:",
-        (user_block or "(none)"),
-    ]
-    return "\n".join(parts)
-
-
-def species_lock_block(species_block: str) -> str:
-    return (
-        "CLIMATE & SPECIES LOCK (Singapore tropical conditions):\n"
-        "- Use ONLY the species/morphology in [PLANT_SPECIES].\n"
-    )
+    return render_prompt(
+        "single_pass",
+        style=_or_placeholder(style_block, "(no style extracted)"),
+        species=_or_placeholder(species_block, "(no species extracted)"),
+        user=_or_placeholder(user_block, "(none)"),
+    ).text
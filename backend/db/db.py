@@ -5,6 +5,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from models.user_model import User
 from models.project_model import Project
 from models.canvas_model import Canvas
+from models.ai_job_model import AIJob
+from models.video_job_model import VideoJob
 
 from core.config import get_settings
 
@@ -15,6 +17,8 @@ document_models = [
     User,
     Project,
     Canvas,
+    AIJob,
+    VideoJob,
     ]
 
 #Connection functions
@@ -47,5 +51,7 @@ class DB:
     User = User
     Project = Project
     Canvas = Canvas
+    AIJob = AIJob
+    VideoJob = VideoJob
     
 db = DB()
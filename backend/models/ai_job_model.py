@@ -0,0 +1,22 @@
+from beanie import Document
+from pydantic import Field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+class AIJob(Document):
+    kind: str  # e.g. "generate_all_smart", "stage1", "edit_lasso"
+    status: str = "queued"  # queued | running | succeeded | failed
+    user_id: Optional[str] = None
+    webhook_url: Optional[str] = None
+    events: List[dict] = []  # progress events, replayed over SSE
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    lease_owner: Optional[str] = None  # process holding the (in-memory) payload
+    lease_expires_at: Optional[datetime] = None  # renewed by the owner while it is alive
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Settings:
+        name = "tbl_ai_job"
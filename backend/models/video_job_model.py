@@ -0,0 +1,34 @@
+from beanie import Document
+from pydantic import Field
+from datetime import datetime, timezone
+from typing import Optional
+
+class VideoJob(Document):
+    """
+    Durable Veo growth-video generation. Inputs are stored as uploaded-image
+    handles and the Veo operation name is saved as soon as it exists, so any
+    worker can pick the job up again (by lease) after a restart.
+    """
+    status: str = "queued"  # queued | juvenile | generating | succeeded | failed
+    user_id: Optional[str] = None
+    batch_id: Optional[str] = None  # set for jobs submitted together via /video/batches
+    prompt: Optional[str] = None
+    model: str
+    inputs_hash: str  # sha256 over mature image + prompt + model
+    mature_image: str  # "img:<sha256>" handle
+    mature_mime: str = "image/jpeg"
+    juvenile_image: Optional[str] = None  # handle, once generated
+    operation_name: Optional[str] = None
+    operation_started_at: Optional[datetime] = None
+    video_file: Optional[str] = None  # file name under video_storage_dir
+    error: Optional[str] = None
+    attempts: int = 0
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Settings:
+        name = "tbl_video_job"
@@ -0,0 +1,98 @@
+# repository/ai_job_repository.py
+from models.ai_job_model import AIJob
+from bson.objectid import ObjectId
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+
+UNFINISHED_STATUSES = ["queued", "running"]
+
+class AIJobRepository:
+
+    @staticmethod
+    async def create_job(
+        kind: str,
+        user_id: Optional[str],
+        webhook_url: Optional[str] = None,
+        owner: Optional[str] = None,
+        lease_seconds: float = 60.0,
+    ) -> AIJob:
+        try:
+            job = AIJob(
+                kind=kind,
+                user_id=user_id,
+                webhook_url=webhook_url,
+                lease_owner=owner,
+                lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=lease_seconds),
+            )
+            await job.insert()
+            return job
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def get_job_by_id(job_id: str) -> Optional[AIJob]:
+        try:
+            if not ObjectId.is_valid(job_id):
+                return None
+            return await AIJob.get(ObjectId(job_id))
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def update_job(job: AIJob, **fields) -> AIJob:
+        """
+        Targeted $set of the given fields. The in-memory document only changes
+        once the write succeeded, so a rejected write (e.g. too large) never
+        leaks into later saves.
+        """
+        try:
+            fields["updated_at"] = datetime.now(timezone.utc)
+            await AIJob.find_one({"_id": job.id}).update({"$set": fields})
+            for key, value in fields.items():
+                setattr(job, key, value)
+            return job
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def append_event(job: AIJob, event: dict) -> AIJob:
+        try:
+            now = datetime.now(timezone.utc)
+            await AIJob.find_one({"_id": job.id}).update({"$push": {"events": event}, "$set": {"updated_at": now}})
+            job.events.append(event)
+            job.updated_at = now
+            return job
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def renew_leases(owner: str, lease_seconds: float) -> None:
+        """Extend the lease on every unfinished job this process holds."""
+        try:
+            await AIJob.find({"lease_owner": owner, "status": {"$in": UNFINISHED_STATUSES}}).update(
+                {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)}}
+            )
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def fail_unfinished_jobs(error: str, owner: Optional[str] = None) -> None:
+        """
+        Fail unfinished jobs that can no longer complete: those of `owner`, or
+        (owner=None) those whose owner stopped renewing its lease.
+        """
+        try:
+            now = datetime.now(timezone.utc)
+            query: dict = {"status": {"$in": UNFINISHED_STATUSES}}
+            if owner is not None:
+                query["lease_owner"] = owner
+            else:
+                query["$or"] = [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]
+            await AIJob.find(query).update(
+                {
+                    "$set": {"status": "failed", "error": error, "finished_at": now, "updated_at": now},
+                    "$push": {"events": {"type": "status", "at": now.isoformat(), "status": "failed", "error": error}},
+                }
+            )
+        except Exception as e:
+            raise e
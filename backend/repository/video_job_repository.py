@@ -0,0 +1,111 @@
+# repository/video_job_repository.py
+from models.video_job_model import VideoJob
+from beanie import UpdateResponse
+from bson.objectid import ObjectId
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+
+UNFINISHED_STATUSES = ["queued", "juvenile", "generating"]
+
+
+class LeaseLostError(Exception):
+    """Another worker took the job over (our lease expired)."""
+
+
+class VideoJobRepository:
+
+    @staticmethod
+    async def create_job(**fields) -> VideoJob:
+        try:
+            job = VideoJob(**fields)
+            await job.insert()
+            return job
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def get_job_by_id(job_id: str) -> Optional[VideoJob]:
+        try:
+            if not ObjectId.is_valid(job_id):
+                return None
+            return await VideoJob.get(ObjectId(job_id))
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def get_jobs_by_batch(batch_id: str) -> List[VideoJob]:
+        try:
+            return await VideoJob.find({"batch_id": batch_id}).sort("created_at").to_list()
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def update_job(job: VideoJob, owner: Optional[str] = None, **fields) -> VideoJob:
+        """
+        Targeted $set of the given fields. With owner, the write only applies
+        while we still hold the lease and raises LeaseLostError otherwise, so a
+        worker that lost its job cannot overwrite the one that took it over.
+        """
+        try:
+            fields["updated_at"] = datetime.now(timezone.utc)
+            query = {"_id": job.id}
+            if owner is not None:
+                query["lease_owner"] = owner
+            result = await VideoJob.find_one(query).update({"$set": fields})
+            if owner is not None and not getattr(result, "matched_count", 0):
+                raise LeaseLostError(f"Lease on video job {job.id} is no longer held by {owner}")
+            for key, value in fields.items():
+                setattr(job, key, value)
+            return job
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def claim_next(owner: str, lease_seconds: float) -> Optional[VideoJob]:
+        """
+        Atomically take an unfinished job whose lease is free or expired
+        (its worker died or was redeployed). Returns None when nothing is runnable.
+        """
+        try:
+            now = datetime.now(timezone.utc)
+            return await VideoJob.find_one(
+                {
+                    "status": {"$in": UNFINISHED_STATUSES},
+                    "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}],
+                }
+            ).update(
+                {
+                    "$set": {
+                        "lease_owner": owner,
+                        "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                        "updated_at": now,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                response_type=UpdateResponse.NEW_DOCUMENT,
+            )
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def renew_lease(job_id, owner: str, lease_seconds: float) -> Optional[datetime]:
+        """Extend our lease; returns the new expiry, or None if the job is no longer ours."""
+        try:
+            expires = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+            result = await VideoJob.find_one({"_id": job_id, "lease_owner": owner}).update(
+                {"$set": {"lease_expires_at": expires}}
+            )
+            return expires if result and getattr(result, "modified_count", 0) else None
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def release_lease(job_id, owner: str, undo_attempt: bool = False) -> None:
+        """Hand a job back (shutdown / provider busy) so the next poll can resume it."""
+        try:
+            update = {"$set": {"lease_owner": None, "lease_expires_at": None}}
+            if undo_attempt:
+                update["$inc"] = {"attempts": -1}
+            await VideoJob.find_one({"_id": job_id, "lease_owner": owner}).update(update)
+        except Exception as e:
+            raise e
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    events: List[dict] = []
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -1,9 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class PreviewMaskBody(BaseModel):
     base_image_b64: str
     green_overlay_b64: str  
+    preview_format: Optional[str] = None  # "png" | "webp" | "jpeg" (default: settings.preview_format)
+    preview_max_side: Optional[int] = None  # render the preview downscaled (masks stay native)
     
 class PromptItem(BaseModel):
     text: str
@@ -17,6 +19,13 @@ class AnalyzeBody(BaseModel):
     plant_refs_b64: List[str] = []
 
 
+class PostprocessOptions(BaseModel):
+    """Opt-in local post-processing of a stage result (runs at base resolution)."""
+    clamp: bool = True  # keep every pixel outside the mask identical to the input
+    color_match: bool = True  # LAB tone match of the edit back to the input photo
+    feather_px: float = 2.0  # inward feather of the mask edge when clamping
+
+
 class Stage1Body(BaseModel):
     base_image_b64: str
     style_block: str
@@ -24,6 +33,7 @@ class Stage1Body(BaseModel):
     user_prompts: List[PromptItem] = []
     green_overlay_b64: Optional[str] = None
     size: str = "1024x1024"
+    postprocess: Optional[PostprocessOptions] = None
 
 
 class Stage2Body(BaseModel):
@@ -34,6 +44,7 @@ class Stage2Body(BaseModel):
     green_overlay_b64: Optional[str] = None
     refine_mask_b64: Optional[str] = None
     size: str = "1024x1024"
+    postprocess: Optional[PostprocessOptions] = None
 
 
 class Stage3Body(BaseModel):
@@ -44,6 +55,7 @@ class Stage3Body(BaseModel):
     size: str = "1024x1024"
     use_soft_mask: bool = False
     green_overlay_b64: Optional[str] = None
+    postprocess: Optional[PostprocessOptions] = None
 
 
 class GenerateAllSmartBody(BaseModel):
@@ -58,6 +70,12 @@ class GenerateAllSmartBody(BaseModel):
     green_overlay_b64: Optional[str] = None
     size: str = "1024x1024"
     stage3_use_soft_mask: bool = False
+    # best-of-N: run stage 1 N times concurrently (capped by max_generation_variants)
+    variants: int = 1
+    rank_variants: bool = False  # order variants by mask adherence, best first
+    # 1 = stage 1 only (default); 2/3 chain stage 2 / stage 3 server-side
+    run_stages: int = Field(1, ge=1, le=3)
+    postprocess: Optional[PostprocessOptions] = None  # applied to every stage that runs
     
     # Optional fields for regeneration
     selectedPlants: List[str] = []
@@ -66,6 +84,12 @@ class GenerateAllSmartBody(BaseModel):
     regenerationPrompt: Optional[str] = None
 
 
+class ColorZone(BaseModel):
+    name: str
+    color: str  # "#RRGGBB" paint colour used for this zone on the overlay
+    tolerance: int = 60  # max RGB distance from `color`
+
+
 class MaskFromGreenBody(BaseModel):
     green_overlay_b64: str
     base_image_b64: Optional[str] = None
@@ -74,6 +98,8 @@ class MaskFromGreenBody(BaseModel):
     canopy_grow_px_up: int = 80
     canopy_grow_px_radial: int = 12
     down_grow_px_limit: int = 8
+    # optional multi-zone overlay: one hard/soft mask pair per colour
+    zones: Optional[List[ColorZone]] = None
 
 
 class DragPlaceBody(BaseModel):
@@ -100,3 +126,19 @@ class EditLassoReq(BaseModel):
     mask_b64: str
     prompt: Optional[str] = None
     size: Optional[str] = None
+
+
+class ImageUploadB64Body(BaseModel):
+    image_b64: str  # raw base64 or data URL
+
+
+class ImageHandleResponse(BaseModel):
+    """
+    Send `handle` instead of base64 in any AI request image field
+    (base_image_b64, perspectiveImages, style/plant refs, masks, overlays).
+    """
+    handle: str
+    sha256: str
+    bytes: int
+    width: int
+    height: int
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
 
 
 class GenerateVideoBody(BaseModel):
@@ -20,6 +21,42 @@ class GenerateVideoResponse(BaseModel):
     """Schema for video generation response"""
     success: bool
     message: str
-    video_data: str  # Base64 video data for immediate frontend rendering
-    video_uri: str  # URI pointer for retrieval
+    video_url: str  # served from /videos (supports Range requests for seeking)
     filename: str
+
+
+class VideoJobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+
+class VideoJobResponse(BaseModel):
+    id: str
+    status: str  # queued | juvenile | generating | succeeded | failed
+    inputs_hash: str
+    operation_name: Optional[str] = None
+    video_url: Optional[str] = None  # set once succeeded
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class GenerateVideoBatchBody(BaseModel):
+    """Several designs submitted as one batch of durable jobs"""
+    designs: List[GenerateVideoBody] = Field(..., min_length=1)
+
+
+class VideoBatchSubmitResponse(BaseModel):
+    batch_id: str
+    job_ids: List[str]
+    status_url: str
+
+
+class VideoBatchResponse(BaseModel):
+    batch_id: str
+    status: str  # running | succeeded | failed | partial
+    jobs: List[VideoJobResponse]
@@ -1,4 +1,5 @@
 import os 
+import asyncio
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
@@ -8,8 +9,14 @@ import logging
 
 from services.RAG_service import init_chroma
 from core.config import get_settings
+from core.prompts import load_tokenizer
 from db.db import connect_to_db, close_db_connection
 from routes.main_router import main_router 
+from utils.http_client import close_http_client
+from utils.cpu_executor import shutdown_cpu_executor
+from utils.video_store import VIDEO_URL_PREFIX, VideoStaticFiles, video_dir
+from services.ai_job_service import AIJobService
+from services.video_job_service import VideoJobService
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,6 +24,7 @@ logger = logging.getLogger(__name__)
 env = get_settings().environment
 PORT = get_settings().app_port
 CANVAS_ASSET_DIR = get_settings().canvas_asset_dir
+BASE_PATH = get_settings().app_base_path.rstrip("/")
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
@@ -32,10 +40,22 @@ async def lifespan(_app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to initialize ChromaDB: {e}")
         # Don't fail startup - endpoints will handle missing DB
+
+    # Load the prompt tokenizer now (may fetch encoding files) instead of on the first request
+    await asyncio.to_thread(load_tokenizer)
+
+    # Start background workers for long-running AI jobs
+    await AIJobService.start_workers()
+    # Resume durable video jobs (including in-flight Veo operations)
+    await VideoJobService.start_poller()
     
     yield
     
     # Cleanup
+    await VideoJobService.stop_poller()
+    await AIJobService.stop_workers()
+    await close_http_client()
+    shutdown_cpu_executor()
     await close_db_connection()
     
 app = FastAPI(lifespan=lifespan, redirect_slashes=False)
@@ -55,7 +75,10 @@ canvas_assets_path.mkdir(parents=True, exist_ok=True)
 
 app.mount("/canvas-assets", StaticFiles(directory=CANVAS_ASSET_DIR), name="canvas_assets")
 
-app.include_router(main_router)
+# Generated videos, content-hashed; Range requests make playback seekable
+app.mount(f"{BASE_PATH}{VIDEO_URL_PREFIX}", VideoStaticFiles(directory=video_dir()), name="videos")
+
+app.include_router(main_router, prefix=BASE_PATH)
 
 # Health check endpoint
 @app.get("/health")
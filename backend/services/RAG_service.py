@@ -10,11 +10,12 @@ from langchain_core.documents import Document
 from langchain_core.messages import SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_huggingface import HuggingFaceEmbeddings
 
 from core.config import get_settings
+from utils.rate_limiter import get_governor
 
 settings = get_settings()
 
@@ -246,6 +247,12 @@ CHAT_TEMPLATE = ChatPromptTemplate.from_messages([
 ])
 
 
+def _invoke_chat_model(prompt_value):
+    """Gemini call through the shared upstream governor (held only for the LLM step)."""
+    with get_governor("google", settings.rag_chat_model).slot_sync():
+        return get_chat_model().invoke(prompt_value)
+
+
 def make_rag_chain(k: int | None = None):
     """Create RAG chain: retriever -> prompt -> LLM -> parser"""
     if k is None:
@@ -260,7 +267,7 @@ def make_rag_chain(k: int | None = None):
             "question": RunnablePassthrough(),
         }
         | CHAT_TEMPLATE
-        | get_chat_model()
+        | RunnableLambda(_invoke_chat_model)
         | output_parser
     )
 
@@ -318,12 +325,13 @@ def generate_plant_image(botanical_name: str, size: int = 1024) -> str:
     client = get_openai_client()
     prompt = build_image_prompt(botanical_name)
     
-    response = client.images.generate(
-        model="gpt-image-1",
-        prompt=prompt,
-        size="1024x1024",  # Fixed to literal string
-        n=1,
-    )
+    with get_governor("openai", "gpt-image-1").slot_sync():
+        response = client.images.generate(
+            model="gpt-image-1",
+            prompt=prompt,
+            size="1024x1024",  # Fixed to literal string
+            n=1,
+        )
     
     # Validate response
     if not response.data or len(response.data) == 0:
@@ -0,0 +1,292 @@
+import os
+import json
+import uuid
+import socket
+import base64
+import asyncio
+import binascii
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from core.config import get_settings
+from core.progress import set_progress_callback, reset_progress_callback
+from models.ai_job_model import AIJob
+from repository.ai_job_repository import AIJobRepository
+from services.ai_service import AIService
+from utils.rate_limiter import set_current_user, reset_current_user
+from utils.ai_helper import get_idempotency_key, set_idempotency_key, reset_idempotency_key
+from utils.cpu_executor import run_cpu
+from utils.image_store import is_handle, put_image
+from utils.webhook import send_webhook, validate_webhook_url
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue is saturated; surfaced as 503."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _offload_images(value: Any, key: str = "") -> Any:
+    """
+    Replace base64 images in a job result with image-store handles
+    ("img:<sha256>", bytes on /ai/images/{sha256}/file). Final image, stages
+    and variants together easily exceed Mongo's 16 MB document limit.
+    """
+    if isinstance(value, dict):
+        return {k: _offload_images(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_offload_images(v, key) for v in value]
+    if (
+        isinstance(value, str)
+        and len(value) > 1024
+        and not is_handle(value)
+        and (value.startswith("data:image/") or key.lower().endswith("b64"))
+    ):
+        try:
+            raw = base64.b64decode(value.split(",", 1)[1] if value.startswith("data:") else value, validate=True)
+            handle, _ = put_image(raw)
+            return handle
+        except (ValueError, binascii.Error):
+            return value  # not an image after all; leave it
+    return value
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+
+
+class AIJobService:
+    """
+    Background execution of long-running AI generations.
+    Submitting returns a job id immediately; a fixed pool of worker tasks pulls
+    jobs from a bounded in-process queue and runs the same AIService code paths
+    as the synchronous endpoints. Job state, progress events and results live
+    in MongoDB so any worker can answer status polls.
+    """
+
+    # kind -> coroutine taking the request body
+    HANDLERS: Dict[str, Callable[[BaseModel], Awaitable[dict]]] = {
+        "generate_all_smart": AIService.generate_all_smart,
+        "stage1": AIService.stage1,
+        "stage2": AIService.stage2,
+        "stage3": AIService.stage3,
+        "edit_lasso": AIService.edit_lasso,
+        "drag_place_plant": AIService.drag_place_plant,
+    }
+
+    _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    _queue: Optional[asyncio.Queue] = None
+    _reserved = 0  # queue slots held by submits still writing their job to Mongo
+    _workers: List[asyncio.Task] = []
+    _lease_task: Optional[asyncio.Task] = None
+    _waiters: Dict[str, asyncio.Event] = {}
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+    @staticmethod
+    async def start_workers():
+        settings = get_settings()
+        AIJobService._queue = asyncio.Queue(maxsize=settings.ai_job_queue_size)
+
+        AIJobService._workers = [
+            asyncio.create_task(AIJobService._worker_loop(i))
+            for i in range(max(1, settings.ai_job_workers))
+        ]
+        AIJobService._lease_task = asyncio.create_task(AIJobService._lease_loop())
+        print(f"[ai_jobs] started {len(AIJobService._workers)} workers as {AIJobService._owner}")
+
+    @staticmethod
+    async def stop_workers():
+        tasks = list(AIJobService._workers)
+        if AIJobService._lease_task:
+            tasks.append(AIJobService._lease_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        AIJobService._workers = []
+        AIJobService._lease_task = None
+        # Payloads are only kept in memory, so our unfinished jobs cannot resume elsewhere
+        try:
+            await AIJobRepository.fail_unfinished_jobs("Interrupted by server shutdown", owner=AIJobService._owner)
+        except Exception as e:
+            print(f"[ai_jobs] could not fail interrupted jobs: {e}")
+
+    # ---------------------------
+    # Submit / query
+    # ---------------------------
+    @staticmethod
+    async def submit(kind: str, body: BaseModel, user_id: Optional[str], webhook_url: Optional[str] = None) -> AIJob:
+        if kind not in AIJobService.HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        queue = AIJobService._queue
+        if queue is None:
+            raise RuntimeError("Job workers are not running")
+        if webhook_url:
+            validate_webhook_url(webhook_url)
+        # take the slot before the first await, so concurrent submits cannot all pass the check
+        if queue.maxsize > 0 and queue.qsize() + AIJobService._reserved >= queue.maxsize:
+            raise JobQueueFullError("Job queue is full, try again later")
+        AIJobService._reserved += 1
+        try:
+            job = await AIJobRepository.create_job(
+                kind, user_id, webhook_url, owner=AIJobService._owner, lease_seconds=get_settings().ai_job_lease_seconds
+            )
+            try:
+                await AIJobService._add_event(job, "status", status="queued")
+                # the request's Idempotency-Key does not survive the hop to a worker task
+                queue.put_nowait((str(job.id), kind, body, get_idempotency_key()))
+            except asyncio.QueueFull:
+                await AIJobService._fail_unqueued(job, "Job queue is full, try again later")
+                raise JobQueueFullError("Job queue is full, try again later")
+            except Exception as e:
+                await AIJobService._fail_unqueued(job, str(e))
+                raise
+        finally:
+            AIJobService._reserved -= 1
+        return job
+
+    @staticmethod
+    async def _fail_unqueued(job: AIJob, error: str):
+        """A job that never reached the queue would otherwise stay "queued" (lease kept alive) forever."""
+        try:
+            await AIJobRepository.update_job(job, status="failed", error=error, finished_at=_now())
+            await AIJobService._add_event(job, "status", status="failed", error=error)
+        except Exception as e:
+            print(f"[ai_jobs] could not fail unqueued job {job.id}: {e}")
+
+    @staticmethod
+    async def get_job(job_id: str, user_id: Optional[str]) -> Optional[AIJob]:
+        job = await AIJobRepository.get_job_by_id(job_id)
+        if not job or (job.user_id and job.user_id != user_id):
+            return None
+        return job
+
+    @staticmethod
+    async def stream_events(job_id: str) -> AsyncIterator[str]:
+        """
+        Yield SSE frames for a job: replays stored events, then waits for new ones.
+        Wakes immediately on events from this process and polls the store as a
+        fallback, so it also works when the job runs on another worker.
+        """
+        poll_interval = get_settings().ai_job_event_poll_interval
+        sent = 0
+        while True:
+            job = await AIJobRepository.get_job_by_id(job_id)
+            if not job:
+                return
+            for event in job.events[sent:]:
+                yield _sse(event)
+            sent = len(job.events)
+            if job.status in TERMINAL_STATUSES:
+                yield _sse({"type": "end", "status": job.status})
+                return
+
+            waiter = AIJobService._waiters.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(waiter.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                # Heartbeat keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+    @staticmethod
+    def _wake(job_id: str):
+        waiter = AIJobService._waiters.pop(job_id, None)
+        if waiter:
+            waiter.set()
+
+    @staticmethod
+    async def _add_event(job: AIJob, event_type: str, **data):
+        event = {"type": event_type, "at": _now().isoformat(), **data}
+        await AIJobRepository.append_event(job, jsonable_encoder(event))
+        AIJobService._wake(str(job.id))
+
+    @staticmethod
+    async def _lease_loop():
+        """
+        Keep our jobs' leases alive and fail jobs whose owner stopped renewing
+        (crashed or redeployed process). Jobs of other live processes, which
+        keep renewing, are left alone.
+        """
+        lease = get_settings().ai_job_lease_seconds
+        while True:
+            try:
+                await AIJobRepository.renew_leases(AIJobService._owner, lease)
+                await AIJobRepository.fail_unfinished_jobs("Interrupted: the worker running this job stopped")
+            except Exception as e:
+                print(f"[ai_jobs] lease upkeep failed: {e}")
+            await asyncio.sleep(lease / 3)
+
+    @staticmethod
+    async def _worker_loop(worker_idx: int):
+        queue = AIJobService._queue
+        assert queue is not None
+        while True:
+            job_id, kind, body, idempotency_key = await queue.get()
+            try:
+                await AIJobService._run_job(job_id, kind, body, idempotency_key)
+            except Exception as e:
+                print(f"[ai_jobs] worker {worker_idx} crashed on job {job_id}: {e}")
+            finally:
+                queue.task_done()
+
+    @staticmethod
+    async def _run_job(job_id: str, kind: str, body: BaseModel, idempotency_key: Optional[str] = None):
+        job = await AIJobRepository.get_job_by_id(job_id)
+        if not job:
+            return
+
+        await AIJobRepository.update_job(job, status="running", started_at=_now())
+        await AIJobService._add_event(job, "status", status="running")
+
+        async def on_progress(event_type: str, data: dict):
+            await AIJobService._add_event(job, event_type, **data)
+
+        token = set_progress_callback(on_progress)
+        user_token = set_current_user(job.user_id)
+        idempotency_token = set_idempotency_key(idempotency_key)
+        try:
+            result = await AIJobService.HANDLERS[kind](body)
+            result = await run_cpu(_offload_images, jsonable_encoder(result))
+            await AIJobRepository.update_job(job, status="succeeded", result=result, finished_at=_now())
+            await AIJobService._add_event(job, "status", status="succeeded")
+        except Exception as e:
+            print(f"[ai_jobs] job {job_id} failed: {e}")
+            try:
+                await AIJobRepository.update_job(job, status="failed", error=str(e), finished_at=_now())
+                await AIJobService._add_event(job, "status", status="failed", error=str(e))
+            except Exception as write_error:
+                print(f"[ai_jobs] could not record failure of job {job_id}: {write_error}")
+        finally:
+            reset_idempotency_key(idempotency_token)
+            reset_current_user(user_token)
+            reset_progress_callback(token)
+
+        if job.webhook_url:
+            await AIJobService._send_webhook(job)
+
+    @staticmethod
+    async def _send_webhook(job: AIJob):
+        payload = {
+            "job_id": str(job.id),
+            "kind": job.kind,
+            "status": job.status,
+            "error": job.error,
+            "status_url": f"/ai/jobs/{job.id}",
+        }
+        try:
+            status_code = await send_webhook(job.webhook_url, payload)  # type: ignore[arg-type]
+            if status_code is None or not 200 <= status_code < 300:
+                print(f"[ai_jobs] webhook for {job.id} returned {status_code}")
+        except Exception as e:
+            print(f"[ai_jobs] webhook for {job.id} failed: {e}")
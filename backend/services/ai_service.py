@@ -1,17 +1,28 @@
-from core.prompts import build_style_and_species_blocks
-from schemas.ai_schema import AnalyzeBody, DragPlaceBody, GenerateAllSmartBody, MaskFromGreenBody, PreviewMaskBody, Stage1Body, Stage2Body, Stage3Body
-from core.ai import OUT_DIR, generate_all_smart, make_hard_and_soft_masks_from_green, run_stage1_layout, _prompt_list_to_dicts, run_stage2_refine, run_stage3_blend
+from typing import Optional
+from core.prompts import build_style_and_species_blocks, prompt_template_stats
+from schemas.ai_schema import AnalyzeBody, DragPlaceBody, GenerateAllSmartBody, ImageHandleResponse, ImageUploadB64Body, MaskFromGreenBody, PostprocessOptions, PreviewMaskBody, Stage1Body, Stage2Body, Stage3Body
+from core.ai import OUT_DIR, generate_all_smart, make_hard_and_soft_masks, make_hard_and_soft_masks_from_green, make_zone_masks, working_scale, run_stage1_layout, _prompt_list_to_dicts, run_stage2_refine, run_stage3_blend
+from utils.image_context import ImageContext
+from utils.cache_helper import memory_cache_stats
+from utils.cpu_executor import ExecutorSaturatedError, run_cpu_or_reject
+from utils.image_encoding import encode_preview
+from utils.image_store import ImageNotFoundError, ImageTooLargeError, digest_of, has_image, image_file, put_image
+from utils.rate_limiter import UpstreamBusyError, upstream_stats
+from core.config import get_settings
 from pathlib import Path
 import base64
 from PIL import Image, ImageDraw
-import io
 from fastapi.responses import FileResponse
 
+def _postprocess_options(options: Optional[PostprocessOptions]) -> Optional[dict]:
+    return options.model_dump() if options is not None else None
+
+
 class AIService:
     @staticmethod
     async def analyze_inputs(body: AnalyzeBody):
         try:
-            style_block, species_block = build_style_and_species_blocks(
+            style_block, species_block = await build_style_and_species_blocks(
                 base_image_b64=body.base_image_b64,
                 style_refs_b64=body.style_refs_b64,
                 plant_refs_b64=body.plant_refs_b64,
@@ -23,13 +34,14 @@ class AIService:
     @staticmethod
     async def stage1(body: Stage1Body):
         try:
-            out_path, prompt, mask_used_b64 = run_stage1_layout(
+            out_path, prompt, mask_used_b64 = await run_stage1_layout(
                 base_image_b64=body.base_image_b64,
                 style_block=body.style_block,
                 species_block=body.species_block,
                 user_prompts=_prompt_list_to_dicts(body.user_prompts),
                 green_overlay_b64=body.green_overlay_b64,
                 size=body.size,
+                postprocess=_postprocess_options(body.postprocess),
             )
             # convert file path to URL
             name = Path(out_path).name
@@ -40,7 +52,7 @@ class AIService:
     @staticmethod
     async def stage2(body: Stage2Body):
         try:
-            out_path, prompt, mask_used_b64 = run_stage2_refine(
+            out_path, prompt, mask_used_b64 = await run_stage2_refine(
                 stage1_result_b64=body.stage1_result_b64,
                 style_block=body.style_block,
                 species_block=body.species_block,
@@ -48,6 +60,7 @@ class AIService:
                 green_overlay_b64=body.green_overlay_b64,
                 refine_mask_b64=body.refine_mask_b64,
                 size=body.size,
+                postprocess=_postprocess_options(body.postprocess),
             )
             name = Path(out_path).name
             return {"ok": True, "resultPath": f"/api/file/{name}", "prompt": prompt, "maskUsedB64": mask_used_b64}
@@ -57,7 +70,7 @@ class AIService:
     @staticmethod
     async def stage3(body: Stage3Body):
         try:
-            out_path, prompt, mask_used_b64 = run_stage3_blend(
+            out_path, prompt, mask_used_b64 = await run_stage3_blend(
                 stage2_result_b64=body.stage2_result_b64,
                 style_block=body.style_block,
                 species_block=body.species_block,
@@ -65,6 +78,7 @@ class AIService:
                 size=body.size,
                 use_soft_mask=body.use_soft_mask,
                 green_overlay_b64=body.green_overlay_b64,
+                postprocess=_postprocess_options(body.postprocess),
             )
             name = Path(out_path).name
             return {"ok": True, "resultPath": f"/api/file/{name}", "prompt": prompt, "maskUsedB64": mask_used_b64}
@@ -82,7 +96,7 @@ class AIService:
                 raise ValueError("No base image provided")
             
             # Call the pipeline
-            result = generate_all_smart(
+            result = await generate_all_smart(
                 base_image_b64=base_image,
                 style_refs_b64=body.styleImages,
                 plant_refs_b64=body.plant_refs_b64 if body.plant_refs_b64 else [],
@@ -90,6 +104,10 @@ class AIService:
                 green_overlay_b64=body.green_overlay_b64,
                 size=body.size,
                 stage3_use_soft_mask=body.stage3_use_soft_mask,
+                variants=body.variants,
+                rank_variants=body.rank_variants,
+                run_stages=body.run_stages,
+                postprocess=_postprocess_options(body.postprocess),
             )
 
             # Get the base64 image directly from result (no file I/O needed)
@@ -105,10 +123,19 @@ class AIService:
                     "result_b64": result["stage1"]["result_b64"],
                     "prompt": result["stage1"]["prompt"],
                 },
+                # present when run_stages >= 2 / 3 ("image" is then the last stage)
+                **{
+                    stage: {"result_b64": result[stage]["result_b64"], "prompt": result[stage]["prompt"]}
+                    for stage in ("stage2", "stage3") if stage in result
+                },
                 "style_block": result["style_block"],
                 "species_block": result["species_block"],
+                # best-of-N only: [{index, result_b64, file, score}] (+ {index, error} for failures)
+                "variants": result.get("variants", []),
             }
             
+        except (ExecutorSaturatedError, ImageNotFoundError, UpstreamBusyError):
+            raise
         except Exception as e:
             raise Exception(f"Error generating all smart: {str(e)}")
         
@@ -123,30 +150,18 @@ class AIService:
             # build a circular brush mask
 
 
-            # decode base to get size
-            img_bytes = base64.b64decode(body.base_image_b64)
-            base_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-            w, h = base_img.size
-
-            # round mask
-            mask = Image.new("L", (w, h), 0)
-            draw = ImageDraw.Draw(mask)
-            r = max(8, body.radius_px)
-            draw.ellipse((body.drop_x - r, body.drop_y - r, body.drop_x + r, body.drop_y + r), fill=255)
-
-            # encode mask
-            buf = io.BytesIO()
-            mask.save(buf, format="PNG")
-            refine_mask_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+            # size comes from the header; the context is reused by stage 2
+            base = ImageContext.from_b64(body.base_image_b64)
+            mask = await run_cpu_or_reject(AIService._brush_mask, base, body.drop_x, body.drop_y, body.radius_px)
 
-            # run Stage 2 using this local brush mask
-            out_path, prompt, _mask_used = run_stage2_refine(
-                stage1_result_b64=body.base_image_b64,
+            # run Stage 2 using this local brush mask (no PNG round-trip)
+            out_path, prompt, _mask_used = await run_stage2_refine(
+                stage1_result_b64=base,
                 style_block=body.style_block,
                 species_block=body.species_block,
                 user_prompts=_prompt_list_to_dicts(body.user_prompts),
                 green_overlay_b64=None,
-                refine_mask_b64=refine_mask_b64,
+                refine_mask_b64=mask,
                 size=body.size,
             )
             name = Path(out_path).name
@@ -154,6 +169,17 @@ class AIService:
         except Exception as e:
             raise e
     
+    @staticmethod
+    def _brush_mask(base: ImageContext, drop_x: int, drop_y: int, radius_px: int) -> ImageContext:
+        w, h = base.size
+
+        # round mask
+        mask = Image.new("L", (w, h), 0)
+        draw = ImageDraw.Draw(mask)
+        r = max(8, radius_px)
+        draw.ellipse((drop_x - r, drop_y - r, drop_x + r, drop_y + r), fill=255)
+        return ImageContext.from_pil(mask)
+
     @staticmethod
     async def get_file(name: str):
         p = OUT_DIR / name
@@ -164,42 +190,126 @@ class AIService:
     @staticmethod
     async def preview_mask(body: PreviewMaskBody):
         try:
-            hard_b64, soft_b64 = make_hard_and_soft_masks_from_green(
-                green_overlay_b64=body.green_overlay_b64,
-                base_image_b64=body.base_image_b64,
-            )
+            return await run_cpu_or_reject(AIService._preview_mask_sync, body)
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    def _preview_mask_sync(body: PreviewMaskBody) -> dict:
+        base_ctx = ImageContext.from_b64(body.base_image_b64)
+        hard, soft = make_hard_and_soft_masks(
+            ImageContext.from_b64(body.green_overlay_b64),
+            base_ctx,
+        )
+
+        base = base_ctx.convert("RGB")
+        soft_l = soft.convert("L")
+        scale = working_scale(base.width, base.height, body.preview_max_side)
+        if scale < 1.0:
+            # display-only: composite at the preview resolution instead of native
+            preview_size = (max(1, round(base.width * scale)), max(1, round(base.height * scale)))
+            base = base.resize(preview_size, Image.Resampling.BILINEAR)
+            soft_l = soft_l.resize(preview_size, Image.Resampling.NEAREST)
+        # visualize: red where editable
+        red = Image.new("RGBA", base.size, (255,0,0,120))
+        prev = base.convert("RGBA")
+        prev = Image.composite(red, prev, soft_l)  # red where mask=white
+        # encode (fully opaque, so RGB: a quarter less data to deflate)
+        data, mime = encode_preview(prev.convert("RGB"), body.preview_format)
+        out_b64 = base64.b64encode(data).decode("utf-8")
+        return {"ok": True, "previewB64": out_b64, "previewMime": mime, "hardMaskB64": hard.b64, "softMaskB64": soft.b64}
+
+    @staticmethod
+    async def upload_image(raw: bytes) -> ImageHandleResponse:
+        try:
+            if len(raw) > get_settings().image_upload_max_bytes:
+                raise ImageTooLargeError("Image too large")
+            handle, (w, h) = await run_cpu_or_reject(put_image, raw)
+            return ImageHandleResponse(handle=handle, sha256=digest_of(handle), bytes=len(raw), width=w, height=h)
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def upload_image_b64(body: ImageUploadB64Body) -> ImageHandleResponse:
+        try:
+            # base64 is 4 chars per 3 bytes: reject before decoding a huge string
+            if len(body.image_b64) * 3 // 4 > get_settings().image_upload_max_bytes + 3:
+                raise ImageTooLargeError("Image too large")
+            return await AIService.upload_image(ImageContext.from_b64(body.image_b64).raw_bytes)
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def image_exists(sha256: str) -> bool:
+        try:
+            return has_image(sha256)
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def get_image_file(sha256: str):
+        try:
+            return FileResponse(str(image_file(sha256)))
+        except Exception as e:
+            raise e
 
-            def b64_to_pil(b): 
-                return Image.open(io.BytesIO(base64.b64decode(b))).convert("RGB")
-
-            base = b64_to_pil(body.base_image_b64)
-            soft = Image.open(io.BytesIO(base64.b64decode(soft_b64))).convert("L")
-            # visualize: red where editable
-            red = Image.new("RGBA", base.size, (255,0,0,120))
-            prev = base.convert("RGBA")
-            prev = Image.composite(red, prev, soft)  # red where mask=white
-            # encode
-            buf = io.BytesIO()
-            prev.save(buf, "PNG")
-            out_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-            return {"ok": True, "previewB64": out_b64, "hardMaskB64": hard_b64, "softMaskB64": soft_b64}
+    @staticmethod
+    async def upstream_stats():
+        try:
+            return upstream_stats()
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def prompt_stats():
+        try:
+            return prompt_template_stats()
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def cache_stats():
+        try:
+            return {"ok": True, "caches": memory_cache_stats()}
         except Exception as e:
             raise e
 
     @staticmethod
     async def mask_from_green(body: MaskFromGreenBody):
         try:
-            hard_b64, soft_b64 = make_hard_and_soft_masks_from_green(
-                green_overlay_b64=body.green_overlay_b64,
-                base_image_b64=body.base_image_b64,
+            return await run_cpu_or_reject(AIService._mask_from_green_sync, body)
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    def _mask_from_green_sync(body: MaskFromGreenBody) -> dict:
+        overlay = ImageContext.from_b64(body.green_overlay_b64)
+        base_ctx = ImageContext.ensure(body.base_image_b64)
+        hard_b64, soft_b64 = make_hard_and_soft_masks_from_green(
+            green_overlay_b64=overlay,
+            base_image_b64=base_ctx,
+            trunk_feather_px=body.trunk_feather_px,
+            canopy_grow_px_up=body.canopy_grow_px_up,
+            canopy_grow_px_radial=body.canopy_grow_px_radial,
+            down_grow_px_limit=body.down_grow_px_limit,
+        )
+        result = {"ok": True, "hardMaskB64": hard_b64, "softMaskB64": soft_b64}
+
+        if body.zones:
+            zone_masks = make_zone_masks(
+                overlay,
+                [z.model_dump() for z in body.zones],
+                base_ctx,
                 trunk_feather_px=body.trunk_feather_px,
                 canopy_grow_px_up=body.canopy_grow_px_up,
                 canopy_grow_px_radial=body.canopy_grow_px_radial,
                 down_grow_px_limit=body.down_grow_px_limit,
             )
-            return {"ok": True, "hardMaskB64": hard_b64, "softMaskB64": soft_b64}
-        except Exception as e:
-            raise e
+            result["zones"] = {
+                name: {"hardMaskB64": hard.b64, "softMaskB64": soft.b64}
+                for name, (hard, soft) in zone_masks.items()
+            }
+        return result
 
     @staticmethod
     async def edit_lasso(body):
@@ -209,37 +319,17 @@ class AIService:
         inside the mask is the model's edit, feathered for clean blending.
         """
         try:
-            import uuid
-            import numpy as np
-            import cv2
-            from PIL import ImageFilter
-            from utils.ai_helper import gpt_image_edit
+            from utils.ai_helper import gpt_image_edit_async
             
             # ---------------------------
             # 0) Decode inputs
             # ---------------------------
-            base = Image.open(io.BytesIO(base64.b64decode(body.image_b64))).convert("RGB")
-            W, H = base.size
-
-            maskL = Image.open(io.BytesIO(base64.b64decode(body.mask_b64))).convert("L")
-            if maskL.size != (W, H):
-                # Keep mask in sync with base
-                maskL = maskL.resize((W, H), Image.Resampling.NEAREST)
+            base = ImageContext.from_b64(body.image_b64)
 
             # ---------------------------
-            # 1) Harden + slightly shrink mask to avoid spill
+            # 1) Harden mask (binary, base size)
             # ---------------------------
-            # binarize (0/255)
-            maskL = maskL.point(lambda v: 255 if v >= 128 else 0) #type: ignore
-
-            # erode 1–2 px to pull back from edges (prevents bleeding/overlay look)
-            arr = np.array(maskL, dtype=np.uint8)
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))  # 3x3
-            arr = cv2.erode(arr, kernel, iterations=1)
-            maskL = Image.fromarray(arr, mode="L")
-
-            # soft feather for natural blend
-            maskL = maskL.filter(ImageFilter.GaussianBlur(radius=1.25))
+            model_mask = await run_cpu_or_reject(AIService._lasso_mask, base, body.mask_b64)
 
             # ---------------------------
             # 2) Build strict instruction (no plant hard-coding)
@@ -254,31 +344,17 @@ class AIService:
 
             size = None if (body.size in (None, "", "natural")) else body.size
 
-            # Use the *original* uploaded mask (not feathered) for the model call
-            # but still ensure it's the same size and 0/255:
-            model_mask = Image.open(io.BytesIO(base64.b64decode(body.mask_b64))).convert("L")
-            if model_mask.size != (W, H):
-                model_mask = model_mask.resize((W, H), Image.Resampling.NEAREST)
-            model_mask = model_mask.point(lambda v: 255 if v >= 128 else 0) #type: ignore
-            buf_model_mask = io.BytesIO()
-            model_mask.save(buf_model_mask, format="PNG")
-            model_mask_b64 = base64.b64encode(buf_model_mask.getvalue()).decode("utf-8")
-
             # ---------------------------
             # 3) Call model
             # ---------------------------
-            out_b64 = gpt_image_edit(
-                image_b64=body.image_b64,
+            out_b64 = await gpt_image_edit_async(
+                image_b64=base,
                 prompt=strict + (body.prompt or ""),
-                mask_b64=model_mask_b64,             # WHITE=editable; function converts to alpha mask
+                mask_b64=model_mask,                 # WHITE=editable; function converts to alpha mask
                 size=size or "1024x1024",
                 model="gpt-image-1",
             )
 
-            edited = Image.open(io.BytesIO(base64.b64decode(out_b64))).convert("RGB")
-            if edited.size != (W, H):
-                edited = edited.resize((W, H), Image.Resampling.LANCZOS)
-
             # ---------------------------
             # 4) Return as data URI without saving to disk
             # ---------------------------
@@ -289,3 +365,13 @@ class AIService:
 
         except Exception as e:
             raise e
+
+    @staticmethod
+    def _lasso_mask(base: ImageContext, mask_b64: str) -> ImageContext:
+        """Hard 0/255 model mask for edit_lasso, resized to the base image."""
+        from utils import mask_ops
+
+        W, H = base.size
+        # resize to base (NEAREST, keeps mask in sync) + binarize (0/255)
+        hard = mask_ops.to_binary_L(ImageContext.from_b64(mask_b64).pil, W, H)
+        return ImageContext.from_array(hard, "L")
@@ -1,12 +1,18 @@
 import time
+import asyncio
 import base64
 from PIL import Image
 import io
+from typing import List, Optional, Set
 from google import genai
 from google.genai import types
-from openai import OpenAI
 from schemas.video_generation_schema import GenerateVideoBody
 from core.config import get_settings
+from utils.ai_helper import gpt_image_edit_async
+from utils.rate_limiter import UpstreamBusyError, get_governor
+from utils.cpu_executor import run_cpu
+from utils.cache_helper import DiskCache, make_cache_key, sha256_hex
+from utils.video_store import put_video, video_path, video_url
 
 # Prompt for generating juvenile version of plants
 JUVENILE_PROMPT = (
@@ -31,24 +37,134 @@ VEO_GROWTH_PROMPT = (
 
 MODEL_NAME = get_settings().video_generation_model
 MAX_WAIT_SEC = 120  # Timeout to prevent runaway costs
+POLL_INITIAL_SEC = 2.0  # first status check; Veo rarely finishes sooner
+POLL_BACKOFF = 1.5
+POLL_MAX_SEC = 10.0
+JUVENILE_MODEL = "gpt-image-1"
+JUVENILE_SIZE = "1024x1024"
+
+_CACHE: Optional[DiskCache] = None
+_CLIENT = None
+
+
+class _PollEntry:
+    __slots__ = ("client", "op", "future", "interval", "next_at", "polls")
+
+    def __init__(self, client, op):
+        self.client = client
+        self.op = op
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.interval = POLL_INITIAL_SEC
+        self.next_at = time.monotonic() + POLL_INITIAL_SEC
+        self.polls = 0
+
+
+class _OperationPoller:
+    """
+    One polling loop for every in-flight Veo operation in the process (sync
+    requests, durable jobs, batches). Each operation keeps its own backoff
+    schedule; the loop sleeps until the earliest one is due and refreshes all
+    due operations concurrently, instead of one sleeping task per operation.
+    """
+
+    def __init__(self):
+        self._entries: Set[_PollEntry] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def register(self, client, op) -> _PollEntry:
+        entry = _PollEntry(client, op)
+        self._entries.add(entry)
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return entry
+
+    def unregister(self, entry: _PollEntry) -> None:
+        self._entries.discard(entry)
+        if not entry.future.done():
+            entry.future.cancel()
+
+    async def _run(self):
+        try:
+            await self._loop()
+        except BaseException:
+            # never leave waiters hanging until their timeout
+            for entry in self._entries:
+                if not entry.future.done():
+                    entry.future.set_exception(RuntimeError("Operation polling stopped"))
+            self._entries = set()
+            raise
+
+    async def _loop(self):
+        assert self._wake is not None
+        while self._entries:
+            self._wake.clear()
+            now = time.monotonic()
+            due = [e for e in self._entries if e.next_at <= now]
+            if due:
+                print(f"⏳ Polling {len(due)} operation(s)...")
+                results = await asyncio.gather(
+                    *(e.client.aio.operations.get(e.op) for e in due), return_exceptions=True
+                )
+                for entry, result in zip(due, results):
+                    if entry.future.done():
+                        continue  # waiter gave up meanwhile
+                    entry.polls += 1
+                    if isinstance(result, BaseException):
+                        entry.future.set_exception(result)
+                    elif result.done:
+                        entry.future.set_result(result)
+                    else:
+                        entry.op = result
+                        entry.interval = min(entry.interval * POLL_BACKOFF, POLL_MAX_SEC)
+                        entry.next_at = time.monotonic() + entry.interval
+                self._entries = {e for e in self._entries if not e.future.done()}
+                continue
+            # sleep until the next operation is due, or a new one registers
+            delay = min(e.next_at for e in self._entries) - now
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+_POLLER = _OperationPoller()
+
+
+def _video_cache() -> DiskCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = DiskCache("video")
+    return _CACHE
+
+
+def video_inputs_hash(mature_bytes: bytes, prompt: Optional[str], model: str = MODEL_NAME) -> str:
+    """Cache key of a finished video: mature image content + Veo prompt + model."""
+    return make_cache_key(image=sha256_hex(mature_bytes), prompt=prompt or VEO_GROWTH_PROMPT, model=model)
+
+
+def _juvenile_key(mature_bytes: bytes) -> str:
+    # independent of the Veo prompt, so prompt variations share the juvenile frame
+    return make_cache_key(
+        kind="juvenile", image=sha256_hex(mature_bytes), prompt=JUVENILE_PROMPT, model=JUVENILE_MODEL, size=JUVENILE_SIZE
+    )
+
 
 class VideoGenerationService:
 
     @staticmethod
     def _get_genai_client():
-        """Initialize and return the Google GenAI client"""
-        api_key = get_settings().google_api_key
-        if not api_key:
-            raise RuntimeError("Missing GOOGLE_API_KEY in environment variables")
-        return genai.Client(api_key=api_key)
-
-    @staticmethod
-    def _get_openai_client():
-        """Initialize and return the OpenAI client"""
-        api_key = get_settings().OPENAI_API_KEY
-        if not api_key:
-            raise RuntimeError("Missing OPENAI_API_KEY in environment variables")
-        return OpenAI(api_key=api_key)
+        """Return the shared Google GenAI client (created once, its HTTP session is reused)"""
+        global _CLIENT
+        if _CLIENT is None:
+            api_key = get_settings().google_api_key
+            if not api_key:
+                raise RuntimeError("Missing GOOGLE_API_KEY in environment variables")
+            _CLIENT = genai.Client(api_key=api_key)
+        return _CLIENT
 
     @staticmethod
     def _decode_base64_image(image_b64: str) -> tuple[bytes, str]:
@@ -107,9 +223,11 @@ class VideoGenerationService:
         return image_bytes, mime_type
 
     @staticmethod
-    def _generate_juvenile_image(mature_image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
+    async def _generate_juvenile_image(mature_image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
         """
         Generate a juvenile version of the mature landscape image using OpenAI image edit.
+        Goes through the shared pooled async client so the event loop stays free.
+        Frames are cached by mature image content (video_cache_enabled).
 
         Args:
             mature_image_bytes: The mature image as bytes
@@ -118,45 +236,149 @@ class VideoGenerationService:
         Returns:
             tuple of (juvenile_image_bytes, mime_type)
         """
+        use_cache = get_settings().video_cache_enabled
+        if use_cache:
+            key = await run_cpu(_juvenile_key, mature_image_bytes)
+            cached = await run_cpu(_video_cache().get_bytes, key, ".png")
+            if cached is not None:
+                print(f"✓ Juvenile image reused from cache: {len(cached)} bytes")
+                return cached, "image/png"
+
         print("🌱 Generating juvenile version of plants...")
 
-        # OpenAI requires PNG for image editing
-        # Convert to PNG if needed
-        if mime_type != "image/png":
-            img = Image.open(io.BytesIO(mature_image_bytes))
-            png_buffer = io.BytesIO()
-            img.save(png_buffer, format='PNG')
-            mature_image_bytes = png_buffer.getvalue()
-            mime_type = "image/png"
-
-        # Save to temp file (OpenAI client requires file-like object)
-        temp_img = io.BytesIO(mature_image_bytes)
-        temp_img.name = "mature_landscape.png"
-
-        # Call OpenAI image edit
-        client = VideoGenerationService._get_openai_client()
-
-        response = client.images.edit(
-            model="gpt-image-1",
-            image=temp_img,
+        # gpt_image_edit_async normalises the input to PNG (OpenAI requires PNG)
+        juvenile_b64 = await gpt_image_edit_async(
+            image_b64=base64.b64encode(mature_image_bytes).decode("utf-8"),
             prompt=JUVENILE_PROMPT,
-            size="1024x1024",
-            n=1
+            size=JUVENILE_SIZE,
+            model=JUVENILE_MODEL,
         )
-
-        # Get the juvenile image
-        if not response.data or len(response.data) == 0:
-            raise RuntimeError("No juvenile image returned from OpenAI")
-
-        juvenile_b64 = response.data[0].b64_json
         if not juvenile_b64:
             raise RuntimeError("No b64_json in OpenAI response")
 
         juvenile_bytes = base64.b64decode(juvenile_b64)
         print(f"✓ Juvenile image generated: {len(juvenile_bytes)} bytes")
 
+        if use_cache:
+            await run_cpu(_video_cache().put_bytes, key, juvenile_bytes, ".png")
         return juvenile_bytes, "image/png"
 
+    @staticmethod
+    def _abandon_operation(op, reason: str) -> None:
+        """
+        Stop waiting on an operation. google-genai exposes no cancel for Veo
+        operations, so it keeps running (and is billed) upstream; log its name
+        so an abandoned generation can be traced.
+        """
+        print(f"⚠️ {reason} — abandoning Veo operation {op.name}; it cannot be cancelled and may still be billed.")
+
+    @staticmethod
+    async def _start_operation(
+        client,
+        juvenile_bytes: bytes,
+        juvenile_mime: str,
+        mature_bytes: bytes,
+        mature_mime: str,
+        prompt: str,
+    ):
+        """Start a Veo juvenile → mature operation; returns the (not yet done) operation."""
+        # Seed image (first frame): juvenile
+        juvenile_image = types.Image(
+            image_bytes=juvenile_bytes,
+            mime_type=juvenile_mime,
+        )
+        # Last frame (target): mature
+        mature_image = types.Image(
+            image_bytes=mature_bytes,
+            mime_type=mature_mime,
+        )
+
+        print("⏳ Calling Veo API to generate growth video (juvenile → mature)...")
+        op = await client.aio.models.generate_videos(
+            model=MODEL_NAME,
+            prompt=prompt,
+            image=juvenile_image,  # START FRAME (seed)
+            config=types.GenerateVideosConfig(
+                last_frame=mature_image  # END FRAME (target) - guides toward mature state
+            ),
+        )
+        print(f"✓ Video generation operation started: {op.name}")
+        return op
+
+    @staticmethod
+    async def _wait_for_operation(client, op, max_wait: float = MAX_WAIT_SEC):
+        """
+        Wait for a Veo operation without blocking the event loop.
+        Polling goes through the shared _OperationPoller; the interval starts
+        short and backs off (POLL_INITIAL_SEC x POLL_BACKOFF, capped at
+        POLL_MAX_SEC) since generations take tens of seconds at best.
+        On timeout, or if the calling task is cancelled, polling stops; the
+        operation itself cannot be cancelled and runs to completion upstream.
+        """
+        if op.done:
+            return op
+        start_time = time.monotonic()
+        entry = _POLLER.register(client, op)
+        try:
+            op = await asyncio.wait_for(asyncio.shield(entry.future), timeout=max(0.0, max_wait))
+        except asyncio.TimeoutError:
+            _POLLER.unregister(entry)
+            VideoGenerationService._abandon_operation(entry.op, f"Timed out after {max_wait:.0f}s")
+            raise RuntimeError(f"Veo generation did not finish within {max_wait:.0f}s")
+        except asyncio.CancelledError:
+            _POLLER.unregister(entry)
+            VideoGenerationService._abandon_operation(entry.op, "Request cancelled")
+            raise
+
+        print(f"✓ Operation completed after {entry.polls} polls ({time.monotonic() - start_time:.1f}s)")
+        return op
+
+    @staticmethod
+    async def _download_video(client, op) -> bytes:
+        generated_videos = VideoGenerationService._generated_videos(op)
+        print(f"✓ Video generation successful! Got {len(generated_videos)} video(s)")
+
+        video_file = generated_videos[0].video
+        print(f"⏳ Downloading video file...")
+        video_bytes = await client.aio.files.download(file=video_file)
+        print(f"✓ Video downloaded: {len(video_bytes)} bytes")
+        return video_bytes
+
+    @staticmethod
+    def cached_video(inputs_hash: str) -> Optional[str]:
+        """Filename of a stored video for these inputs, if caching is on and the file still exists."""
+        if not get_settings().video_cache_enabled:
+            return None
+        entry = _video_cache().get_json(inputs_hash)
+        if not entry or not video_path(entry["filename"]).exists():
+            return None
+        return entry["filename"]
+
+    @staticmethod
+    def remember_video(inputs_hash: str, filename: str) -> None:
+        if get_settings().video_cache_enabled:
+            _video_cache().put_json(inputs_hash, {"filename": filename})
+
+    @staticmethod
+    def _generated_videos(op) -> list:
+        """Validate a finished operation and return its generated videos."""
+        # Check for operation error
+        if hasattr(op, 'error') and op.error:
+            error_msg = f"Veo API error: {op.error}"
+            print(f"❌ {error_msg}")
+            raise RuntimeError(error_msg)
+
+        # Check if video was generated
+        if not op.response or not hasattr(op.response, "generated_videos"):
+            print("❌ No video in response")
+            raise RuntimeError("No response from Veo model - operation may have failed")
+
+        generated_videos = getattr(op.response, "generated_videos", None)
+        if not generated_videos or len(generated_videos) == 0:
+            print("❌ Generated videos list is empty")
+            raise RuntimeError("No videos in generated_videos list - model may have rejected the request")
+        return generated_videos
+
     @staticmethod
     async def generate_video_from_image(body: GenerateVideoBody):
         """
@@ -171,111 +393,64 @@ class VideoGenerationService:
             body: GenerateVideoBody containing image_b64 (mature landscape) and optional prompt
 
         Returns:
-            dict with success status and video data (base64)
+            dict with success status and the URL of the stored video
         """
         try:
             print("🎬 Starting juvenile → mature growth video generation...")
 
-            # STEP 1: Decode the mature image
-            mature_bytes, mature_mime = VideoGenerationService._decode_base64_image(body.image_b64)
+            # STEP 1: Decode the mature image, setting up the GenAI client meanwhile
+            (mature_bytes, mature_mime), client = await asyncio.gather(
+                run_cpu(VideoGenerationService._decode_base64_image, body.image_b64),
+                run_cpu(VideoGenerationService._get_genai_client),
+            )
             print(f"✓ Mature image decoded: {len(mature_bytes)} bytes, type: {mature_mime}")
 
+            # Same design, prompt and model: return the stored video
+            prompt = body.prompt if body.prompt else VEO_GROWTH_PROMPT
+            inputs_hash = await run_cpu(video_inputs_hash, mature_bytes, prompt)
+            filename = await run_cpu(VideoGenerationService.cached_video, inputs_hash)
+            if filename:
+                print(f"✅ Growth video reused from cache: {filename}")
+                return {
+                    "success": True,
+                    "message": "Growth video reused from cache (juvenile → mature)",
+                    "video_url": video_url(filename),
+                    "filename": filename,
+                }
+
             # STEP 2: Generate juvenile version
-            juvenile_bytes, juvenile_mime = VideoGenerationService._generate_juvenile_image(
+            juvenile_bytes, juvenile_mime = await VideoGenerationService._generate_juvenile_image(
                 mature_bytes, mature_mime
             )
 
-            # STEP 3: Create Veo images
-            # Seed image (first frame): juvenile
-            juvenile_image = types.Image(
-                image_bytes=juvenile_bytes,
-                mime_type=juvenile_mime,
-            )
-            print("✓ Juvenile seed image created")
-
-            # Last frame (target): mature
-            mature_image = types.Image(
-                image_bytes=mature_bytes,
-                mime_type=mature_mime,
-            )
-            print("✓ Mature target image created")
+            # STEP 3-4: Generate growth video with Veo
+            print(f"✓ Using prompt: {prompt[:100]}...")
 
-            # STEP 4: Generate growth video with Veo
-            client = VideoGenerationService._get_genai_client()
-            print(f"✓ GenAI client initialized with model: {MODEL_NAME}")
+            # Hold a Veo slot for the whole operation: the quota is on running generations
+            async with get_governor("google", MODEL_NAME).slot():
+                op = await VideoGenerationService._start_operation(
+                    client, juvenile_bytes, juvenile_mime, mature_bytes, mature_mime, prompt
+                )
+                op = await VideoGenerationService._wait_for_operation(client, op)
 
-            # Use custom prompt or default growth prompt
-            prompt = body.prompt if body.prompt else VEO_GROWTH_PROMPT
-            print(f"✓ Using prompt: {prompt[:100]}...")
+                # STEP 5: Validate and download video
+                video_bytes = await VideoGenerationService._download_video(client, op)
 
-            print("⏳ Calling Veo API to generate growth video (juvenile → mature)...")
-            op = client.models.generate_videos(
-                model=MODEL_NAME,
-                prompt=prompt,
-                image=juvenile_image,  # START FRAME (seed)
-                config=types.GenerateVideosConfig(
-                    last_frame=mature_image  # END FRAME (target) - guides toward mature state
-                ),
-            )
-            print(f"✓ Video generation operation started: {op.name}")
-
-            # Poll until done, with timeout protection
-            poll_count = 0
-            start_time = time.time()
-            while not op.done and (time.time() - start_time < MAX_WAIT_SEC):
-                poll_count += 1
-                print(f"⏳ Polling operation status... (attempt {poll_count})")
-                op = client.operations.get(op)
-                time.sleep(5)
-
-            # Check for timeout
-            if not op.done:
-                print("⚠️ Timeout hit — cancelling job to protect cost budget.")
-                try:
-                    client.operations.cancel(op) #type: ignore
-                except Exception:
-                    pass
-                raise RuntimeError("Veo generation cancelled after timeout to prevent runaway costs")
-
-            print(f"✓ Operation completed after {poll_count} polls ({time.time() - start_time:.1f}s)")
-
-            # STEP 5: Validate and download video
-            # Check for operation error
-            if hasattr(op, 'error') and op.error:
-                error_msg = f"Veo API error: {op.error}"
-                print(f"❌ {error_msg}")
-                raise RuntimeError(error_msg)
-
-            # Check if video was generated
-            if not op.response or not hasattr(op.response, "generated_videos"):
-                print("❌ No video in response")
-                raise RuntimeError("No response from Veo model - operation may have failed")
-
-            generated_videos = getattr(op.response, "generated_videos", None)
-            if not generated_videos or len(generated_videos) == 0:
-                print("❌ Generated videos list is empty")
-                raise RuntimeError("No videos in generated_videos list - model may have rejected the request")
-
-            print(f"✓ Video generation successful! Got {len(generated_videos)} video(s)")
-
-            # Download video
-            video_file = generated_videos[0].video
-            print(f"⏳ Downloading video file...")
-            video_bytes = client.files.download(file=video_file)
-            print(f"✓ Video downloaded: {len(video_bytes)} bytes")
-
-            # Convert video to base64 for frontend
-            video_b64 = base64.b64encode(video_bytes).decode('utf-8')
-            video_data_url = f"data:video/mp4;base64,{video_b64}"
-            print(f"✓ Video converted to base64: {len(video_b64)} chars")
+            # Store on disk (content-hashed); the frontend streams it from the URL
+            filename = await run_cpu(put_video, video_bytes)
+            print(f"✓ Video stored: {filename}")
+            await run_cpu(VideoGenerationService.remember_video, inputs_hash, filename)
 
             print("✅ Growth video generation complete!")
             return {
                 "success": True,
                 "message": "Growth video generated successfully (juvenile → mature)",
-                "video_data": video_data_url,  # Base64 video data for frontend
+                "video_url": video_url(filename),
+                "filename": filename,
             }
 
+        except UpstreamBusyError:
+            raise
         except Exception as e:
             print(f"❌ Video generation failed: {str(e)}")
             import traceback
@@ -0,0 +1,319 @@
+import os
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from google.genai import types
+from PIL import UnidentifiedImageError
+
+from core.config import get_settings
+from models.video_job_model import VideoJob
+from repository.video_job_repository import LeaseLostError, VideoJobRepository
+from schemas.video_generation_schema import GenerateVideoBody
+from services.video_generation_service import (
+    MAX_WAIT_SEC,
+    MODEL_NAME,
+    VEO_GROWTH_PROMPT,
+    VideoGenerationService,
+    video_inputs_hash,
+)
+from utils.cpu_executor import run_cpu
+from utils.image_store import get_image_bytes, put_image
+from utils.rate_limiter import UpstreamBusyError, get_governor, reset_current_user, set_current_user
+from utils.video_store import put_video
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(dt: datetime) -> datetime:
+    # Mongo hands datetimes back naive (but in UTC)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class InvalidDesignError(ValueError):
+    """A submitted design's image_b64 cannot be decoded as an image; surfaced as 400."""
+
+
+class VideoJobService:
+    """
+    Durable Veo growth-video generations.
+    Submitting stores the inputs (content-addressed) and returns a job id. A
+    poller on every worker claims runnable jobs by lease, records each step as
+    it completes (juvenile frame, Veo operation name) and renews the lease
+    while running. If a worker stops (deploy, crash) its lease lapses and any
+    worker resumes the job from the last recorded step; in particular it keeps
+    polling the already-paid Veo operation instead of starting a new one.
+    """
+
+    _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    _poller: Optional[asyncio.Task] = None
+    _wake: Optional[asyncio.Event] = None
+    _running: Dict[str, asyncio.Task] = {}
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+    @staticmethod
+    async def start_poller():
+        VideoJobService._wake = asyncio.Event()
+        VideoJobService._poller = asyncio.create_task(VideoJobService._poll_loop())
+        print(f"[video_jobs] poller started as {VideoJobService._owner}")
+
+    @staticmethod
+    async def stop_poller():
+        """Stop claiming; running jobs hand their lease back so the next worker resumes them at once."""
+        tasks = list(VideoJobService._running.values())
+        if VideoJobService._poller:
+            tasks.append(VideoJobService._poller)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        VideoJobService._poller = None
+        VideoJobService._running = {}
+
+    # ---------------------------
+    # Submit / query
+    # ---------------------------
+    @staticmethod
+    async def _prepare(body: GenerateVideoBody, user_id: Optional[str]) -> Tuple[dict, Optional[str]]:
+        """Decode and store one design; returns (job fields, cached video filename or None)."""
+        try:
+            mature_bytes, mature_mime = await run_cpu(VideoGenerationService._decode_base64_image, body.image_b64)
+            (mature_handle, _), inputs_hash = await asyncio.gather(
+                run_cpu(put_image, mature_bytes),
+                run_cpu(video_inputs_hash, mature_bytes, body.prompt),
+            )
+        except (ValueError, UnidentifiedImageError) as e:  # bad base64 / not an image
+            raise InvalidDesignError(f"Invalid image_b64: {e}")
+        fields = dict(
+            user_id=user_id,
+            prompt=body.prompt,
+            model=MODEL_NAME,
+            inputs_hash=inputs_hash,
+            mature_image=mature_handle,
+            mature_mime=mature_mime,
+        )
+        return fields, await run_cpu(VideoGenerationService.cached_video, inputs_hash)
+
+    @staticmethod
+    async def _create(fields: dict, cached_file: Optional[str]) -> VideoJob:
+        if cached_file:
+            # Already animated: a finished job, nothing for the poller to do
+            now = _now()
+            return await VideoJobRepository.create_job(
+                **fields, status="succeeded", video_file=cached_file, started_at=now, finished_at=now
+            )
+        return await VideoJobRepository.create_job(**fields)
+
+    @staticmethod
+    async def submit(body: GenerateVideoBody, user_id: Optional[str]) -> VideoJob:
+        fields, cached_file = await VideoJobService._prepare(body, user_id)
+        job = await VideoJobService._create(fields, cached_file)
+        if VideoJobService._wake:
+            VideoJobService._wake.set()
+        return job
+
+    @staticmethod
+    async def submit_batch(bodies: List[GenerateVideoBody], user_id: Optional[str]) -> Tuple[str, List[VideoJob]]:
+        """
+        Several designs as one batch: inputs are decoded and stored concurrently,
+        then each design becomes a job sharing batch_id. Workers run them side by
+        side (juvenile frames for some while others hold Veo slots) and all their
+        operations are polled by the shared loop.
+        """
+        batch_id = uuid.uuid4().hex
+        prepared = await asyncio.gather(
+            *(VideoJobService._prepare(body, user_id) for body in bodies), return_exceptions=True
+        )
+        # reject the whole batch before any job exists, naming the bad design
+        for index, result in enumerate(prepared):
+            if isinstance(result, InvalidDesignError):
+                raise InvalidDesignError(f"Design {index}: {result}")
+            if isinstance(result, BaseException):
+                raise result
+        jobs = [
+            await VideoJobService._create(dict(fields, batch_id=batch_id), cached_file)
+            for fields, cached_file in prepared
+        ]
+        if VideoJobService._wake:
+            VideoJobService._wake.set()
+        return batch_id, jobs
+
+    @staticmethod
+    async def get_job(job_id: str, user_id: Optional[str]) -> Optional[VideoJob]:
+        job = await VideoJobRepository.get_job_by_id(job_id)
+        if not job or (job.user_id and job.user_id != user_id):
+            return None
+        return job
+
+    @staticmethod
+    async def get_batch(batch_id: str, user_id: Optional[str]) -> List[VideoJob]:
+        jobs = await VideoJobRepository.get_jobs_by_batch(batch_id)
+        return [job for job in jobs if not job.user_id or job.user_id == user_id]
+
+    @staticmethod
+    def batch_status(jobs: List[VideoJob]) -> str:
+        statuses = {job.status for job in jobs}
+        if not statuses.issubset(TERMINAL_STATUSES):
+            return "running"
+        if statuses == {"succeeded"}:
+            return "succeeded"
+        if statuses == {"failed"}:
+            return "failed"
+        return "partial"
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+    @staticmethod
+    async def _poll_loop():
+        settings = get_settings()
+        wake = VideoJobService._wake
+        assert wake is not None
+        while True:
+            try:
+                while len(VideoJobService._running) < max(1, settings.video_job_workers):
+                    job = await VideoJobRepository.claim_next(VideoJobService._owner, settings.video_job_lease_seconds)
+                    if job is None:
+                        break
+                    VideoJobService._spawn(job)
+            except Exception as e:
+                print(f"[video_jobs] claiming jobs failed: {e}")
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=settings.video_job_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+
+    @staticmethod
+    def _spawn(job: VideoJob):
+        job_id = str(job.id)
+
+        def done(_task: asyncio.Task):
+            VideoJobService._running.pop(job_id, None)
+            if VideoJobService._wake:
+                VideoJobService._wake.set()  # free slot: claim the next job right away
+
+        task = asyncio.create_task(VideoJobService._run_claimed(job))
+        VideoJobService._running[job_id] = task
+        task.add_done_callback(done)
+
+    @staticmethod
+    async def _heartbeat(job: VideoJob):
+        """Renew the lease; returns once it turns out another worker holds the job."""
+        lease = get_settings().video_job_lease_seconds
+        while True:
+            await asyncio.sleep(lease / 3)
+            try:
+                expires = await VideoJobRepository.renew_lease(job.id, VideoJobService._owner, lease)
+            except Exception as e:
+                print(f"[video_jobs] lease renewal for {job.id} failed: {e}")
+                continue
+            if not expires:
+                return
+            job.lease_expires_at = expires
+
+    @staticmethod
+    async def _run_claimed(job: VideoJob):
+        settings = get_settings()
+        owner = VideoJobService._owner
+        user_token = set_current_user(job.user_id)
+        heartbeat = asyncio.create_task(VideoJobService._heartbeat(job))
+        work: Optional[asyncio.Task] = None
+        try:
+            if job.attempts > settings.video_job_max_attempts:
+                raise RuntimeError(f"Gave up after {job.attempts - 1} interrupted attempts")
+            work = asyncio.create_task(VideoJobService._run_job(job))
+            await asyncio.wait({work, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            if not work.done():
+                # lease lost: stop before we start or overwrite anything of the new owner's
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+                raise LeaseLostError(f"Lease on video job {job.id} was taken over")
+            work.result()
+        except LeaseLostError as e:
+            print(f"[video_jobs] {e}; stopping here")
+        except UpstreamBusyError:
+            # Veo quota is saturated: not the job's fault, try again on a later poll
+            await VideoJobRepository.release_lease(job.id, owner, undo_attempt=True)
+        except asyncio.CancelledError:
+            if work is not None:
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+            await asyncio.shield(VideoJobRepository.release_lease(job.id, owner))
+            raise
+        except Exception as e:
+            print(f"[video_jobs] job {job.id} failed: {e}")
+            try:
+                await VideoJobRepository.update_job(
+                    job, owner=owner, status="failed", error=str(e), finished_at=_now(),
+                    lease_owner=None, lease_expires_at=None,
+                )
+            except LeaseLostError:
+                print(f"[video_jobs] job {job.id} was taken over; not recording the failure")
+        finally:
+            heartbeat.cancel()
+            reset_current_user(user_token)
+
+    @staticmethod
+    async def _run_job(job: VideoJob):
+        if job.operation_name:
+            print(f"[video_jobs] resuming {job.id} on operation {job.operation_name}")
+        else:
+            print(f"[video_jobs] running {job.id}")
+        owner = VideoJobService._owner
+        client = VideoGenerationService._get_genai_client()
+        if job.started_at is None:
+            await VideoJobRepository.update_job(job, owner=owner, started_at=_now())
+
+        if not job.operation_name:
+            # an identical job may have finished while this one was queued
+            filename = await run_cpu(VideoGenerationService.cached_video, job.inputs_hash)
+            if filename:
+                await VideoJobRepository.update_job(
+                    job, owner=owner, status="succeeded", video_file=filename, finished_at=_now(), lease_owner=None, lease_expires_at=None
+                )
+                print(f"[video_jobs] job {job.id} reused cached video {filename}")
+                return
+            mature_bytes = await run_cpu(get_image_bytes, job.mature_image)
+            if job.juvenile_image:
+                juvenile_bytes = await run_cpu(get_image_bytes, job.juvenile_image)
+            else:
+                await VideoJobRepository.update_job(job, owner=owner, status="juvenile")
+                juvenile_bytes, _ = await VideoGenerationService._generate_juvenile_image(mature_bytes, job.mature_mime)
+                juvenile_handle, _ = await run_cpu(put_image, juvenile_bytes)
+                await VideoJobRepository.update_job(job, owner=owner, juvenile_image=juvenile_handle)
+
+        # Hold a Veo slot for the whole operation: the quota is on running generations
+        async with get_governor("google", job.model).slot():
+            if job.operation_name:
+                op = await client.aio.operations.get(types.GenerateVideosOperation(name=job.operation_name))
+            else:
+                # confirm we still own the job right before paying for an operation
+                await VideoJobRepository.update_job(job, owner=owner, status="generating")
+                op = await VideoGenerationService._start_operation(
+                    client, juvenile_bytes, "image/png", mature_bytes, job.mature_mime, job.prompt or VEO_GROWTH_PROMPT
+                )
+                await VideoJobRepository.update_job(
+                    job, owner=owner, operation_name=op.name, operation_started_at=_now()
+                )
+
+            # the timeout budget counts from when the operation started, across restarts
+            elapsed = (_now() - _as_utc(job.operation_started_at or _now())).total_seconds()
+            op = await VideoGenerationService._wait_for_operation(
+                client, op, max_wait=max(0.0, MAX_WAIT_SEC - elapsed)
+            )
+            video_bytes = await VideoGenerationService._download_video(client, op)
+
+        filename = await run_cpu(put_video, video_bytes)
+        await run_cpu(VideoGenerationService.remember_video, job.inputs_hash, filename)
+        await VideoJobRepository.update_job(
+            job, owner=owner, status="succeeded", video_file=filename, finished_at=_now(), lease_owner=None, lease_expires_at=None
+        )
+        print(f"[video_jobs] job {job.id} succeeded ({len(video_bytes)} bytes)")
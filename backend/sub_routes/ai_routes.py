@@ -1,8 +1,17 @@
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Depends, File, Header, UploadFile
 from controllers.ai_controller import AIController
-from schemas.ai_schema import AnalyzeBody, DragPlaceBody, EditLassoReq, GenerateAllSmartBody, MaskFromGreenBody, PreviewMaskBody, Stage1Body, Stage2Body, Stage3Body
+from schemas.ai_schema import AnalyzeBody, DragPlaceBody, EditLassoReq, GenerateAllSmartBody, ImageHandleResponse, ImageUploadB64Body, MaskFromGreenBody, PreviewMaskBody, Stage1Body, Stage2Body, Stage3Body
+from schemas.ai_job_schema import JobResponse, JobSubmitResponse
+from auth.auth_dependencies import get_current_user
+from utils.ai_helper import set_idempotency_key
 
-app = APIRouter()
+async def bind_idempotency_key(idempotency_key: Optional[str] = Header(None)):
+    """Idempotency-Key header -> identical image edits in this request are served from the result cache."""
+    if idempotency_key:
+        set_idempotency_key(idempotency_key)
+
+app = APIRouter(dependencies=[Depends(bind_idempotency_key)])
 controller = AIController()
 
 @app.post("/analyze_inputs")
@@ -41,7 +50,80 @@ async def preview_mask(body: PreviewMaskBody):
 async def mask_from_green(body: MaskFromGreenBody):
     return await controller.mask_from_green(body)
 
+# ---------------------------
+# Upload-once images: any AI image field also accepts the returned handle
+# ---------------------------
+
+@app.post("/images", response_model=ImageHandleResponse)
+async def upload_image(file: UploadFile = File(...)):
+    return await controller.upload_image(file)
+
+@app.post("/images/b64", response_model=ImageHandleResponse)
+async def upload_image_b64(body: ImageUploadB64Body):
+    return await controller.upload_image_b64(body)
+
+@app.get("/images/{sha256}")
+async def image_exists(sha256: str):
+    """Lets clients skip the upload when the content hash is already stored."""
+    return await controller.image_exists(sha256)
+
+@app.get("/images/{sha256}/file")
+async def get_image_file(sha256: str):
+    """Raw bytes of a stored image (job results carry handles instead of base64)."""
+    return await controller.get_image_file(sha256)
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """Per provider:model queue depth, in-flight calls and wait times."""
+    return await controller.upstream_stats()
+
+@app.get("/prompts/stats")
+async def prompt_stats():
+    """Per-template revision, static/rendered token counts (prompt length and cost tracking)."""
+    return await controller.prompt_stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters for the in-memory caches (mask derivation, ...)."""
+    return await controller.cache_stats()
+
 @app.post("/edit_lasso")
 async def edit_lasso(body: EditLassoReq):
     return await controller.edit_lasso(body)
 
+# ---------------------------
+# Background jobs: submit returns a job id immediately
+# ---------------------------
+
+@app.post("/jobs/generate_all_smart", response_model=JobSubmitResponse, status_code=202)
+async def submit_generate_all_smart(body: GenerateAllSmartBody, webhook_url: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job("generate_all_smart", body, current_user, webhook_url)
+
+@app.post("/jobs/stage1", response_model=JobSubmitResponse, status_code=202)
+async def submit_stage1(body: Stage1Body, webhook_url: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job("stage1", body, current_user, webhook_url)
+
+@app.post("/jobs/stage2", response_model=JobSubmitResponse, status_code=202)
+async def submit_stage2(body: Stage2Body, webhook_url: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job("stage2", body, current_user, webhook_url)
+
+@app.post("/jobs/stage3", response_model=JobSubmitResponse, status_code=202)
+async def submit_stage3(body: Stage3Body, webhook_url: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job("stage3", body, current_user, webhook_url)
+
+@app.post("/jobs/edit_lasso", response_model=JobSubmitResponse, status_code=202)
+async def submit_edit_lasso(body: EditLassoReq, webhook_url: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job("edit_lasso", body, current_user, webhook_url)
+
+@app.post("/jobs/drag_place_plant", response_model=JobSubmitResponse, status_code=202)
+async def submit_drag_place_plant(body: DragPlaceBody, webhook_url: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job("drag_place_plant", body, current_user, webhook_url)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await controller.get_job(job_id, current_user)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Server-sent events: status changes and per-stage progress until the job ends."""
+    return await controller.job_events(job_id, current_user)
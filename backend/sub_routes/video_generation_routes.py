@@ -1,11 +1,44 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Request
 from controllers.video_generation_controller import VideoGenerationController
-from schemas.video_generation_schema import GenerateVideoBody
+from schemas.video_generation_schema import (
+    GenerateVideoBatchBody,
+    GenerateVideoBody,
+    GenerateVideoResponse,
+    VideoBatchResponse,
+    VideoBatchSubmitResponse,
+    VideoJobResponse,
+    VideoJobSubmitResponse,
+)
+from auth.auth_dependencies import get_current_user
 
 app = APIRouter()
 controller = VideoGenerationController()
 
-@app.post("/generate")
-async def generate_video(body: GenerateVideoBody):
+@app.post("/generate", response_model=GenerateVideoResponse)
+async def generate_video(body: GenerateVideoBody, request: Request):
     """Generate a video from an input image using Google's Veo model"""
-    return await controller.generate_video(body)
+    return await controller.generate_video(body, request)
+
+# ---------------------------
+# Durable jobs: survive worker restarts, poll GET /video/jobs/{id}
+# ---------------------------
+
+@app.post("/jobs", response_model=VideoJobSubmitResponse, status_code=202)
+async def submit_video_job(body: GenerateVideoBody, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_job(body, current_user)
+
+@app.get("/jobs/{job_id}", response_model=VideoJobResponse)
+async def get_video_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await controller.get_job(job_id, current_user)
+
+# ---------------------------
+# Batches: several designs as durable jobs sharing one batch id
+# ---------------------------
+
+@app.post("/batches", response_model=VideoBatchSubmitResponse, status_code=202)
+async def submit_video_batch(body: GenerateVideoBatchBody, current_user: dict = Depends(get_current_user)):
+    return await controller.submit_batch(body, current_user)
+
+@app.get("/batches/{batch_id}", response_model=VideoBatchResponse)
+async def get_video_batch(batch_id: str, current_user: dict = Depends(get_current_user)):
+    return await controller.get_batch(batch_id, current_user)
@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pydantic import BaseModel
+
+from repository.ai_job_repository import AIJobRepository
+from services.ai_job_service import AIJobService, JobQueueFullError
+
+
+class _Body(BaseModel):
+    prompt: str = ""
+
+
+@pytest.fixture
+def fake_repo(monkeypatch):
+    """In-memory AIJobRepository; `jobs` lists every job created."""
+    jobs = []
+
+    async def create_job(kind, user_id, webhook_url=None, owner=None, lease_seconds=60.0):
+        await asyncio.sleep(0)  # a real insert yields to other submits
+        job = SimpleNamespace(id=f"job{len(jobs)}", kind=kind, status="queued", error=None, events=[])
+        jobs.append(job)
+        return job
+
+    async def update_job(job, **fields):
+        for key, value in fields.items():
+            setattr(job, key, value)
+        return job
+
+    async def append_event(job, event):
+        job.events.append(event)
+        return job
+
+    monkeypatch.setattr(AIJobRepository, "create_job", staticmethod(create_job))
+    monkeypatch.setattr(AIJobRepository, "update_job", staticmethod(update_job))
+    monkeypatch.setattr(AIJobRepository, "append_event", staticmethod(append_event))
+    monkeypatch.setattr(AIJobService, "_reserved", 0)
+    return jobs
+
+
+def test_queue_filled_during_create_job_fails_the_job(fake_repo, monkeypatch):
+    async def scenario():
+        queue = asyncio.Queue(maxsize=1)
+        monkeypatch.setattr(AIJobService, "_queue", queue)
+        create_job = AIJobRepository.create_job
+
+        async def create_then_fill(*args, **kwargs):
+            job = await create_job(*args, **kwargs)
+            queue.put_nowait(("other", "stage1", None, None))  # slot taken behind our back
+            return job
+
+        monkeypatch.setattr(AIJobRepository, "create_job", staticmethod(create_then_fill))
+        with pytest.raises(JobQueueFullError):
+            await AIJobService.submit("stage1", _Body(), "user")
+
+    asyncio.run(scenario())
+    (job,) = fake_repo
+    assert job.status == "failed"
+    assert job.events[-1]["status"] == "failed"
+    assert AIJobService._reserved == 0
+
+
+def test_concurrent_submits_respect_queue_size(fake_repo, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(AIJobService, "_queue", asyncio.Queue(maxsize=2))
+        return await asyncio.gather(
+            *(AIJobService.submit("stage1", _Body(), "user") for _ in range(5)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(r, JobQueueFullError) for r in results) == 3
+    # rejected submits never create a job, so nothing is left "queued" forever
+    assert len(fake_repo) == 2
+    assert all(job.status == "queued" for job in fake_repo)
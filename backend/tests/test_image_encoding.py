@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.image_encoding import PREVIEW_MIME, encode_mask_png, encode_png, encode_preview
+
+
+def _decode_l(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(data)).convert("L"))
+
+
+def test_binary_mask_round_trips_as_1bit_png():
+    mask = np.zeros((64, 80), np.uint8)
+    mask[10:40, 5:70] = 255
+    data = encode_mask_png(mask)
+    assert Image.open(io.BytesIO(data)).mode == "1"
+    assert np.array_equal(_decode_l(data), mask)
+
+
+def test_non_binary_mask_falls_back_to_8bit():
+    mask = np.tile(np.arange(256, dtype=np.uint8), (4, 1))
+    data = encode_mask_png(Image.fromarray(mask, "L"))
+    assert Image.open(io.BytesIO(data)).mode == "L"
+    assert np.array_equal(_decode_l(data), mask)
+
+
+@pytest.mark.parametrize("level", [1, 6])
+def test_encode_png_is_lossless(level):
+    rgb = np.random.default_rng(0).integers(0, 256, (32, 48, 3), dtype=np.uint8)
+    back = np.asarray(Image.open(io.BytesIO(encode_png(Image.fromarray(rgb, "RGB"), level))))
+    assert np.array_equal(back, rgb)
+
+
+@pytest.mark.parametrize("fmt", ["png", "webp", "jpeg", "jpg"])
+def test_encode_preview_formats(fmt):
+    img = Image.new("RGBA", (40, 30), (10, 200, 30, 128))
+    data, mime = encode_preview(img, fmt, quality=80)
+    assert mime == PREVIEW_MIME["jpeg" if fmt == "jpg" else fmt]
+    assert Image.open(io.BytesIO(data)).size == (40, 30)
+
+
+def test_encode_preview_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        encode_preview(Image.new("RGB", (4, 4)), "gif")
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from utils import mask_ops
+
+
+@pytest.fixture(params=[(17, 31), (256, 256), (600, 901)], ids=lambda s: f"{s[0]}x{s[1]}")
+def gray(request) -> np.ndarray:
+    return np.random.default_rng(42).integers(0, 256, request.param, dtype=np.uint8)
+
+
+def _same(ours: np.ndarray, ref) -> None:
+    ref = np.asarray(ref)
+    assert ours.shape == ref.shape
+    assert np.array_equal(ours, ref)
+
+
+@pytest.mark.parametrize("at_least", [128, 64, 17])
+def test_threshold_matches_pil_point(gray, at_least):
+    pil = Image.fromarray(gray, "L")
+    _same(mask_ops.threshold(gray, at_least), pil.point(lambda v: 255 if v >= at_least else 0))
+
+
+def test_cap_matches_pil_point(gray):
+    _same(mask_ops.cap(gray, 200), Image.fromarray(gray, "L").point(lambda v: min(200, v)))
+
+
+def test_resize_nearest_matches_pil(gray):
+    pil = Image.fromarray(gray, "L")
+    h, w = gray.shape
+    for size in [(max(1, w // 3), max(1, h // 3)), (w * 2 - 1, h * 2 + 1)]:
+        _same(mask_ops.resize_nearest(gray, *size), pil.resize(size, Image.Resampling.NEAREST))
+
+
+def test_feather_matches_pil_gaussian_blur(gray):
+    _same(mask_ops.feather(gray, 1.5), Image.fromarray(gray, "L").filter(ImageFilter.GaussianBlur(radius=1.5)))
+
+
+def test_invert_to_alpha(gray):
+    binary = mask_ops.threshold(gray, 128)
+    rgba = mask_ops.invert_to_alpha(binary)
+    _same(rgba[..., 3], np.where(binary == 255, 0, 255).astype(np.uint8))
+    assert not rgba[..., :3].any()
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from core.ai import _make_soft_canopy_mask
+
+
+def _soft_reference(hard: np.ndarray, up: int, radial: int, down: int) -> np.ndarray:
+    """The full vertical + radial dilation, clipped below, without the short cut."""
+    base = (hard > 0).astype(np.uint8) * 255
+    vert = cv2.dilate(base, cv2.getStructuringElement(cv2.MORPH_RECT, (3, max(3, up * 2 + 1))))
+    rad = max(1, radial)
+    radial_mask = cv2.dilate(base, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (rad * 2 + 1, rad * 2 + 1)))
+    expanded = cv2.bitwise_or(vert, radial_mask)
+    if down > 0:
+        mild = cv2.dilate(base, cv2.getStructuringElement(cv2.MORPH_RECT, (3, down * 2 + 1)))
+        expanded = cv2.bitwise_and(expanded, cv2.bitwise_or(base, mild))
+    return expanded
+
+
+@pytest.fixture
+def hard_mask() -> np.ndarray:
+    rng = np.random.default_rng(7)
+    noise = cv2.GaussianBlur(rng.integers(0, 256, (240, 320), dtype=np.uint8), (0, 0), 6)
+    return np.where(noise > 140, 255, 0).astype(np.uint8)
+
+
+@pytest.mark.parametrize("up, radial, down", [(80, 12, 8), (120, 12, 8), (40, 6, 2), (3, 12, 8), (80, 12, 0)])
+def test_soft_canopy_mask_matches_full_dilation(hard_mask, up, radial, down):
+    soft = _make_soft_canopy_mask(
+        Image.fromarray(hard_mask, "L"),
+        canopy_grow_px_up=up,
+        canopy_grow_px_radial=radial,
+        down_grow_px_limit=down,
+    )
+    assert np.array_equal(np.asarray(soft), _soft_reference(hard_mask, up, radial, down))
@@ -0,0 +1,39 @@
+import pytest
+
+from core.prompts import PROMPT_TEMPLATES, Slot, _user_tail, count_tokens, render_prompt
+
+CASES = [("", "", ""), ("S", "P", "   "), ("[STYLE]\nx", "[PLANT_SPECIES]\ny", "U\n- z")]
+
+
+def _values(template, style: str, species: str, user: str) -> dict:
+    values = {
+        "style": style or "(no style extracted)",
+        "species": species or "(no species extracted)",
+        "user": user or "(none)",
+        "user_tail": _user_tail(user),
+    }
+    return {name: values[name] for name in template.slots}
+
+
+def _join_every_part(template, values: dict) -> str:
+    """The hand-written "\\n".join(parts) the compiled templates replace."""
+    pieces = [p if isinstance(p, str) else values[p.name] for p in template.parts]
+    return "\n".join(p for p in pieces if p is not None)
+
+
+@pytest.mark.parametrize("name", sorted(PROMPT_TEMPLATES))
+@pytest.mark.parametrize("style, species, user", CASES)
+def test_compiled_template_matches_plain_join(name, style, species, user):
+    template = PROMPT_TEMPLATES[name]
+    values = _values(template, style, species, user)
+    assert template.text(**values) == _join_every_part(template, values)
+
+
+def test_render_counts_static_tokens_once_plus_slots():
+    template = PROMPT_TEMPLATES["stage3"]
+    values = _values(template, "[STYLE]\nx", "[PLANT_SPECIES]\ny", "U")
+    rendered = render_prompt("stage3", **values)
+    assert rendered.text == template.text(**values)
+    assert rendered.tokens == template.static_tokens + sum(count_tokens(v) for v in values.values() if v)
+    static = "\n".join(p for p in template.parts if not isinstance(p, Slot))
+    assert template.static_tokens == count_tokens(static)
@@ -1,19 +1,31 @@
 import os
 import base64
 import requests
+import httpx
 import sys
 import errno
 import uuid
+import time
+import asyncio
+import contextvars
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Optional, List, Union
 from dotenv import load_dotenv
 from PIL import Image, ImageFilter
 import io
 import numpy as np
 import cv2
 from rembg import remove as rembg_remove
-import random
 from core.config import get_settings
+from utils.http_client import post_with_retry, make_timeout
+from utils.rate_limiter import get_governor
+from utils.image_context import ImageContext
+from utils.image_store import is_handle
+from utils import mask_ops
+from utils.cache_helper import DiskCache, make_cache_key, sha256_hex
+from utils.rembg_pool import get_rembg_pool
+from utils.cpu_executor import run_cpu
+from utils.image_encoding import encode_png
 
 OUT_DIR = Path("./storage/generated_images")
 
@@ -21,6 +33,8 @@ OUT_DIR = Path("./storage/generated_images")
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
 def _pil_to_b64(img: Image.Image, fmt: str = "PNG") -> str:
+    if fmt.upper() == "PNG":
+        return base64.b64encode(encode_png(img)).decode("utf-8")
     buf = io.BytesIO()
     img.save(buf, format=fmt)
     return base64.b64encode(buf.getvalue()).decode("utf-8")
@@ -67,16 +81,18 @@ def _get_headers_form() -> dict:
     return headers
 
 
-def _raise_with_body(resp: requests.Response) -> None:
+def _raise_with_body(resp: Union[requests.Response, httpx.Response]) -> None:
     """
     Print server error body to stderr then raise for status.
     Helps you see exact OpenAI error messages in Uvicorn logs.
+    Works for both requests (sync) and httpx (async) responses.
     """
     try:
         body = resp.text
     except Exception:
         body = "<no body>"
-    print(f"[OPENAI ERROR] {resp.status_code} {resp.reason}: {body}", file=sys.stderr)
+    reason = getattr(resp, "reason", None) or getattr(resp, "reason_phrase", "")
+    print(f"[OPENAI ERROR] {resp.status_code} {reason}: {body}", file=sys.stderr)
     resp.raise_for_status()
 
 def clean_base64(b64_str: str) -> str:
@@ -117,12 +133,33 @@ def gpt_vision_summarize(messages: list, model: str = "gpt-5.1", max_tokens: int
     headers = _get_headers_json()
     payload = {"model": model, "messages": messages, "max_completion_tokens": max_tokens}
 
-    resp = requests.post(url, headers=headers, json=payload, timeout=600)
+    with get_governor("openai", model).slot_sync():
+        resp = requests.post(url, headers=headers, json=payload, timeout=600)
     if not resp.ok:
         _raise_with_body(resp)
     return resp.json()["choices"][0]["message"]["content"]
 
 
+async def gpt_vision_summarize_async(messages: list, model: str = "gpt-5.1", max_tokens: int = 500) -> str:
+    """
+    Async variant of gpt_vision_summarize on the shared pooled client
+    (keep-alive, retry with backoff on 429/5xx). Does not block the event loop.
+    """
+    headers = _get_headers_json()
+    payload = {"model": model, "messages": messages, "max_completion_tokens": max_tokens}
+
+    async with get_governor("openai", model).slot():
+        resp = await post_with_retry(
+            "/chat/completions",
+            headers=headers,
+            json=payload,
+            timeout=make_timeout(get_settings().openai_vision_timeout),
+        )
+    if not resp.is_success:
+        _raise_with_body(resp)
+    return resp.json()["choices"][0]["message"]["content"]
+
+
 # ---------------------------
 # GPT Image Edit (makes final image)
 # ---------------------------
@@ -145,85 +182,222 @@ def fix_base64_padding(b64_str: str) -> str:
     
     return b64_str
 
-def gpt_image_edit(
-    image_b64: str,
-    prompt: str,
-    mask_b64: Optional[str] = None,
-    size: str = "1024x1024",
-    model: str = "gpt-image-1"
-) -> str:
+def _encode_png(img: Image.Image) -> bytes:
+    """PNG for uploads and persisted files, where size matters more than encode time."""
+    return encode_png(img, get_settings().png_upload_compress_level)
+
+
+def _prepare_image_edit_files(
+    image: Union[str, ImageContext],
+    mask: Union[str, ImageContext, None] = None,
+) -> dict:
     """
-    Calls OpenAI Images Edit API and returns base64 PNG string (no data URL).
+    Build the multipart 'files' for Images Edit.
     Ensures: mask is EXACTLY same size as image and is a PNG with transparency
     where transparent pixels indicate the editable area.
+    Accepts base64 or ImageContext; encodings are cached on the context so a
+    retried / repeated call does not decode or encode again.
     """
-    image_b64 = fix_base64_padding(image_b64)
-    # Decode base image -> normalize to PNG bytes (to avoid EXIF/orientation issues)
-    img_bytes = base64.b64decode(image_b64)
-    img_pil = Image.open(io.BytesIO(img_bytes)).convert("RGBA")
-    W, H = img_pil.size
-    img_buf = io.BytesIO()
-    img_pil.save(img_buf, format="PNG")
-    img_png_bytes = img_buf.getvalue()
+    img_ctx = ImageContext.ensure(image)
+    assert img_ctx is not None
+    W, H = img_ctx.size
+    # Normalize to RGBA PNG bytes (to avoid EXIF/orientation issues)
+    img_png_bytes = img_ctx.cached("openai_image_png", lambda: _encode_png(img_ctx.convert("RGBA")))
 
     files = {
         "image": ("image.png", img_png_bytes, "image/png"),
     }
 
-    if mask_b64:
-        mask_b64 = fix_base64_padding(mask_b64) #resolve the padding issue
-        # Decode mask -> force to L, resize to (W,H), then convert to RGBA where:
-        #   transparent = EDIT AREA (OpenAI edits here)
-        #   opaque      = PRESERVE
-        m_bytes = base64.b64decode(mask_b64)
-        m_pil = Image.open(io.BytesIO(m_bytes)).convert("L")
-        if m_pil.size != (W, H):
-            m_pil = m_pil.resize((W, H), Image.Resampling.NEAREST)
-
-        # Ensure hard 0/255
-        m_pil = m_pil.point(lambda v: 255 if v >= 128 else 0).convert("L") # type: ignore
-
-        # Our masks so far used WHITE=editable. For OpenAI Edits:
-        #   transparent = editable  -> alpha = 0 where m_pil==255
-        #   opaque      = keep      -> alpha = 255 where m_pil==0
-        import numpy as np
-        arr = np.array(m_pil)  # 0 or 255
-        alpha = np.where(arr == 255, 0, 255).astype("uint8")  # invert to transparency
-        rgba = np.zeros((H, W, 4), dtype="uint8")
-        rgba[..., 3] = alpha  # only alpha matters
-        mask_rgba = Image.fromarray(rgba, mode="RGBA")
-
-        m_buf = io.BytesIO()
-        mask_rgba.save(m_buf, format="PNG")
-        mask_png_bytes = m_buf.getvalue()
-
-        files["mask"] = ("mask.png", mask_png_bytes, "image/png")
-
-        # helpful debug
-        print(f"[gpt_image_edit] base size: {W}x{H}, mask size: {mask_rgba.size[0]}x{mask_rgba.size[1]}")
+    m_ctx = ImageContext.ensure(mask)
+    if m_ctx is not None:
+        def build_mask_png() -> bytes:
+            # Force to L, resize to (W,H), hard 0/255, then convert to RGBA where:
+            #   transparent = EDIT AREA (OpenAI edits here)
+            #   opaque      = PRESERVE
+            binary = mask_ops.to_binary_L(m_ctx.pil, W, H)
+            return _encode_png(Image.fromarray(mask_ops.invert_to_alpha(binary), "RGBA"))
+
+        files["mask"] = ("mask.png", m_ctx.cached(("openai_mask_png", W, H), build_mask_png), "image/png")
+
+    return files
+
+
+def gpt_image_edit(
+    image_b64: Union[str, ImageContext],
+    prompt: str,
+    mask_b64: Union[str, ImageContext, None] = None,
+    size: str = "1024x1024",
+    model: str = "gpt-image-1"
+) -> str:
+    """
+    Calls OpenAI Images Edit API and returns base64 PNG string (no data URL).
+    Blocking; prefer gpt_image_edit_async inside request handlers.
+    """
+    files = _prepare_image_edit_files(image_b64, mask_b64)
 
     data = {"prompt": prompt, "size": size, "model": model}
     headers = _get_headers_form()
-    print(data, headers)
-    resp = requests.post("https://api.openai.com/v1/images/edits",
-                         headers=headers, data=data, files=files, timeout=600)
+    with get_governor("openai", model).slot_sync():
+        resp = requests.post("https://api.openai.com/v1/images/edits",
+                             headers=headers, data=data, files=files, timeout=600)
     if not resp.ok:
         _raise_with_body(resp)
 
     return resp.json()["data"][0]["b64_json"]
 
-def _b64_to_pil(b64: str) -> Image.Image:
-    return Image.open(io.BytesIO(base64.b64decode(b64)))
+
+# Idempotency-Key header of the current request (bound by the /ai router and the job runner)
+_IDEMPOTENCY_KEY: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("idempotency_key", default=None)
+
+def set_idempotency_key(key: Optional[str]) -> contextvars.Token:
+    return _IDEMPOTENCY_KEY.set(key)
+
+def reset_idempotency_key(token: contextvars.Token) -> None:
+    _IDEMPOTENCY_KEY.reset(token)
+
+def get_idempotency_key() -> Optional[str]:
+    return _IDEMPOTENCY_KEY.get()
+
+
+_EDIT_RESULT_CACHE: Optional[DiskCache] = None
+_EDIT_INFLIGHT: Dict[str, "asyncio.Future[str]"] = {}
+_EDIT_LAST_PRUNE = 0.0
+
+def _edit_result_cache() -> DiskCache:
+    global _EDIT_RESULT_CACHE
+    if _EDIT_RESULT_CACHE is None:
+        _EDIT_RESULT_CACHE = DiskCache("image_edits")
+    return _EDIT_RESULT_CACHE
+
+def _edit_cache_key(files: dict, prompt: str, size: str, model: str, salt: Optional[str]) -> Optional[str]:
+    """
+    Key for the edit result cache, or None when caching is off for this call.
+    Hashes the exact bytes that would be uploaded, so it is stable across
+    base64 vs handle inputs and repeated mask derivations.
+    """
+    idempotency_key = get_idempotency_key()
+    if not (get_settings().edit_result_cache_enabled or idempotency_key):
+        return None
+    return make_cache_key(
+        image=sha256_hex(files["image"][1]),
+        mask=sha256_hex(files["mask"][1]) if "mask" in files else None,
+        prompt=prompt,
+        size=size,
+        model=model,
+        salt=salt,
+        idempotency_key=idempotency_key,
+    )
+
+def _prune_edit_results() -> None:
+    settings = get_settings()
+    removed = _edit_result_cache().prune(settings.edit_result_cache_max_bytes, settings.edit_result_cache_ttl)
+    if removed:
+        print(f"[gpt_image_edit] pruned {removed} cached results")
+
+async def _store_edit_result(key: str, b64: str) -> None:
+    global _EDIT_LAST_PRUNE
+    await run_cpu(_edit_result_cache().put_bytes, key, b64.encode("ascii"), ".b64")
+    now = time.monotonic()
+    if now - _EDIT_LAST_PRUNE > get_settings().edit_result_cache_prune_interval:
+        _EDIT_LAST_PRUNE = now
+        await run_cpu(_prune_edit_results)
+
+def _load_edit_result(key: str) -> Optional[str]:
+    cache = _edit_result_cache()
+    path = cache.path_for(key, ".b64")
+    try:
+        if time.time() - path.stat().st_mtime > get_settings().edit_result_cache_ttl:
+            return None
+    except FileNotFoundError:
+        return None
+    raw = cache.get_bytes(key, ".b64")
+    if raw is None:
+        return None
+    cache.touch(key, ".b64")
+    return raw.decode("ascii")
+
+
+async def gpt_image_edit_async(
+    image_b64: Union[str, ImageContext],
+    prompt: str,
+    mask_b64: Union[str, ImageContext, None] = None,
+    size: str = "1024x1024",
+    model: str = "gpt-image-1",
+    cache_salt: Optional[str] = None,
+) -> str:
+    """
+    Async variant of gpt_image_edit on the shared pooled client.
+    The HTTP wait no longer blocks the event loop, so one worker can drive
+    many concurrent generations. Returns base64 PNG string (no data URL).
+
+    With edit_result_cache_enabled (or an Idempotency-Key on the request),
+    identical image/mask/prompt/size/model calls are served from disk, and a
+    duplicate that arrives while the first is still running awaits it instead
+    of paying for a second generation. Callers that want several distinct
+    results from the same inputs (variants) pass a different cache_salt each.
+    """
+    files = await run_cpu(_prepare_image_edit_files, image_b64, mask_b64)
+    key = await run_cpu(_edit_cache_key, files, prompt, size, model, cache_salt)
+    if key is None:
+        return await _image_edit_request(files, prompt, size, model)
+
+    cached = await run_cpu(_load_edit_result, key)
+    if cached is not None:
+        print(f"[gpt_image_edit] result cache hit {key[:12]}")
+        return cached
+
+    while (pending := _EDIT_INFLIGHT.get(key)) is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # the first caller went away mid-generation; take over
+
+    fut: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+    _EDIT_INFLIGHT[key] = fut
+    try:
+        out_b64 = await _image_edit_request(files, prompt, size, model)
+        await _store_edit_result(key, out_b64)
+        fut.set_result(out_b64)
+        return out_b64
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved when nobody else was waiting
+        raise
+    except BaseException:
+        fut.cancel()
+        raise
+    finally:
+        _EDIT_INFLIGHT.pop(key, None)
+
+async def _image_edit_request(files: dict, prompt: str, size: str, model: str) -> str:
+    data = {"prompt": prompt, "size": size, "model": model}
+    headers = _get_headers_form()
+    async with get_governor("openai", model).slot():
+        resp = await post_with_retry(
+            "/images/edits",
+            headers=headers,
+            data=data,
+            files=files,
+            timeout=make_timeout(get_settings().openai_image_edit_timeout),
+            idempotent=False,  # paid generation: never resend once the body went out
+        )
+    if not resp.is_success:
+        _raise_with_body(resp)
+
+    return resp.json()["data"][0]["b64_json"]
+
+def _b64_to_pil(b64: Union[str, ImageContext]) -> Image.Image:
+    # via ImageContext so uploaded-image handles (and decoded contexts) work here too
+    return ImageContext.ensure(b64).pil  # type: ignore[union-attr]
 
 def _pil_to_b64_png(im: Image.Image) -> str:
-    buf = io.BytesIO()
-    im.save(buf, "PNG")
-    return base64.b64encode(buf.getvalue()).decode()
+    return base64.b64encode(encode_png(im)).decode()
 
-def _normalize_mask_L(mask_b64: str, W: int, H: int) -> Image.Image:
+def _normalize_mask_L(mask_b64: Union[str, ImageContext], W: int, H: int) -> Image.Image:
     """Return single-channel 'L' mask (WHITE=editable) resized to (W,H); auto-invert if almost empty/full."""
-    m = _b64_to_pil(mask_b64).convert("L").resize((W, H), Image.Resampling.NEAREST)
-    arr = np.where(np.array(m) >= 128, 255, 0).astype(np.uint8)
+    arr = mask_ops.to_binary_L(_b64_to_pil(mask_b64), W, H)
     r = (arr == 255).mean()
     if r < 0.02 or r > 0.98:
         arr = 255 - arr
@@ -231,15 +405,8 @@ def _normalize_mask_L(mask_b64: str, W: int, H: int) -> Image.Image:
 
 def _lmask_to_openai_rgba(mask_L: Image.Image) -> bytes:
     """OpenAI edits where alpha==0 (transparent). Convert WHITE(255)=edit -> alpha 0."""
-    W, H = mask_L.size
-    arr = np.array(mask_L, np.uint8)
-    alpha = np.where(arr == 255, 0, 255).astype(np.uint8)
-    rgba = np.zeros((H, W, 4), np.uint8)
-    rgba[..., 3] = alpha
-    im = Image.fromarray(rgba, "RGBA")
-    buf = io.BytesIO()
-    im.save(buf, "PNG")
-    return buf.getvalue()
+    binary = mask_ops.threshold(np.asarray(mask_L.convert("L")), 255)
+    return _encode_png(Image.fromarray(mask_ops.invert_to_alpha(binary), "RGBA"))
 
 def _clamp_to_mask_keep_outside(base_b64: str, gen_b64: str, mask_b64: str) -> str:
     """Hard guarantee: base outside mask + gen inside mask."""
@@ -279,22 +446,161 @@ def _lab_color_transfer(src_b64: str, ref_b64: str) -> str:
     ok, enc = cv2.imencode(".png", out)
     return base64.b64encode(enc.tobytes()).decode()
 
+def postprocess_edit(
+    base_rgb: np.ndarray,
+    gen_rgb: np.ndarray,
+    mask_l: Optional[np.ndarray] = None,
+    clamp: bool = True,
+    color_match: bool = True,
+    feather_px: float = 2.0,
+) -> np.ndarray:
+    """
+    Fused version of _lab_color_transfer + _clamp_to_mask_keep_outside on
+    already-decoded RGB arrays (no base64/PNG round-trips), float32 in place:
+      1) resize the edit to the base resolution
+      2) LAB mean/std transfer of the edit towards the base photo
+      3) blend into the base through the mask (WHITE=editable), feathered
+         inwards only, so pixels outside the mask stay exactly the base
+    Returns uint8 RGB at base resolution.
+    """
+    H, W = base_rgb.shape[:2]
+    if gen_rgb.shape[:2] != (H, W):
+        gen_rgb = cv2.resize(gen_rgb, (W, H), interpolation=cv2.INTER_CUBIC)
+
+    if color_match:
+        g = cv2.cvtColor(gen_rgb, cv2.COLOR_RGB2LAB).astype(np.float32)
+        r = cv2.cvtColor(base_rgb, cv2.COLOR_RGB2LAB)
+        g_m, g_s = cv2.meanStdDev(g)
+        r_m, r_s = cv2.meanStdDev(r)
+        g_s = np.where(g_s < 1e-6, 1.0, g_s)
+        r_s = np.where(r_s < 1e-6, 1.0, r_s)
+        g -= g_m.reshape(1, 1, 3).astype(np.float32)
+        g *= (r_s / g_s).reshape(1, 1, 3).astype(np.float32)
+        g += r_m.reshape(1, 1, 3).astype(np.float32)
+        np.clip(g, 0, 255, out=g)
+        gen_rgb = cv2.cvtColor(g.astype(np.uint8), cv2.COLOR_LAB2RGB)
+
+    if not clamp or mask_l is None:
+        return gen_rgb
+
+    m = mask_ops.threshold(mask_ops.resize_nearest(mask_l, W, H))
+    alpha = m.astype(np.float32)
+    if feather_px > 0:
+        alpha = cv2.GaussianBlur(alpha, (0, 0), feather_px)
+        alpha[m == 0] = 0.0  # feather inwards only: outside stays the base
+    alpha *= 1.0 / 255.0
+
+    out = gen_rgb.astype(np.float32)
+    base_f = base_rgb.astype(np.float32)
+    out -= base_f
+    out *= alpha[..., None]
+    out += base_f
+    np.rint(out, out=out)
+    return out.astype(np.uint8)
+
+
+def postprocess_edit_b64(
+    base: ImageContext,
+    gen_b64: str,
+    mask: Optional[ImageContext],
+    options: dict,
+) -> str:
+    """postprocess_edit for a pipeline stage; returns base64 PNG at base resolution."""
+    gen = ImageContext.from_b64(gen_b64)
+    out = postprocess_edit(
+        np.asarray(base.convert("RGB")),
+        np.asarray(gen.convert("RGB")),
+        np.asarray(mask.convert("L")) if mask is not None else None,
+        clamp=options.get("clamp", True),
+        color_match=options.get("color_match", True),
+        feather_px=options.get("feather_px", 2.0),
+    )
+    return base64.b64encode(encode_png(Image.fromarray(out, "RGB"))).decode("utf-8")
+
+
+_CUTOUT_CACHE: Optional[DiskCache] = None
+
+def _cutout_cache() -> DiskCache:
+    global _CUTOUT_CACHE
+    if _CUTOUT_CACHE is None:
+        _CUTOUT_CACHE = DiskCache("cutouts")
+    return _CUTOUT_CACHE
+
+def _alpha_cutout(ref_b64: Union[str, ImageContext], model: Optional[str] = None) -> Image.Image:
+    """
+    Background-removed RGBA cutout of a plant reference.
+    Cutouts are cached on disk by reference content + model, so a repeated
+    reference costs a file read instead of a U²-Net inference.
+    """
+    settings = get_settings()
+    model = model or settings.rembg_model
+    ref = ImageContext.ensure(ref_b64)
+    assert ref is not None
+
+    key = make_cache_key(ref=ref.sha256, model=model)
+    if settings.cutout_cache_enabled:
+        cached = _cutout_cache().get_bytes(key, ".png")
+        if cached is not None:
+            co = Image.open(io.BytesIO(cached))
+            co.load()
+            return co.convert("RGBA")
+
+    with get_rembg_pool().session(model) as session:
+        out = rembg_remove(np.asarray(ref.convert("RGB")), session=session)  # RGBA
+    co = Image.fromarray(np.asarray(out)).convert("RGBA")
+
+    if settings.cutout_cache_enabled:
+        try:
+            _cutout_cache().put_bytes(key, _encode_png(co), ".png")
+        except OSError as e:
+            print(f"[cutout_cache] write failed: {e}")
+    return co
 
+# Plant cutout scales are quantised so resized/blurred cutouts can be reused across placements
+_GUIDE_SCALE_STEPS = 8
 
 
-def _alpha_cutout(ref_b64: str) -> Image.Image:
-    im = _b64_to_pil(ref_b64).convert("RGB")
-    out = rembg_remove(np.array(im))  # RGBA
-    return Image.fromarray(np.asarray(out)).convert("RGBA")
+def _stratified_mask_samples(m: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Up to `count` (y, x) positions inside the mask, spread out: the mask's
+    bounding box is cut into ~count grid cells and one random masked pixel is
+    drawn per occupied cell, so placements cover the bed instead of clumping.
+    Irregular beds leave cells empty; those are topped up with further random
+    masked pixels. Fully vectorised.
+    """
+    H, W = m.shape
+    flat = np.flatnonzero(m == 255)
+    if flat.size == 0 or count <= 0:
+        return np.empty((0, 2), np.int64)
+
+    flat = rng.permutation(flat)
+    ys, xs = np.divmod(flat, W)
+    y0, x0 = ys.min(), xs.min()
+    bh, bw = ys.max() - y0 + 1, xs.max() - x0 + 1
+
+    g = max(1, int(np.ceil(np.sqrt(count))))
+    cells = ((ys - y0) * g // bh) * g + ((xs - x0) * g // bw)
+    _, first = np.unique(cells, return_index=True)  # first (random) pixel per occupied cell
+    picks = rng.permutation(first)[:count]
+    if picks.size < count:
+        rest = np.setdiff1d(np.arange(flat.size), first, assume_unique=True)  # still in random order
+        picks = np.concatenate([picks, rest[: count - picks.size]])
+    return np.stack([ys[picks], xs[picks]], axis=1)
+
 
 def build_plant_guide(
-    base_b64: str,
-    mask_b64: str,
-    plant_refs_b64: List[str],
+    base_b64: Union[str, ImageContext],
+    mask_b64: Union[str, ImageContext],
+    plant_refs_b64: List[Union[str, ImageContext]],
     density: int,
     alpha: int,
     scale_range=(0.7, 1.3),
+    seed: Optional[int] = None,
 ) -> str:
+    """
+    Composite semi-transparent cutouts of the plant references into the masked
+    bed (density placements, alpha-capped), as a rough layout for stage 1.
+    """
     base = _b64_to_pil(base_b64).convert("RGBA")
     W, H = base.size
     mL = _normalize_mask_L(mask_b64, W, H)
@@ -302,39 +608,48 @@ def build_plant_guide(
 
     cutouts = [_alpha_cutout(b) for b in plant_refs_b64 if b]
     if not cutouts:
-        return base64.b64encode(base.tobytes()).decode()
+        return _pil_to_b64_png(base)
 
-    ys, xs = np.where(m == 255)
-    if len(xs) == 0:
+    rng = np.random.default_rng(seed)
+    coords = _stratified_mask_samples(m, density, rng)
+    if len(coords) == 0:
         return _pil_to_b64_png(base)
 
-    coords = list(zip(ys, xs))
-    random.shuffle(coords)
-    step = max(1, len(coords) // max(1, density))
-    coords = coords[::step][:density]
+    # Summed-area table: mask coverage of any rectangle in O(1)
+    sat = cv2.integral((m == 255).astype(np.uint8))  # (H+1) x (W+1)
+    scales = np.linspace(scale_range[0], scale_range[1], _GUIDE_SCALE_STEPS)
+
+    # (cutout idx, scale idx) -> blurred, alpha-capped RGBA cutout
+    prepared: Dict[tuple, Image.Image] = {}
+
+    def cutout_for(ci: int, si: int, nw: int, nh: int) -> Image.Image:
+        if (ci, si) not in prepared:
+            co = cutouts[ci].resize((nw, nh), Image.Resampling.LANCZOS)
+            co = co.filter(ImageFilter.GaussianBlur(radius=0.6))
+            r, g, b, a = co.split()
+            a = Image.fromarray(mask_ops.cap(np.asarray(a), alpha), "L")
+            prepared[(ci, si)] = Image.merge("RGBA", (r, g, b, a))
+        return prepared[(ci, si)]
+
+    choices = rng.integers(0, len(cutouts), len(coords))
+    scale_idx = rng.integers(0, _GUIDE_SCALE_STEPS, len(coords))
 
     canvas = base.copy()
-    for (y, x) in coords:
-        co = random.choice(cutouts).copy()
-        s = random.uniform(*scale_range)
-        nw, nh = int(co.width * s), int(co.height * s)
+    for (y, x), ci, si in zip(coords, choices, scale_idx):
+        co = cutouts[ci]
+        nw, nh = int(co.width * scales[si]), int(co.height * scales[si])
         if nw < 32 or nh < 32:
             continue
-        co = co.resize((nw, nh), Image.Resampling.LANCZOS)
 
         bx, by = int(x - nw//2), int(y - nh//2)
         if bx < 0 or by < 0 or bx+nw > W or by+nh > H:
             continue
 
-        region = m[by:by+nh, bx:bx+nw]
-        if region.shape[:2] != (nh, nw) or (region == 255).mean() < 0.6:
+        covered = sat[by+nh, bx+nw] - sat[by, bx+nw] - sat[by+nh, bx] + sat[by, bx]
+        if covered < 0.6 * nw * nh:
             continue
 
-        co = co.filter(ImageFilter.GaussianBlur(radius=0.6))
-        r, g, b, a = co.split()
-        a = a.point(lambda v: min(alpha, v)) # type: ignore
-        co = Image.merge("RGBA", (r, g, b, a))
-        canvas.alpha_composite(co, (bx, by))
+        canvas.alpha_composite(cutout_for(int(ci), int(si), nw, nh), (bx, by))
 
     return _pil_to_b64_png(canvas)
 
@@ -374,6 +689,10 @@ def _open_as_base64(path_or_b64: str) -> str:
     if len(path_or_b64) > 500:
         return path_or_b64
 
+    # Uploaded-image handles are resolved later by ImageContext
+    if is_handle(path_or_b64):
+        return path_or_b64
+
     # If it's only letters/numbers/+/= it's probably base64
     import re
     b64_re = re.compile(r'^[A-Za-z0-9+/=\s]+$')
@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from core.config import get_settings
+
+
+def sha256_hex(data) -> str:
+    """sha256 of bytes or str (str is utf-8 encoded)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(**parts) -> str:
+    """Stable key from keyword parts (order-independent, JSON-serialisable values)."""
+    return sha256_hex(json.dumps(parts, sort_keys=True, separators=(",", ":")))
+
+
+class DiskCache:
+    """
+    Small content-addressed cache on local disk.
+    Entries live under <cache_dir>/<namespace>/<key[:2]>/<key><suffix>;
+    writes go through a temp file + rename so concurrent readers never see
+    partial files.
+    """
+
+    def __init__(self, namespace: str, root: Optional[str] = None):
+        self.root = Path(root or get_settings().cache_dir) / namespace
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str = "") -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def get_bytes(self, key: str, suffix: str = "") -> Optional[bytes]:
+        p = self.path_for(key, suffix)
+        try:
+            return p.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put_bytes(self, key: str, data: bytes, suffix: str = "") -> Path:
+        p = self.path_for(key, suffix)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return p
+
+    def get_json(self, key: str) -> Optional[Any]:
+        raw = self.get_bytes(key, ".json")
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def put_json(self, key: str, value: Any) -> Path:
+        return self.put_bytes(key, json.dumps(value).encode("utf-8"), ".json")
+
+    def touch(self, key: str, suffix: str = "") -> None:
+        """Mark an entry as recently used (prune evicts by mtime)."""
+        try:
+            os.utime(self.path_for(key, suffix))
+        except FileNotFoundError:
+            pass
+
+    def prune(self, max_bytes: Optional[int] = None, max_age: Optional[float] = None) -> int:
+        """
+        Drop entries older than max_age seconds, then least recently used ones
+        (oldest mtime first) until the namespace fits in max_bytes.
+        Returns the number of files removed.
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+        for p in self.root.glob("*/*"):
+            if p.name.startswith(".tmp_"):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            if max_age is not None and now - st.st_mtime > max_age:
+                removed += _unlink(p)
+            else:
+                entries.append((st.st_mtime, st.st_size, p))
+
+        if max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= max_bytes:
+                    break
+                removed += _unlink(p)
+                total -= size
+        return removed
+
+
+def _unlink(p: Path) -> int:
+    try:
+        p.unlink()
+        return 1
+    except FileNotFoundError:
+        return 0
+
+
+# name -> in-memory cache, so stats can be reported from one place
+_MEMORY_CACHES: Dict[str, "LRUCache"] = {}
+
+
+class LRUCache:
+    """
+    In-memory LRU bounded by an estimated byte size rather than entry count
+    (a handful of 4K masks is already hundreds of MB). Tracks hit/miss/eviction
+    counters; thread-safe so it can be used from executor threads.
+    """
+
+    def __init__(self, name: str, max_bytes: int, size_of: Callable[[Any], int]):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._size_of = size_of
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _MEMORY_CACHES[name] = self
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any) -> None:
+        size = self._size_of(value)
+        if size > self.max_bytes:
+            return  # would evict everything else for one entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def memory_cache_stats() -> Dict[str, dict]:
+    return {name: cache.stats() for name, cache in _MEMORY_CACHES.items()}
@@ -0,0 +1,79 @@
+"""
+Dedicated executor for CPU-bound image work (decode, morphology, composite, PNG encode).
+
+Image transforms used to run directly inside async handlers, so one large mask
+request stalled auth, canvas and project traffic on the same worker. They now
+run on a bounded thread pool: PIL and OpenCV release the GIL in their C loops,
+and threads can share ImageContexts and in-process caches without pickling
+multi-MB images across a process boundary.
+
+Admission is bounded (workers + queue). Request entry points use
+run_cpu_or_reject, which raises ExecutorSaturatedError when every slot is
+taken (controllers turn that into 503 so clients back off); work that is
+already part of a running pipeline uses run_cpu and waits for a slot rather
+than failing half-way through a generation.
+"""
+
+import os
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from core.config import get_settings
+
+T = TypeVar("T")
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when the CPU executor has no free slot; surfaced as 503."""
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def _workers() -> int:
+    return max(1, get_settings().cpu_executor_workers or os.cpu_count() or 1)
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix="cpu")
+    return _executor
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(_workers() + max(0, get_settings().cpu_executor_queue_size))
+    return _slots
+
+
+async def run_cpu(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking image function on the CPU executor and await the result,
+    waiting for a free slot if needed. Context variables are carried over.
+    """
+    async with _get_slots():
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(get_cpu_executor(), call)
+
+
+async def run_cpu_or_reject(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Like run_cpu, but raise ExecutorSaturatedError instead of waiting when full."""
+    if _get_slots().locked():
+        raise ExecutorSaturatedError("Image processing is saturated, try again shortly")
+    return await run_cpu(fn, *args, **kwargs)
+
+
+def shutdown_cpu_executor() -> None:
+    """Called from the app lifespan on shutdown."""
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
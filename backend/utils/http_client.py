@@ -0,0 +1,113 @@
+import sys
+import random
+import asyncio
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from core.config import get_settings
+
+# Status codes worth retrying: rate limited or upstream hiccup
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Non-idempotent (paid) calls: only retry when the request provably was not
+# processed. A 429 is rejected before any work; connect-phase errors mean the
+# body never reached the server. Read timeouts and 5xx after the body was sent
+# may still have produced (and billed) a result.
+NON_IDEMPOTENT_RETRY_STATUS_CODES = {429}
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Lazily create the process-wide async HTTP client used for OpenAI calls.
+    One pooled client keeps TLS sessions + keep-alive connections warm, so
+    concurrent generations on the same worker share connections instead of
+    paying a fresh handshake per request.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        settings = get_settings()
+        limits = httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_expiry,
+        )
+        # HTTP/2 needs the optional 'h2' package (httpx[http2])
+        http2 = settings.openai_http2 and importlib.util.find_spec("h2") is not None
+        _client = httpx.AsyncClient(
+            base_url=settings.openai_base_url,
+            limits=limits,
+            http2=http2,
+            timeout=httpx.Timeout(settings.openai_vision_timeout, connect=settings.openai_connect_timeout),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client (called from the app lifespan on shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def make_timeout(read_timeout: float) -> httpx.Timeout:
+    """Per-endpoint timeout: short connect, endpoint-specific read/write."""
+    return httpx.Timeout(read_timeout, connect=get_settings().openai_connect_timeout)
+
+
+def _retry_delay(attempt: int, resp: Optional[httpx.Response] = None) -> float:
+    """Exponential backoff with jitter; honour Retry-After when the server sends one."""
+    settings = get_settings()
+    if resp is not None:
+        retry_after = resp.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.openai_retry_backoff_max)
+            except ValueError:
+                pass
+    delay = settings.openai_retry_backoff_base * (2 ** attempt)
+    delay = min(delay, settings.openai_retry_backoff_max)
+    return delay * (0.5 + random.random() / 2)
+
+
+async def post_with_retry(
+    url: str,
+    *,
+    timeout: httpx.Timeout,
+    max_retries: Optional[int] = None,
+    idempotent: bool = True,
+    **kwargs,
+) -> httpx.Response:
+    """
+    POST through the shared client, retrying on 429/5xx and transport errors
+    with exponential backoff. Returns the last response (caller checks status).
+    idempotent=False (paid generations) only retries 429 and errors raised
+    before the request was sent, so a call is never billed twice.
+    """
+    client = get_http_client()
+    if max_retries is None:
+        max_retries = get_settings().openai_max_retries
+    retry_errors = (httpx.TransportError, httpx.TimeoutException) if idempotent else NOT_SENT_ERRORS
+    retry_status = RETRY_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRY_STATUS_CODES
+
+    attempt = 0
+    while True:
+        try:
+            resp = await client.post(url, timeout=timeout, **kwargs)
+        except retry_errors as e:
+            if attempt >= max_retries:
+                raise
+            delay = _retry_delay(attempt)
+            print(f"[http_client] {url} transport error ({e!r}), retry {attempt + 1}/{max_retries} in {delay:.1f}s", file=sys.stderr)
+        else:
+            if resp.status_code not in retry_status or attempt >= max_retries:
+                return resp
+            delay = _retry_delay(attempt, resp)
+            print(f"[http_client] {url} -> {resp.status_code}, retry {attempt + 1}/{max_retries} in {delay:.1f}s", file=sys.stderr)
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -0,0 +1,171 @@
+import io
+import base64
+import hashlib
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from utils.image_store import digest_of, get_image_bytes, is_handle
+
+
+def _clean_b64(b64_str: str) -> str:
+    """Strip an optional data URL prefix and whitespace, then fix padding."""
+    if b64_str.startswith("data:") and "," in b64_str:
+        b64_str = b64_str.split(",", 1)[1]
+    b64_str = "".join(b64_str.split())
+    missing_padding = len(b64_str) % 4
+    if missing_padding:
+        b64_str += "=" * (4 - missing_padding)
+    return b64_str
+
+
+class ImageContext:
+    """
+    Decode-once / encode-once holder for one image inside a request.
+
+    The pipeline used to bounce the same image between base64, PIL and numpy
+    several times per call. An ImageContext keeps whatever representation it
+    was built from and lazily derives (and caches) the others:
+      - raw_bytes / b64 / sha256 : source encoding (or a PNG encode when built from pixels)
+      - pil / convert(mode)      : decoded PIL image, one conversion per mode
+      - array(mode)              : read-only numpy view of convert(mode)
+      - cached(key, factory)     : any other derived encoding (e.g. OpenAI mask PNG)
+    Treat instances as immutable: derived values are never invalidated.
+    """
+
+    def __init__(
+        self,
+        *,
+        b64: Optional[str] = None,
+        raw_bytes: Optional[bytes] = None,
+        pil: Optional[Image.Image] = None,
+        encoder: Optional[Callable[[Image.Image], bytes]] = None,
+    ):
+        if b64 is None and raw_bytes is None and pil is None:
+            raise ValueError("ImageContext needs base64, bytes or a PIL image")
+        self._b64 = b64
+        self._raw = raw_bytes
+        self._pil = pil
+        self._encoder = encoder
+        self._converted: Dict[str, Image.Image] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._derived: Dict[Any, Any] = {}
+        self._sha256: Optional[str] = None
+
+    # ---------------------------
+    # Constructors
+    # ---------------------------
+    @classmethod
+    def from_b64(cls, b64_str: str) -> "ImageContext":
+        """Base64 (optionally a data URL) or an uploaded-image handle ("img:<sha256>")."""
+        if is_handle(b64_str):
+            ctx = cls(raw_bytes=get_image_bytes(b64_str))
+            ctx._sha256 = digest_of(b64_str)  # content-addressed: no need to re-hash
+            return ctx
+        return cls(b64=_clean_b64(b64_str))
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "ImageContext":
+        return cls(raw_bytes=raw)
+
+    @classmethod
+    def from_pil(cls, img: Image.Image, encoder: Optional[Callable[[Image.Image], bytes]] = None) -> "ImageContext":
+        """encoder (PIL -> PNG bytes) overrides the default PNG encode, e.g. 1-bit masks."""
+        return cls(pil=img, encoder=encoder)
+
+    @classmethod
+    def from_array(cls, arr: np.ndarray, mode: Optional[str] = None) -> "ImageContext":
+        ctx = cls(pil=Image.fromarray(arr, mode))
+        if mode:
+            view = arr.view()
+            view.flags.writeable = False
+            ctx._arrays[mode] = view
+        return ctx
+
+    @classmethod
+    def ensure(cls, value: Union[str, "ImageContext", None]) -> Optional["ImageContext"]:
+        """Accept a base64 string, an image handle or an existing context (None passes through)."""
+        if value is None or isinstance(value, ImageContext):
+            return value
+        if not value:
+            return None
+        return cls.from_b64(value)
+
+    # ---------------------------
+    # Encoded forms
+    # ---------------------------
+    @property
+    def raw_bytes(self) -> bytes:
+        if self._raw is None:
+            if self._b64 is not None:
+                self._raw = base64.b64decode(self._b64)
+            else:
+                self._raw = self.png_bytes
+        return self._raw
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.raw_bytes).decode("utf-8")
+        return self._b64
+
+    @property
+    def png_bytes(self) -> bytes:
+        """PNG encoding of the image (source bytes reused when they already are PNG)."""
+        def encode() -> bytes:
+            if self._pil is None and self.raw_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+                return self.raw_bytes
+            if self._encoder is not None:
+                return self._encoder(self.pil)
+            buf = io.BytesIO()
+            self.pil.save(buf, format="PNG")
+            return buf.getvalue()
+        return self.cached("png", encode)
+
+    @property
+    def png_b64(self) -> str:
+        return self.cached("png_b64", lambda: base64.b64encode(self.png_bytes).decode("utf-8"))
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.raw_bytes).hexdigest()
+        return self._sha256
+
+    # ---------------------------
+    # Decoded forms
+    # ---------------------------
+    @property
+    def pil(self) -> Image.Image:
+        if self._pil is None:
+            self._pil = Image.open(io.BytesIO(self.raw_bytes))
+            self._pil.load()
+        return self._pil
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._pil is None:
+            # Only parses the header; full decode stays lazy
+            with Image.open(io.BytesIO(self.raw_bytes)) as im:
+                return im.size
+        return self._pil.size
+
+    def convert(self, mode: str) -> Image.Image:
+        if self.pil.mode == mode:
+            return self.pil
+        if mode not in self._converted:
+            self._converted[mode] = self.pil.convert(mode)
+        return self._converted[mode]
+
+    def array(self, mode: str) -> np.ndarray:
+        if mode not in self._arrays:
+            arr = np.asarray(self.convert(mode))
+            arr.flags.writeable = False
+            self._arrays[mode] = arr
+        return self._arrays[mode]
+
+    def cached(self, key: Any, factory: Callable[[], Any]) -> Any:
+        if key not in self._derived:
+            self._derived[key] = factory()
+        return self._derived[key]
@@ -0,0 +1,58 @@
+"""
+Encoding policy for images leaving the pipeline.
+
+  encode_png(img, level)   : PNG with an explicit zlib level. Transient
+                             intermediates use png_compress_level (default 1):
+                             zlib's default 6 spends most of a 4K encode on
+                             a few percent of size
+  encode_mask_png(mask)    : binary masks as 1-bit PNG (8x fewer raw bytes
+                             to deflate than L, far fewer than RGBA); decodes
+                             back to 0/255 with .convert("L")
+  encode_preview(img, fmt) : previews as PNG, WebP or JPEG (preview_format)
+"""
+
+import io
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from core.config import get_settings
+
+PREVIEW_MIME = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def encode_png(img: Image.Image, level: Optional[int] = None) -> bytes:
+    if level is None:
+        level = get_settings().png_compress_level
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=level)
+    return buf.getvalue()
+
+
+def encode_mask_png(mask: Union[Image.Image, np.ndarray], level: Optional[int] = None) -> bytes:
+    """1-bit PNG for {0,255} masks; anything non-binary falls back to 8-bit L."""
+    arr = np.asarray(mask.convert("L") if isinstance(mask, Image.Image) else mask)
+    if np.any((arr != 0) & (arr != 255)):
+        return encode_png(Image.fromarray(arr, "L"), level)
+    return encode_png(Image.fromarray(arr > 0).convert("1"), level)
+
+
+def encode_preview(img: Image.Image, fmt: Optional[str] = None, quality: Optional[int] = None) -> Tuple[bytes, str]:
+    """Returns (bytes, mime). JPEG drops alpha; WebP/JPEG honour preview_quality."""
+    settings = get_settings()
+    fmt = (fmt or settings.preview_format).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in PREVIEW_MIME:
+        raise ValueError(f"Unsupported preview format: {fmt}")
+    quality = quality or settings.preview_quality
+
+    if fmt == "png":
+        return encode_png(img), PREVIEW_MIME[fmt]
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        img.convert("RGB").save(buf, format="JPEG", quality=quality)
+    else:
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    return buf.getvalue(), PREVIEW_MIME[fmt]
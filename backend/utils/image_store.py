@@ -0,0 +1,84 @@
+import io
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from utils.cache_helper import DiskCache, sha256_hex
+
+# Handles look like "img:<sha256 of the raw file bytes>" and can be sent in any
+# AI request field that otherwise takes base64.
+HANDLE_PREFIX = "img:"
+
+
+class ImageNotFoundError(ValueError):
+    """A handle was sent for an image that is not (or no longer) in the store."""
+
+
+class ImageTooLargeError(ValueError):
+    """Upload exceeds settings.image_upload_max_bytes; surfaced as 413."""
+
+
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def is_digest(value: str) -> bool:
+    """Only lowercase sha256 hex ever reaches a path (no traversal via crafted handles)."""
+    return isinstance(value, str) and _DIGEST_RE.fullmatch(value) is not None
+
+
+def is_handle(value: Optional[str]) -> bool:
+    return isinstance(value, str) and value.startswith(HANDLE_PREFIX) and is_digest(value[len(HANDLE_PREFIX):])
+
+
+def digest_of(handle: str) -> str:
+    return handle[len(HANDLE_PREFIX):]
+
+
+_STORE: Optional[DiskCache] = None
+
+
+def _store() -> DiskCache:
+    global _STORE
+    if _STORE is None:
+        _STORE = DiskCache("images")
+    return _STORE
+
+
+def put_image(raw: bytes) -> Tuple[str, Tuple[int, int]]:
+    """
+    Store an uploaded image by content hash; returns (handle, (width, height)).
+    Identical uploads map to the same file, so re-uploading is a no-op.
+    Raises ValueError for data PIL cannot identify as an image.
+    """
+    try:
+        with Image.open(io.BytesIO(raw)) as im:
+            size = im.size
+    except Exception as e:
+        raise ValueError(f"Not a valid image: {e}")
+
+    digest = sha256_hex(raw)
+    if not _store().path_for(digest, ".bin").exists():
+        _store().put_bytes(digest, raw, ".bin")
+    return HANDLE_PREFIX + digest, size
+
+
+def has_image(digest: str) -> bool:
+    return is_digest(digest) and _store().path_for(digest, ".bin").exists()
+
+
+def get_image_bytes(handle: str) -> bytes:
+    if not is_handle(handle):
+        raise ImageNotFoundError(f"Invalid image handle {handle[:80]!r}")
+    raw = _store().get_bytes(digest_of(handle), ".bin")
+    if raw is None:
+        raise ImageNotFoundError(f"Unknown image handle {handle}; upload it again via /ai/images")
+    return raw
+
+
+def image_file(digest: str) -> Path:
+    """Path of a stored image (served on /ai/images/{sha256}/file)."""
+    if not has_image(digest):
+        raise ImageNotFoundError(f"Unknown image {digest}")
+    return _store().path_for(digest, ".bin")
@@ -0,0 +1,101 @@
+"""
+Vectorized mask operations on uint8 numpy arrays (WHITE=255 editable, BLACK=0 keep).
+
+These replace the `Image.point(lambda v: ...)` / PIL<->numpy round-trips that
+the mask pipeline used to do several times per request. Every op here is
+bit-exact with the PIL expression it replaces (tests/test_mask_ops.py):
+
+    threshold(a, 128)               == Image.point(lambda v: 255 if v >= 128 else 0)
+    threshold(a, 17)                == Image.point(lambda v: 255 if v > 16 else 0)
+    cap(a, alpha)                   == Image.point(lambda v: min(alpha, v))
+    resize_nearest(a, w, h)         == Image.resize((w, h), Image.Resampling.NEAREST)
+    feather(a, r)                   == Image.filter(ImageFilter.GaussianBlur(radius=r))
+    invert_to_alpha(binary)         == np.where(arr == 255, 0, 255) in the alpha channel
+"""
+
+import numpy as np
+import cv2
+from PIL import Image, ImageFilter
+
+
+def _as_u8(arr: np.ndarray) -> np.ndarray:
+    return arr if arr.dtype == np.uint8 else arr.astype(np.uint8)
+
+
+def threshold(arr: np.ndarray, at_least: int = 128) -> np.ndarray:
+    """Binarize: 255 where v >= at_least else 0 (cv2 THRESH_BINARY is strict '>')."""
+    if at_least <= 0:
+        return np.full_like(_as_u8(arr), 255)
+    _, out = cv2.threshold(_as_u8(arr), at_least - 1, 255, cv2.THRESH_BINARY)
+    return out
+
+
+def cap(arr: np.ndarray, max_value: int) -> np.ndarray:
+    """Clamp values to at most max_value (e.g. cap alpha opacity)."""
+    return np.minimum(_as_u8(arr), np.uint8(max(0, min(255, max_value))))
+
+
+def apply_lut(arr: np.ndarray, fn) -> np.ndarray:
+    """Generic 8-bit point op through a 256-entry lookup table (cv2.LUT)."""
+    lut = np.array([fn(v) for v in range(256)], dtype=np.uint8)
+    return cv2.LUT(_as_u8(arr), lut)
+
+
+def resize_nearest(arr: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Nearest-neighbour resize; INTER_NEAREST_EXACT samples pixel centres like PIL."""
+    if arr.shape[1] == width and arr.shape[0] == height:
+        return arr
+    return cv2.resize(arr, (width, height), interpolation=cv2.INTER_NEAREST_EXACT)
+
+
+def upscale_binary(arr: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Upsample a {0,255} mask with bilinear interpolation + re-threshold (smooth edges, still binary)."""
+    if arr.shape[1] == width and arr.shape[0] == height:
+        return arr
+    return threshold(cv2.resize(_as_u8(arr), (width, height), interpolation=cv2.INTER_LINEAR), 128)
+
+
+def downscale_binary(arr: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Downsample a {0,255} mask by area averaging + re-threshold (a pixel stays set when mostly covered)."""
+    if arr.shape[1] == width and arr.shape[0] == height:
+        return arr
+    return threshold(cv2.resize(_as_u8(arr), (width, height), interpolation=cv2.INTER_AREA), 128)
+
+
+def feather(arr: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Gaussian feather. Uses PIL's C box-approximated GaussianBlur so results stay
+    identical to the previous pipeline (cv2.GaussianBlur uses a true Gaussian
+    kernel and would shift edge pixels by one or two levels).
+    """
+    if radius <= 0:
+        return arr
+    return np.asarray(Image.fromarray(_as_u8(arr), "L").filter(ImageFilter.GaussianBlur(radius=radius)))
+
+
+def dilate(arr: np.ndarray, size: int = 3, shape: int = cv2.MORPH_ELLIPSE, iterations: int = 1) -> np.ndarray:
+    kernel = cv2.getStructuringElement(shape, (size, size))
+    return cv2.dilate(arr, kernel, iterations=iterations)
+
+
+def erode(arr: np.ndarray, size: int = 3, shape: int = cv2.MORPH_ELLIPSE, iterations: int = 1) -> np.ndarray:
+    kernel = cv2.getStructuringElement(shape, (size, size))
+    return cv2.erode(arr, kernel, iterations=iterations)
+
+
+def invert_to_alpha(binary: np.ndarray) -> np.ndarray:
+    """
+    WHITE=editable binary mask -> RGBA array for OpenAI Images Edit
+    (transparent = editable, opaque = keep, RGB all zero).
+    Expects a {0,255} mask (run threshold() first).
+    """
+    h, w = binary.shape[:2]
+    rgba = np.zeros((h, w, 4), np.uint8)
+    rgba[..., 3] = cv2.bitwise_not(_as_u8(binary))
+    return rgba
+
+
+def to_binary_L(img: Image.Image, width: int, height: int, at_least: int = 128) -> np.ndarray:
+    """PIL image -> L -> exact (width, height) -> {0,255} array in one pass."""
+    arr = np.asarray(img.convert("L"))
+    return threshold(resize_nearest(arr, width, height), at_least)
@@ -0,0 +1,271 @@
+"""
+Process-wide governor for upstream model APIs (OpenAI image/vision, Gemini, Veo).
+
+Every provider:model pair gets one Governor combining
+  - a concurrency cap (calls in flight), and
+  - a token bucket (requests per minute, refilled continuously, with a burst),
+configured in settings.upstream_limits ("openai:gpt-image-1", ..., with
+"<provider>:*" as the fallback). A call that cannot start right away queues
+until a slot frees or its deadline (upstream_queue_timeout) passes, then fails
+fast with UpstreamBusyError (503) instead of piling onto the provider and
+coming back as a 429 after minutes of retries.
+
+The queue is fair per user: waiters are grouped by current_user_id and slots
+are handed out round-robin across users, so one user's variant fan-out cannot
+starve everybody else. Governors work from async code (`async with gov.slot()`)
+and from worker threads (`with gov.slot_sync()`); queue depth, in-flight count
+and wait times are exposed through upstream_stats() on /ai/upstream/stats.
+"""
+
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+from core.config import get_settings
+
+# Set per request (auth dependency) and per background job; used for fair sharing
+current_user_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_user_id", default=None)
+
+ANONYMOUS = "anonymous"
+
+
+def set_current_user(user_id: Optional[str]) -> contextvars.Token:
+    return current_user_id.set(user_id)
+
+
+def reset_current_user(token: contextvars.Token) -> None:
+    current_user_id.reset(token)
+
+
+class UpstreamBusyError(Exception):
+    """No upstream slot became free before the caller's deadline; surfaced as 503."""
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    __slots__ = ("user", "enqueued", "granted", "loop", "future", "event")
+
+    def __init__(self, user: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.user = user
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)  # type: ignore[union-attr]
+        except RuntimeError:
+            pass  # loop already closed (shutdown)
+
+
+class Governor:
+    def __init__(self, name: str, concurrency: int, rpm: float = 0.0, burst: Optional[int] = None):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.rpm = float(rpm or 0.0)
+        self._rate = self.rpm / 60.0  # tokens per second (0 = no rate limit)
+        self._capacity = float(burst or self.concurrency)
+        self._tokens = self._capacity
+        self._refilled = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queued = 0
+        self._in_flight = 0
+
+        self._granted = 0
+        self._timeouts = 0
+        self._max_queued = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # ---------------------------
+    # Internals (lock held)
+    # ---------------------------
+    def _refill(self, now: float) -> None:
+        if self._rate:
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self._rate)
+        self._refilled = now
+
+    def _next_token_in(self) -> Optional[float]:
+        """Seconds until the bucket can pay for another call; None when it already can."""
+        if not self._rate or self._tokens >= 1:
+            return None
+        return (1 - self._tokens) / self._rate
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        while self._queues and self._in_flight < self.concurrency and (not self._rate or self._tokens >= 1):
+            # round-robin across users: serve the head user, then move it to the back
+            user, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self._queued -= 1
+            self._in_flight += 1
+            if self._rate:
+                self._tokens -= 1
+
+            waited = now - waiter.enqueued
+            self._granted += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            waiter.granted = True
+            waiter.wake()
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            self._queues.setdefault(waiter.user, deque()).append(waiter)
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+            self._dispatch()
+
+    def _poll(self, waiter: _Waiter) -> Tuple[bool, Optional[float]]:
+        with self._lock:
+            if not waiter.granted:
+                self._dispatch()
+            return waiter.granted, self._next_token_in()
+
+    def _abandon(self, waiter: _Waiter, timed_out: bool) -> bool:
+        """Leave the queue; returns True if the slot was granted in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiters = self._queues.get(waiter.user)
+            if waiters is not None:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._queues[waiter.user]
+            self._queued -= 1
+            if timed_out:
+                self._timeouts += 1
+            return False
+
+    def _deadline(self, timeout: Optional[float]) -> float:
+        if timeout is None:
+            timeout = get_settings().upstream_queue_timeout
+        return time.monotonic() + max(0.0, timeout)
+
+    def _busy(self) -> UpstreamBusyError:
+        return UpstreamBusyError(f"{self.name} is at capacity, try again shortly")
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        deadline = self._deadline(timeout)
+        waiter = _Waiter(current_user_id.get() or ANONYMOUS, asyncio.get_running_loop())
+        self._enqueue(waiter)
+        try:
+            while True:
+                granted, token_eta = self._poll(waiter)
+                if granted:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if self._abandon(waiter, timed_out=True):
+                        return
+                    raise self._busy()
+                # released slots wake us; an empty bucket needs a re-poll once it refills
+                wait = min(remaining, token_eta) if token_eta is not None else remaining
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), wait)  # type: ignore[arg-type]
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            if self._abandon(waiter, timed_out=False):
+                self.release()
+            raise
+
+    def acquire_sync(self, timeout: Optional[float] = None) -> None:
+        """Blocking acquire for worker threads; never call from the event loop thread."""
+        deadline = self._deadline(timeout)
+        waiter = _Waiter(current_user_id.get() or ANONYMOUS)
+        self._enqueue(waiter)
+        while True:
+            granted, token_eta = self._poll(waiter)
+            if granted:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if self._abandon(waiter, timed_out=True):
+                    return
+                raise self._busy()
+            waiter.event.wait(min(remaining, token_eta) if token_eta is not None else remaining)  # type: ignore[union-attr]
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        await self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def slot_sync(self, timeout: Optional[float] = None) -> Iterator[None]:
+        self.acquire_sync(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "concurrency": self.concurrency,
+                "rpm": self.rpm,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "waiting_users": len(self._queues),
+                "max_queued": self._max_queued,
+                "tokens": round(self._tokens, 2) if self._rate else None,
+                "granted": self._granted,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(1000 * self._wait_total / self._granted, 1) if self._granted else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 1),
+            }
+
+
+_governors: Dict[str, Governor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(provider: str, model: str) -> Governor:
+    """Shared governor for provider:model, created from settings.upstream_limits on first use."""
+    key = f"{provider}:{model}"
+    with _governors_lock:
+        gov = _governors.get(key)
+        if gov is None:
+            limits = get_settings().upstream_limits
+            conf = limits.get(key) or limits.get(f"{provider}:*") or {}
+            gov = Governor(key, conf.get("concurrency", 4), conf.get("rpm", 0), conf.get("burst"))
+            _governors[key] = gov
+        return gov
+
+
+def upstream_stats() -> dict:
+    with _governors_lock:
+        governors = dict(_governors)
+    return {key: gov.stats() for key, gov in sorted(governors.items())}
@@ -0,0 +1,71 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from rembg import new_session
+
+from core.config import get_settings
+
+
+class RembgSessionPool:
+    """
+    Process-wide pool of rembg (ONNX) sessions, one queue per model.
+
+    Loading U²-Net takes seconds and a few hundred MB, so sessions are created
+    lazily – only when every existing one is busy – and never more than
+    `size` per model (defaults to the CPU count). Callers borrow a session with
+    `with pool.session() as s: rembg_remove(img, session=s)`.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = max(1, size or os.cpu_count() or 1)
+        self._idle: Dict[str, "queue.Queue"] = {}
+        self._created: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, model: Optional[str] = None) -> Iterator[object]:
+        model = model or get_settings().rembg_model
+        sess = self._acquire(model)
+        try:
+            yield sess
+        finally:
+            self._idle[model].put(sess)
+
+    def _acquire(self, model: str):
+        with self._lock:
+            idle = self._idle.setdefault(model, queue.Queue())
+            try:
+                return idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._created.get(model, 0) < self.size:
+                # reserve the slot under the lock, load outside it
+                self._created[model] = self._created.get(model, 0) + 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                print(f"[rembg] loading session '{model}' ({self._created[model]}/{self.size})")
+                return new_session(model)
+            except Exception:
+                with self._lock:
+                    self._created[model] -= 1
+                raise
+        # pool exhausted: wait for a session to come back
+        return idle.get()
+
+
+_pool: Optional[RembgSessionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_rembg_pool() -> RembgSessionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RembgSessionPool(get_settings().rembg_pool_size or None)
+        return _pool
@@ -0,0 +1,71 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from fastapi.staticfiles import StaticFiles
+
+from core.config import get_settings
+from utils.cache_helper import sha256_hex
+
+# Generated videos live in settings.video_storage_dir as <sha256>.mp4 and are
+# served from here (server.py, under app_base_path like the API routes), so
+# responses carry a URL instead of tens of MB of base64.
+VIDEO_URL_PREFIX = "/videos"
+
+
+def video_dir() -> Path:
+    directory = Path(get_settings().video_storage_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def put_video(data: bytes, suffix: str = ".mp4") -> str:
+    """
+    Store a video by content hash and return its filename. Writes go through a
+    temp file + rename, and an identical video already on disk is left as is.
+    """
+    filename = f"{sha256_hex(data)}{suffix}"
+    directory = video_dir()
+    path = directory / filename
+    if path.exists():
+        return filename
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return filename
+
+
+def video_path(filename: str) -> Path:
+    return Path(get_settings().video_storage_dir) / filename
+
+
+def video_url(filename: Optional[str]) -> Optional[str]:
+    """
+    URL of a stored video. Absolute when settings.public_base_url is set;
+    otherwise relative to the API base URL, like the status_url fields, and
+    the client prefixes its API base.
+    """
+    if not filename:
+        return None
+    base = get_settings().public_base_url.rstrip("/")
+    return f"{base}{VIDEO_URL_PREFIX}/{filename}"
+
+
+class VideoStaticFiles(StaticFiles):
+    """
+    StaticFiles already answers Range requests (seeking) and ETag /
+    If-None-Match; filenames are content hashes, so the files can also be
+    cached forever.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", "public, max-age=31536000, immutable")
+        return response
@@ -0,0 +1,90 @@
+"""
+Outbound job webhooks.
+
+webhook_url comes from the user, so it is treated as untrusted: https only,
+optionally restricted to settings.webhook_allowed_hosts, and the host must
+resolve to public addresses only (no loopback, private, link-local/metadata
+or reserved ranges). Calls use their own short-lived client (no redirects,
+short timeout) rather than the pooled OpenAI client and its retry rules.
+"""
+
+import asyncio
+import ipaddress
+import socket
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.config import get_settings
+
+
+class WebhookURLError(ValueError):
+    """webhook_url is not allowed; surfaced as 400 on submit."""
+
+
+def _host_allowed(host: str) -> bool:
+    allowed = get_settings().webhook_allowed_hosts
+    if not allowed:
+        return True
+    return any(host == entry or host.endswith("." + entry) for entry in allowed)
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def validate_webhook_url(url: str) -> str:
+    """Static checks (scheme, host, allowlist, literal IPs); returns the host."""
+    parts = urlsplit(url)
+    if parts.scheme != "https":
+        raise WebhookURLError("webhook_url must use https")
+    host = (parts.hostname or "").lower()
+    if not host:
+        raise WebhookURLError("webhook_url has no host")
+    if parts.username or parts.password:
+        raise WebhookURLError("webhook_url must not contain credentials")
+    if not _host_allowed(host):
+        raise WebhookURLError(f"webhook host {host} is not allowed")
+    try:
+        literal = ipaddress.ip_address(host)
+    except ValueError:
+        literal = None
+    if literal is not None and not _is_public(host):
+        raise WebhookURLError("webhook_url must not point at a private address")
+    return host
+
+
+async def _check_resolves_public(host: str, port: int) -> None:
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    addresses = {info[4][0] for info in infos}
+    if not addresses or not all(_is_public(a) for a in addresses):
+        raise WebhookURLError(f"webhook host {host} resolves to a private address")
+
+
+async def send_webhook(url: str, payload: dict) -> Optional[int]:
+    """
+    POST payload to url; retries transport errors, 429 and 5xx a few times
+    with a short backoff. Returns the final status code (None if never sent).
+    """
+    settings = get_settings()
+    host = validate_webhook_url(url)
+    # resolved at send time as well: DNS may have changed since submit
+    await _check_resolves_public(host, urlsplit(url).port or 443)
+
+    attempts = max(1, settings.webhook_max_attempts)
+    status_code = None
+    async with httpx.AsyncClient(timeout=settings.webhook_timeout, follow_redirects=False) as client:
+        for attempt in range(attempts):
+            try:
+                resp = await client.post(url, json=payload)
+                status_code = resp.status_code
+                if status_code != 429 and status_code < 500:
+                    return status_code
+            except httpx.TransportError as e:
+                print(f"[webhook] {host} attempt {attempt + 1}/{attempts} failed: {e!r}")
+            if attempt + 1 < attempts:
+                await asyncio.sleep(2 ** attempt)
+    return status_code
@@ -2,8 +2,19 @@ import axios from "axios";
 import { store } from "@/store/store";
 import { hideGlobalLoader, showGlobalLoader } from "@/store/slices/globalLoaderSlice";
 
+const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || "";
+
+// Server-relative URLs the API hands back (e.g. /videos/<sha>.mp4) live on the
+// API origin, not the SPA's, so prefix them the same way axios does.
+export const resolveApiUrl = (url) => {
+    if (!url || /^(https?:|data:|blob:)/.test(url)) {
+        return url;
+    }
+    return `${API_BASE_URL.replace(/\/$/, "")}${url}`;
+};
+
 export const axiosInstance = axios.create({
-    baseURL: import.meta.env.VITE_API_BASE_URL,
+    baseURL: API_BASE_URL,
     headers: {
         "Content-Type": "application/json"
     }  
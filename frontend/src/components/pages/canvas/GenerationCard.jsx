@@ -416,7 +416,7 @@ export class GenerationCardShapeUtil extends ShapeUtil {
         createVideoCardAsShapes(editor, {
           position: { x: newX, y: newY },
           generationNumber: generationNumber,
-          videoUrl: result.video_data,  // Use video_data (base64 data URI) directly
+          videoUrl: result.video_url,  // absolute URL on the API origin, streamed with Range requests
           originalData: shape.props.originalData,
           sourceGenerationId: shape.id,
         })
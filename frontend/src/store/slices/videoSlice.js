@@ -1,5 +1,6 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
 import videoAPI from '@/api/videoAPI';
+import { resolveApiUrl } from '@/api/axiosInstance';
 
 export const generateVideo = createAsyncThunk(
   'video/generateVideo',
@@ -7,16 +8,16 @@ export const generateVideo = createAsyncThunk(
     try {
       const response = await videoAPI.generateVideo(payload);
 
-      const videoData = response.data.video_data;
+      const videoUrl = response.data.video_url;
 
-      if (!videoData || typeof videoData !== 'string' || videoData.length < 50) {
-        throw new Error('API returned empty or invalid video data.');
+      if (!videoUrl || typeof videoUrl !== 'string') {
+        throw new Error('API returned empty or invalid video URL.');
       }
 
-      console.log("Video generated successfully - base64 length:", videoData.length);
+      console.log("Video generated successfully:", videoUrl);
 
       return {
-        video_data: videoData
+        video_url: resolveApiUrl(videoUrl)
       };
 
     } catch (error) {